@@ -0,0 +1,219 @@
+import heapq
+import json
+import math
+import threading
+import time
+from itertools import count
+from metrics import Counter, Gauge, Histogram
+
+# Priority classes, lower is served first
+CONTROL = 0  # heartbeats, replication and metrics: never queued, shed or rate limited
+INTERACTIVE = 1  # reads and dashboard calls
+BULK = 2  # uploads and other writes
+CLASS_NAMES = {CONTROL: "control", INTERACTIVE: "interactive", BULK: "bulk"}
+MAX_DRAIN_BYTES = 64 * 1024  # bodies up to this size are read past on refusal so the connection stays open
+
+ADMISSION_REJECTED = Counter("gfs_admission_rejected_total", "Requests refused with 429", ["class", "reason"])
+ADMISSION_WAIT = Histogram("gfs_admission_wait_seconds", "Time admitted requests waited for a worker", ["class"])
+
+class RateLimiter:
+    """Token bucket per client key, refilled at rate requests/sec up to burst"""
+
+    def __init__(self, rate, burst, idle_timeout=300):
+        self.rate = rate  # 0 disables limiting
+        self.burst = max(burst, 1)
+        self.idle_timeout = idle_timeout
+        self._buckets = {}  # key -> [tokens, time of the last refill]
+        self._last_prune = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    def acquire(self, key):
+        """Take a token for key, returns 0 or the seconds until one is available"""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.burst, now]
+            else:
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if now - self._last_prune > self.idle_timeout:
+                # A client idle this long has a full bucket, forgetting it changes nothing
+                self._buckets = {k: b for k, b in self._buckets.items() if now - b[1] < self.idle_timeout}
+                self._last_prune = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0
+            return (1 - bucket[0]) / self.rate
+
+class AdmissionController:
+    """Lets at most `workers` requests run at once, the rest wait by priority class.
+
+    BULK requests hold at most bulk_share of the workers, the rest stay free
+    for interactive ones. A request that finds max_queue requests of its class
+    already waiting, or that waits longer than queue_timeout, is shed so the
+    caller backs off instead of piling up threads. CONTROL requests are never
+    queued.
+    """
+
+    def __init__(self, workers, max_queue, queue_timeout=10, bulk_share=0.5):
+        self.workers = workers  # 0 disables admission control
+        self.bulk_workers = max(1, int(workers * bulk_share))
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.running = 0
+        self.bulk_running = 0
+        self._waiting = []  # heap of [priority, seq, event, state], state None once abandoned
+        self._queued = {priority: 0 for priority in CLASS_NAMES}
+        self._service_time = 0.01  # EWMA of handling time, for Retry-After
+        self._seq = count()
+        self._lock = threading.Lock()
+        Gauge("gfs_admission_queued", "Requests waiting for a worker", ["class"],
+              callback=lambda: {(CLASS_NAMES[p],): n for p, n in self._queued.items() if p != CONTROL})
+        Gauge("gfs_admission_running", "Requests holding a worker", callback=lambda: self.running)
+
+    @property
+    def enabled(self):
+        return self.workers > 0
+
+    def _has_room(self, priority):
+        return self.running < self.workers and (priority != BULK or self.bulk_running < self.bulk_workers)
+
+    def _start(self, priority):
+        self.running += 1
+        if priority == BULK:
+            self.bulk_running += 1
+
+    def acquire(self, priority):
+        """Wait for a worker, False if the request is shed"""
+        with self._lock:
+            ahead = sum(n for p, n in self._queued.items() if p <= priority)
+            if not ahead and self._has_room(priority):
+                self._start(priority)
+                return True
+            if self._queued[priority] >= self.max_queue:
+                return False
+            entry = [priority, next(self._seq), threading.Event(), False]
+            heapq.heappush(self._waiting, entry)
+            self._queued[priority] += 1
+
+        if entry[2].wait(self.queue_timeout):
+            return True
+        with self._lock:
+            if entry[3]:
+                return True  # handed a worker as the wait timed out
+            entry[3] = None
+            self._queued[priority] -= 1
+            return False
+
+    def release(self, priority, elapsed):
+        """Free a worker, handing it to the highest priority waiting request that may run"""
+        with self._lock:
+            self._service_time += 0.1 * (elapsed - self._service_time)
+            self.running -= 1
+            if priority == BULK:
+                self.bulk_running -= 1
+            while self._waiting:
+                entry = self._waiting[0]
+                if entry[3] is None:
+                    heapq.heappop(self._waiting)
+                    continue
+                # Only bulk requests are left and they are at their share
+                if not self._has_room(entry[0]):
+                    return
+                heapq.heappop(self._waiting)
+                entry[3] = True
+                self._queued[entry[0]] -= 1
+                self._start(entry[0])
+                entry[2].set()
+                return
+
+    def retry_after(self, priority):
+        """Seconds until the queue in front of a new request of this class should have drained"""
+        with self._lock:
+            ahead = sum(n for p, n in self._queued.items() if p <= priority)
+            return self._service_time * (ahead + 1) / self.workers
+
+class AdmissionMixin:
+    """Passes each request of a BaseHTTPRequestHandler through rate limiting and admission control.
+
+    Subclasses set `admission` and `rate_limiter` and map routes to priority
+    classes in `request_classes` (exact routes, entries ending in "/" match as
+    prefixes); other routes are `default_class`. Refused requests get a 429
+    with Retry-After; the connection is closed unless the body was small
+    enough to skip.
+    """
+    admission = None
+    rate_limiter = None
+    request_classes = {}
+    default_class = INTERACTIVE
+    _admitted_at = None
+    _admitted_class = None
+
+    def handle_one_request(self):
+        self._admitted_at = None
+        try:
+            super().handle_one_request()
+        finally:
+            if self._admitted_at is not None:
+                self.admission.release(self._admitted_class, time.perf_counter() - self._admitted_at)
+                self._admitted_at = None
+
+    def parse_request(self):
+        if not super().parse_request():
+            return False
+        priority = self._request_class(self.path.split("?", 1)[0])
+        if priority == CONTROL or self.command == "OPTIONS":
+            return True
+
+        if self.rate_limiter is not None and self.rate_limiter.enabled:
+            wait = self.rate_limiter.acquire(self._client_key())
+            if wait:
+                self._reject(priority, "rate_limited", wait)
+                return False
+
+        if self.admission is None or not self.admission.enabled:
+            return True
+        start = time.perf_counter()
+        if not self.admission.acquire(priority):
+            self._reject(priority, "overloaded", self.admission.retry_after(priority))
+            return False
+        self._admitted_at = time.perf_counter()
+        self._admitted_class = priority
+        ADMISSION_WAIT.observe(self._admitted_at - start, (CLASS_NAMES[priority],))
+        return True
+
+    def _request_class(self, path):
+        priority = self.request_classes.get(path)
+        if priority is not None:
+            return priority
+        for route, priority in self.request_classes.items():
+            if route.endswith("/") and path.startswith(route):
+                return priority
+        return self.default_class
+
+    def _client_key(self):
+        """Whose token bucket a request draws from"""
+        return f"addr:{self.client_address[0]}"
+
+    def _reject(self, priority, reason, retry_after):
+        ADMISSION_REJECTED.inc((CLASS_NAMES[priority], reason))
+        body = json.dumps({"error": "Too many requests", "reason": reason}).encode()
+        length = self.headers.get("Content-Length", "0")
+        if length.isdigit() and int(length) <= MAX_DRAIN_BYTES:
+            self.rfile.read(int(length))
+        else:
+            self.close_connection = True
+        self.send_response(429)
+        self.send_header("Content-type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Retry-After", str(max(1, math.ceil(retry_after))))
+        self.send_header("Access-Control-Allow-Origin", "*")
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(body)
@@ -4,22 +4,60 @@ import sys
 import time
 import threading
 import base64
+import hashlib
+import http.client
+import socketserver
 from http.server import HTTPServer, BaseHTTPRequestHandler
 import urllib.request
 import urllib.error
+from urllib.parse import urlparse, parse_qs, urlencode
+from metrics import Counter, Gauge, Histogram, InstrumentedHandlerMixin
+from admission import BULK, CONTROL, AdmissionController, AdmissionMixin, RateLimiter
+from chunk_store import ExtentStore, open_store
 
-MASTER_URL = "http://master:8000"
-HEARTBEAT_INTERVAL = 5  
-DATA_DIR = "/data/chunks"
+MASTER_URL = os.environ.get("MASTER_URL", "http://master:8000")
+HEARTBEAT_INTERVAL = float(os.environ.get("HEARTBEAT_INTERVAL", "5"))
+KEEPALIVE_TIMEOUT = 30  # seconds an idle persistent connection is kept open
+CHUNK_REPORT_EVERY = 12  # heartbeats between full chunk reports to the master
+STREAM_BUFFER = 256 * 1024  # bytes copied at a time from a raw chunk upload to disk
+DATA_DIR = os.environ.get("DATA_DIR", "/data/chunks")
+CATEGORIES = ['text', 'images', 'documents', 'other']
+STORAGE_ENGINE = os.environ.get("STORAGE_ENGINE", "files")  # "files": a file per chunk, "extents": shared extent files
+DURABILITY = os.environ.get("DURABILITY", "none")  # when writes are acknowledged: none, group (batched fsync) or sync
+GROUP_COMMIT_MS = float(os.environ.get("GROUP_COMMIT_MS", "0"))  # least time between group commits, 0: back to back
+EXTENT_SIZE = int(os.environ.get("EXTENT_SIZE", str(64 * 1024 * 1024)))  # bytes preallocated per extent file
+COMPACT_INTERVAL = 30  # seconds between looks for extents left sparse by deletes
+CAPACITY_BYTES = int(os.environ.get("CAPACITY_BYTES", "0"))  # capacity reported to the master, 0 means the disk size
+WORKER_THREADS = int(os.environ.get("WORKER_THREADS", "16"))  # requests handled at once, 0 disables admission
+MAX_QUEUE = int(os.environ.get("MAX_QUEUE", "64"))  # requests of one class waiting for a worker before shedding
+QUEUE_TIMEOUT = 10  # seconds a request may wait for a worker
+RATE_LIMIT = float(os.environ.get("RATE_LIMIT", "0"))  # requests/sec per client address, 0 disables
+RATE_BURST = float(os.environ.get("RATE_BURST", str(2 * RATE_LIMIT)))
 
 SERVER_ID = os.environ.get("SERVER_ID", "chunk_server_1")
 SERVER_PORT = int(os.environ.get("SERVER_PORT", "9001"))
+SERVER_HOST = os.environ.get("SERVER_HOST", SERVER_ID)  # address advertised to the master
+
+# Chunk server metrics
+CHUNK_BYTES_WRITTEN = Counter("gfs_chunk_server_bytes_written_total", "Chunk bytes written to disk")
+CHUNK_BYTES_READ = Counter("gfs_chunk_server_bytes_read_total", "Chunk bytes read from disk")
+CHUNKS_DELETED = Counter("gfs_chunk_server_chunks_deleted_total", "Chunks removed by garbage collection")
+CHUNKS_COPIED = Counter("gfs_chunk_server_chunks_copied_total", "Chunks pulled from other servers for rebalancing")
+HEARTBEAT_LATENCY = Histogram("gfs_chunk_server_heartbeat_seconds", "Heartbeat round trip to the master")
+HEARTBEAT_FAILURES = Counter("gfs_chunk_server_heartbeat_failures_total", "Heartbeats that failed")
 
 os.makedirs(DATA_DIR, exist_ok=True)
-os.makedirs(f"{DATA_DIR}/text", exist_ok=True)
-os.makedirs(f"{DATA_DIR}/images", exist_ok=True)
-os.makedirs(f"{DATA_DIR}/documents", exist_ok=True)
-os.makedirs(f"{DATA_DIR}/other", exist_ok=True)
+
+# Chunk storage, loaded from disk in main() and kept current on every write and delete
+store = open_store(STORAGE_ENGINE, DATA_DIR, CATEGORIES, DURABILITY, GROUP_COMMIT_MS / 1000, EXTENT_SIZE)
+
+admission_controller = AdmissionController(WORKER_THREADS, MAX_QUEUE, QUEUE_TIMEOUT)
+rate_limiter = RateLimiter(RATE_LIMIT, RATE_BURST)
+
+class ThreadedHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    """Handle each connection in its own thread so keep-alive clients don't block others."""
+    daemon_threads = True
+    request_queue_size = 128  # listen backlog, the default of 5 drops connections under load
 
 def get_file_category(filename):
     """Determine file category based on extension"""
@@ -34,15 +72,134 @@ def get_file_category(filename):
     else:
         return 'other'
 
+def storage_stats():
+    """Usage reported in heartbeats, the master balances servers by it"""
+    capacity = CAPACITY_BYTES
+    if not capacity:
+        disk = os.statvfs(DATA_DIR)
+        capacity = disk.f_blocks * disk.f_frsize
+    used_bytes, chunks = store.usage()
+    return {"used_bytes": used_bytes, "chunks": chunks, "capacity_bytes": capacity}
+
+def list_chunks():
+    """List the ids of all chunks stored on this server"""
+    return store.list()
+
+def delete_chunks(chunk_ids):
+    """Delete chunks by id, returns the number actually removed"""
+    deleted = 0
+    for chunk_id in chunk_ids:
+        # Chunk ids come from the network, never follow them out of DATA_DIR
+        if not chunk_id or os.path.basename(chunk_id) != chunk_id:
+            continue
+        
+        if store.delete(chunk_id):
+            deleted += 1
+    CHUNKS_DELETED.inc(amount=deleted)
+    return deleted
+
+def store_chunk(chunk_id, category, data):
+    """Store a chunk held in memory"""
+    # Chunk ids come from the network, never follow them out of DATA_DIR
+    if not chunk_id or os.path.basename(chunk_id) != chunk_id:
+        raise ValueError(f"Invalid chunk_id {chunk_id!r}")
+    with store.writer(chunk_id, category, len(data)) as writer:
+        writer.write(data)
+        writer.commit()
+    CHUNK_BYTES_WRITTEN.inc(amount=len(data))
+
+def import_chunk_files():
+    """Move chunks left in the per-file layout into the extent store"""
+    imported = []
+    for category in CATEGORIES:
+        cat_path = os.path.join(DATA_DIR, category)
+        if not os.path.isdir(cat_path):
+            continue
+        for entry in os.scandir(cat_path):
+            with open(entry.path, 'rb') as f:
+                data = f.read()
+            with store.writer(entry.name, category, len(data)) as writer:
+                writer.write(data)
+                writer.commit()
+            imported.append(entry.path)
+    
+    # The files are the only copy until the extents are on disk
+    store.flush()
+    for path in imported:
+        os.remove(path)
+    return len(imported)
+
+def compact_extents():
+    """Reclaim the space deleted chunks leave in extent files"""
+    while True:
+        time.sleep(COMPACT_INTERVAL)
+        try:
+            moved = store.compact()
+            if moved:
+                print(f"[{SERVER_ID}] Compacted extents, moved {moved} bytes")
+        except Exception as e:
+            print(f"[{SERVER_ID}] Extent compaction failed: {e}")
+
+def copy_chunk(chunk_id, filename, source, max_rate):
+    """Pull a chunk from another chunk server at no more than max_rate bytes/sec.
+    
+    The chunk is only stored once the copy is complete, so a failed copy
+    never leaves a partial chunk. Returns (bytes, sha256 hex digest).
+    """
+    conn = http.client.HTTPConnection(source["host"], source["port"], timeout=30)
+    try:
+        conn.request("GET", f"/read?{urlencode({'chunk_id': chunk_id})}")
+        response = conn.getresponse()
+        if response.status != 200:
+            raise RuntimeError(f"Source answered HTTP {response.status}: {response.read()[:200]!r}")
+        expected = int(response.getheader("Content-Length", "0"))
+        
+        digest = hashlib.sha256()
+        received = 0
+        start = time.monotonic()
+        with store.writer(chunk_id, get_file_category(filename), expected) as writer:
+            while received < expected:
+                piece = response.read(min(STREAM_BUFFER, expected - received))
+                if not piece:
+                    break
+                writer.write(piece)
+                digest.update(piece)
+                received += len(piece)
+                # Stay within the bandwidth the master granted this copy
+                ahead = received / max_rate - (time.monotonic() - start)
+                if ahead > 0:
+                    time.sleep(ahead)
+            
+            if received < expected:
+                raise RuntimeError(f"Source sent {received} of {expected} bytes")
+            writer.commit()
+    finally:
+        conn.close()
+    
+    CHUNK_BYTES_WRITTEN.inc(amount=received)
+    CHUNKS_COPIED.inc()
+    return received, digest.hexdigest()
+
 def send_heartbeat():
     """Send periodic heartbeat to master"""
+    beats = 0
+    interval = HEARTBEAT_INTERVAL
     while True:
         try:
-            data = json.dumps({
+            payload = {
                 "server_id": SERVER_ID,
-                "host": SERVER_ID,
-                "port": SERVER_PORT
-            }).encode()
+                "host": SERVER_HOST,
+                "port": SERVER_PORT,
+                "heartbeat_interval": HEARTBEAT_INTERVAL,
+                "stats": storage_stats()
+            }
+            
+            # Piggyback a full chunk report so the master can find orphans
+            if beats % CHUNK_REPORT_EVERY == 0:
+                payload["chunks"] = list_chunks()
+            beats += 1
+            
+            data = json.dumps(payload).encode()
             
             req = urllib.request.Request(
                 f"{MASTER_URL}/heartbeat",
@@ -50,44 +207,88 @@ def send_heartbeat():
                 headers={"Content-Type": "application/json"}
             )
             
+            start = time.perf_counter()
             with urllib.request.urlopen(req, timeout=5) as response:
                 result = json.loads(response.read().decode())
-                print(f"[{SERVER_ID}] Heartbeat sent: {result}")
+                print(f"[{SERVER_ID}] Heartbeat sent: {result.get('status')}")
+            HEARTBEAT_LATENCY.observe(time.perf_counter() - start)
+            
+            # The master may adjust the requested interval
+            interval = result.get("heartbeat_interval", interval)
+            
+            # The master hands out garbage collection work in bounded batches
+            to_delete = result.get("delete_chunks", [])
+            if to_delete:
+                deleted = delete_chunks(to_delete)
+                print(f"[{SERVER_ID}] Garbage collected {deleted}/{len(to_delete)} chunks")
         
         except Exception as e:
+            HEARTBEAT_FAILURES.inc()
             print(f"[{SERVER_ID}] Heartbeat failed: {e}")
         
-        time.sleep(HEARTBEAT_INTERVAL)
+        time.sleep(interval)
 
-class ChunkServerHandler(BaseHTTPRequestHandler):
-    def _set_headers(self, status=200, content_type='application/json'):
+Gauge("gfs_chunk_server_chunks_stored", "Chunks stored on this server", callback=lambda: len(list_chunks()))
+
+class ChunkServerHandler(AdmissionMixin, InstrumentedHandlerMixin, BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, every response carries Content-Length
+    timeout = KEEPALIVE_TIMEOUT
+    disable_nagle_algorithm = True  # headers and body are separate writes on a reused socket
+    metrics_routes = ("/upload", "/delete_chunks", "/copy_chunk", "/download/", "/read", "/checksum",
+                      "/health", "/storage", "/metrics")
+    admission = admission_controller
+    rate_limiter = rate_limiter
+    # Reads are interactive, chunk writes and rebalancing copies are bulk
+    request_classes = {
+        "/delete_chunks": CONTROL, "/checksum": CONTROL, "/health": CONTROL, "/storage": CONTROL,
+        "/metrics": CONTROL, "/upload": BULK, "/copy_chunk": BULK
+    }
+    
+    def _set_headers(self, status=200, content_type='application/json', content_length=0):
         self.send_response(status)
         self.send_header('Content-type', content_type)
+        self.send_header('Content-Length', str(content_length))
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
         self.end_headers()
     
+    def _send_json(self, data, status=200):
+        body = json.dumps(data).encode()
+        self._set_headers(status, content_length=len(body))
+        self.wfile.write(body)
+    
     def do_OPTIONS(self):
         self._set_headers()
     
     def do_POST(self):
-        if self.path == "/upload":
+        if urlparse(self.path).path == "/upload":
             self._handle_upload()
+        elif self.path == "/delete_chunks":
+            self._handle_delete_chunks()
+        elif self.path == "/copy_chunk":
+            self._handle_copy_chunk()
         else:
-            self._set_headers(404)
-            self.wfile.write(json.dumps({"error": "Not found"}).encode())
+            # The body was not consumed, so this connection cannot be reused
+            self.close_connection = True
+            self._send_json({"error": "Not found"}, 404)
     
     def do_GET(self):
+        parsed = urlparse(self.path)
         if self.path.startswith("/download/"):
             self._handle_download()
+        elif parsed.path == "/read":
+            self._handle_read(parse_qs(parsed.query))
+        elif parsed.path == "/checksum":
+            self._handle_checksum(parse_qs(parsed.query))
         elif self.path == "/health":
             self._handle_health()
         elif self.path == "/storage":
             self._handle_storage_info()
+        elif self.path == "/metrics":
+            self._handle_metrics()
         else:
-            self._set_headers(404)
-            self.wfile.write(json.dumps({"error": "Not found"}).encode())
+            self._send_json({"error": "Not found"}, 404)
     
     def _handle_upload(self):
         """Handle chunk upload with binary support"""
@@ -95,7 +296,38 @@ class ChunkServerHandler(BaseHTTPRequestHandler):
         content_type = self.headers.get('Content-Type', '')
         
         try:
-            if 'application/json' in content_type:
+            if 'application/octet-stream' in content_type:
+                query = parse_qs(urlparse(self.path).query)
+                chunk_id = query.get('chunk_id', [None])[0]
+                filename = query.get('filename', [''])[0]
+                
+                # Chunk ids come from the network, never follow them out of DATA_DIR
+                if not chunk_id or os.path.basename(chunk_id) != chunk_id:
+                    self.close_connection = True
+                    self._send_json({"error": "Missing or invalid chunk_id"}, 400)
+                    return
+                
+                category = get_file_category(filename)
+                
+                # Raw bytes, copied to disk without holding the whole chunk
+                received = 0
+                with store.writer(chunk_id, category, content_length) as writer:
+                    while received < content_length:
+                        piece = self.rfile.read(min(STREAM_BUFFER, content_length - received))
+                        if not piece:
+                            break
+                        writer.write(piece)
+                        received += len(piece)
+                    
+                    if received < content_length:
+                        self.close_connection = True
+                        raise ValueError(f"Chunk body ended after {received} of {content_length} bytes")
+                    writer.commit()
+                CHUNK_BYTES_WRITTEN.inc(amount=received)
+                
+                print(f"[{SERVER_ID}] Stored chunk: {chunk_id} in {category}/")
+            
+            elif 'application/json' in content_type:
                 body = self.rfile.read(content_length).decode()
                 data = json.loads(body)
                 
@@ -105,20 +337,12 @@ class ChunkServerHandler(BaseHTTPRequestHandler):
                 filename = data.get('filename', '')
                 
                 if not chunk_id:
-                    self._set_headers(400)
-                    self.wfile.write(json.dumps({"error": "Missing chunk_id"}).encode())
+                    self._send_json({"error": "Missing chunk_id"}, 400)
                     return
                 
                 category = get_file_category(filename)
-                chunk_path = os.path.join(DATA_DIR, category, chunk_id)
-                
-                if is_binary:
-                    chunk_data = base64.b64decode(chunk_data_b64)
-                    with open(chunk_path, 'wb') as f:
-                        f.write(chunk_data)
-                else:
-                    with open(chunk_path, 'w') as f:
-                        f.write(chunk_data_b64)
+                chunk_data = base64.b64decode(chunk_data_b64) if is_binary else chunk_data_b64.encode()
+                store_chunk(chunk_id, category, chunk_data)
                 
                 print(f"[{SERVER_ID}] Stored chunk: {chunk_id} in {category}/")
                 
@@ -138,81 +362,150 @@ class ChunkServerHandler(BaseHTTPRequestHandler):
                             chunk_data = value
                 
                 if not chunk_id:
-                    self._set_headers(400)
-                    self.wfile.write(json.dumps({"error": "Missing chunk_id"}).encode())
+                    self._send_json({"error": "Missing chunk_id"}, 400)
                     return
                 
-                chunk_path = os.path.join(DATA_DIR, 'text', chunk_id)
-                with open(chunk_path, 'w') as f:
-                    f.write(chunk_data or "")
+                store_chunk(chunk_id, 'text', (chunk_data or "").encode())
                 
                 print(f"[{SERVER_ID}] Stored chunk: {chunk_id}")
             
-            self._set_headers()
-            self.wfile.write(json.dumps({
+            self._send_json({
                 "success": True,
                 "chunk_id": chunk_id,
                 "server_id": SERVER_ID,
                 "category": category if 'filename' in locals() else 'text'
-            }).encode())
+            })
         
         except Exception as e:
             print(f"[{SERVER_ID}] Upload error: {e}")
-            self._set_headers(500)
-            self.wfile.write(json.dumps({"error": str(e)}).encode())
+            self._send_json({"error": str(e)}, 500)
     
     def _handle_download(self):
 
         chunk_id = self.path.split('/')[-1]
+        raw = store.read(chunk_id) if chunk_id and os.path.basename(chunk_id) == chunk_id else None
         
-        # Search in all categories
-        chunk_path = None
-        for category in ['text', 'images', 'documents', 'other']:
-            test_path = os.path.join(DATA_DIR, category, chunk_id)
-            if os.path.exists(test_path):
-                chunk_path = test_path
-                break
-        
-        if not chunk_path:
-            self._set_headers(404)
-            self.wfile.write(json.dumps({"error": "Chunk not found"}).encode())
+        if raw is None:
+            self._send_json({"error": "Chunk not found"}, 404)
             return
         
         try:
-            with open(chunk_path, 'r') as f:
-                data = f.read()
+            data = bytes(raw).decode()
             is_binary = False
-        except:
-            with open(chunk_path, 'rb') as f:
-                data = base64.b64encode(f.read()).decode()
+        except UnicodeDecodeError:
+            data = base64.b64encode(raw).decode()
             is_binary = True
+        CHUNK_BYTES_READ.inc(amount=len(raw))
         
-        self._set_headers()
-        self.wfile.write(json.dumps({
+        self._send_json({
             "chunk_id": chunk_id,
             "data": data,
             "is_binary": is_binary
-        }).encode())
+        })
+    
+    def _handle_read(self, query):
+        """Raw bytes of a range of a chunk, small files are read out of shared packs this way"""
+        chunk_id = query.get('chunk_id', [''])[0]
+        try:
+            offset = int(query.get('offset', ['0'])[0])
+            length = int(query.get('length', ['-1'])[0])
+        except ValueError:
+            self._send_json({"error": "Invalid offset or length"}, 400)
+            return
+        
+        # Chunk ids come from the network, never follow them out of DATA_DIR
+        size = store.size(chunk_id) if chunk_id and os.path.basename(chunk_id) == chunk_id else None
+        if size is not None:
+            if length < 0:
+                length = size - offset
+            if offset < 0 or offset + length > size:
+                self._send_json({"error": f"Range {offset}+{length} is outside the chunk ({size} bytes)"}, 416)
+                return
+        # With the extent store this is a slice of its mmap, written to the socket without a copy
+        data = store.read(chunk_id, offset, length) if size is not None else None
+        if data is None:
+            self._send_json({"error": "Chunk not found"}, 404)
+            return
+        CHUNK_BYTES_READ.inc(amount=len(data))
+        
+        self._set_headers(200, 'application/octet-stream', len(data))
+        self.wfile.write(data)
+    
+    def _handle_checksum(self, query):
+        """Size and sha256 of a stored chunk, used to verify rebalancing copies"""
+        chunk_id = query.get('chunk_id', [''])[0]
+        data = store.read(chunk_id) if chunk_id and os.path.basename(chunk_id) == chunk_id else None
+        if data is None:
+            self._send_json({"error": "Chunk not found"}, 404)
+            return
+        
+        self._send_json({"chunk_id": chunk_id, "bytes": len(data), "sha256": hashlib.sha256(data).hexdigest()})
+    
+    def _handle_copy_chunk(self):
+        """Pull a chunk from another server on the master's request"""
+        content_length = int(self.headers.get('Content-Length', 0))
+        
+        try:
+            data = json.loads(self.rfile.read(content_length).decode())
+            chunk_id = data["chunk_id"]
+            source = {"host": data["source"]["host"], "port": int(data["source"]["port"])}
+            max_rate = float(data.get("max_rate", 0)) or float("inf")
+        except (KeyError, TypeError, ValueError) as e:
+            self._send_json({"error": f"Invalid copy request: {e}"}, 400)
+            return
+        
+        # Chunk ids come from the network, never follow them out of DATA_DIR
+        if not chunk_id or os.path.basename(chunk_id) != chunk_id:
+            self._send_json({"error": "Invalid chunk_id"}, 400)
+            return
+        
+        try:
+            size, sha256 = copy_chunk(chunk_id, data.get("filename") or "", source, max_rate)
+        except Exception as e:
+            print(f"[{SERVER_ID}] Copy of {chunk_id} failed: {e}")
+            self._send_json({"error": str(e)}, 502)
+            return
+        
+        print(f"[{SERVER_ID}] Copied chunk: {chunk_id} ({size} bytes)")
+        self._send_json({"success": True, "chunk_id": chunk_id, "bytes": size, "sha256": sha256})
+    
+    def _handle_delete_chunks(self):
+        """Delete a batch of chunks on request"""
+        content_length = int(self.headers.get('Content-Length', 0))
+        
+        try:
+            data = json.loads(self.rfile.read(content_length).decode())
+            chunk_ids = data.get("chunk_ids", [])
+        except Exception as e:
+            self._send_json({"error": str(e)}, 400)
+            return
+        
+        deleted = delete_chunks(chunk_ids)
+        print(f"[{SERVER_ID}] Deleted {deleted}/{len(chunk_ids)} chunks")
+        
+        self._send_json({
+            "success": True,
+            "deleted": deleted
+        })
     
     def _handle_health(self):
         """Health check endpoint"""
         
         chunk_counts = {}
         total_chunks = 0
+        chunks = store.by_category()
         
-        for category in ['text', 'images', 'documents', 'other']:
-            cat_path = os.path.join(DATA_DIR, category)
-            count = len(os.listdir(cat_path)) if os.path.exists(cat_path) else 0
+        for category in CATEGORIES:
+            count = len(chunks.get(category, []))
             chunk_counts[category] = count
             total_chunks += count
         
-        self._set_headers()
-        self.wfile.write(json.dumps({
+        self._send_json({
             "server_id": SERVER_ID,
             "status": "active",
             "chunks_stored": total_chunks,
             "chunks_by_category": chunk_counts
-        }).encode())
+        })
     
     def _handle_storage_info(self):
         """Return detailed storage information"""
@@ -221,30 +514,38 @@ class ChunkServerHandler(BaseHTTPRequestHandler):
             "categories": {}
         }
         
-        for category in ['text', 'images', 'documents', 'other']:
-            cat_path = os.path.join(DATA_DIR, category)
-            if os.path.exists(cat_path):
-                files = os.listdir(cat_path)
-                storage_info["categories"][category] = {
-                    "count": len(files),
-                    "files": files[:20]  # Limit to 20 for performance
-                }
+        for category, files in store.by_category().items():
+            storage_info["categories"][category] = {
+                "count": len(files),
+                "files": files[:20]  # Limit to 20 for performance
+            }
         
-        self._set_headers()
-        self.wfile.write(json.dumps(storage_info).encode())
+        self._send_json(storage_info)
     
     def log_message(self, format, *args):
         """Suppress default logging"""
         pass
 
 def main():
+    dropped = store.load()
+    if isinstance(store, ExtentStore):
+        if dropped:
+            print(f"[{SERVER_ID}] Dropped {len(dropped)} chunks whose data did not survive a crash")
+        imported = import_chunk_files()
+        if imported:
+            print(f"[{SERVER_ID}] Moved {imported} chunk files into extents")
+        threading.Thread(target=compact_extents, daemon=True).start()
+    
     # Start heartbeat thread
     threading.Thread(target=send_heartbeat, daemon=True).start()
     
     # Start HTTP server
-    server = HTTPServer(('0.0.0.0', SERVER_PORT), ChunkServerHandler)
+    server = ThreadedHTTPServer(('0.0.0.0', SERVER_PORT), ChunkServerHandler)
     print(f"[{SERVER_ID}] Chunk Server started on port {SERVER_PORT}")
-    print(f"[{SERVER_ID}] Storage organized in: text/, images/, documents/, other/")
+    if isinstance(store, ExtentStore):
+        print(f"[{SERVER_ID}] Storage in extent files under extents/, durability: {DURABILITY}")
+    else:
+        print(f"[{SERVER_ID}] Storage organized in: text/, images/, documents/, other/, durability: {DURABILITY}")
     server.serve_forever()
 
 if __name__ == "__main__":
@@ -0,0 +1,599 @@
+import json
+import mmap
+import os
+import threading
+import time
+import uuid
+import zlib
+from metrics import Counter, Gauge, Histogram
+
+# Durability modes: when a chunk write is acknowledged
+NONE = "none"  # once it is in the page cache
+GROUP = "group"  # after the next group commit, one fsync for every write that arrived in the meantime
+SYNC = "sync"  # after an fsync of its own
+DURABILITY_MODES = (NONE, GROUP, SYNC)
+
+FSYNC_LATENCY = Histogram("gfs_chunk_server_fsync_seconds", "fsyncs made to acknowledge chunk writes")
+GROUP_COMMIT_WRITES = Histogram("gfs_chunk_server_group_commit_writes", "Chunk writes made durable by one group commit",
+                                buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+COMPACTED_BYTES = Counter("gfs_chunk_server_compacted_bytes_total", "Live chunk bytes moved out of sparse extents")
+
+def fsync(fd, sync=os.fdatasync):
+    start = time.perf_counter()
+    sync(fd)
+    FSYNC_LATENCY.observe(time.perf_counter() - start)
+
+def fsync_dir(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        fsync(fd, os.fsync)
+    finally:
+        os.close(fd)
+
+class GroupCommitter:
+    """Makes writes durable in batches.
+
+    A writer hands its item to wait() and blocks. sync_batch is called with
+    every item collected so far, at most once every `interval` seconds, so
+    writes arriving while one batch is synced or within the interval share
+    the next one. Errors from sync_batch are raised in every waiting writer.
+    """
+
+    def __init__(self, interval, sync_batch):
+        self.interval = interval
+        self._sync_batch = sync_batch
+        self._pending = []  # [item, event, error]
+        self._cond = threading.Condition()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def wait(self, item):
+        waiter = [item, threading.Event(), None]
+        with self._cond:
+            self._pending.append(waiter)
+            self._cond.notify()
+        waiter[1].wait()
+        if waiter[2] is not None:
+            raise waiter[2]
+
+    def _run(self):
+        last = 0.0
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+            delay = last + self.interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)  # let the batch fill up
+            last = time.monotonic()
+            with self._cond:
+                batch, self._pending = self._pending, []
+
+            error = None
+            try:
+                self._sync_batch([waiter[0] for waiter in batch])
+            except Exception as e:
+                error = e if isinstance(e, OSError) else OSError(str(e))
+            GROUP_COMMIT_WRITES.observe(len(batch))
+            for waiter in batch:
+                waiter[2] = error
+                waiter[1].set()
+
+class FileStore:
+    """One file per chunk under data_dir/<category>/, the original layout.
+
+    Chunks are written under .incoming and renamed into place, so readers
+    never see a partial chunk. With GROUP or SYNC durability the file is
+    fsynced before the rename and its directory after it; a group commit
+    renames a batch and fsyncs each directory once for all of it.
+    """
+    engine = "files"
+
+    def __init__(self, data_dir, categories, durability=NONE, group_commit_interval=0):
+        self.data_dir = data_dir
+        self.categories = categories
+        self.durability = durability
+        self.incoming_dir = os.path.join(data_dir, ".incoming")  # writes in progress, never reported as chunks
+        for category in categories:
+            os.makedirs(os.path.join(data_dir, category), exist_ok=True)
+        os.makedirs(self.incoming_dir, exist_ok=True)
+        self._usage = {"bytes": 0, "chunks": 0}
+        self._lock = threading.Lock()
+        self._committer = GroupCommitter(group_commit_interval, self._commit_batch) if durability == GROUP else None
+
+    def load(self):
+        """Count the chunks on disk and drop writes a crash left behind"""
+        for entry in os.scandir(self.incoming_dir):
+            os.remove(entry.path)
+        total_bytes = 0
+        total_chunks = 0
+        for category in self.categories:
+            for entry in os.scandir(os.path.join(self.data_dir, category)):
+                total_bytes += entry.stat().st_size
+                total_chunks += 1
+        with self._lock:
+            self._usage = {"bytes": total_bytes, "chunks": total_chunks}
+
+    def path(self, chunk_id):
+        """Locate a stored chunk in any category directory"""
+        for category in self.categories:
+            chunk_path = os.path.join(self.data_dir, category, chunk_id)
+            if os.path.exists(chunk_path):
+                return chunk_path
+        return None
+
+    def size(self, chunk_id):
+        """Size of a chunk, None if it is not stored"""
+        chunk_path = self.path(chunk_id)
+        try:
+            return os.path.getsize(chunk_path) if chunk_path else None
+        except OSError:
+            return None
+
+    def read(self, chunk_id, offset=0, length=-1):
+        """Bytes of a range of a chunk, None if it is not stored"""
+        chunk_path = self.path(chunk_id)
+        if not chunk_path:
+            return None
+        try:
+            with open(chunk_path, 'rb') as f:
+                f.seek(offset)
+                return f.read(length)
+        except FileNotFoundError:
+            return None
+
+    def writer(self, chunk_id, category, size):
+        return FileWriter(self, chunk_id, category, size)
+
+    def _publish(self, temp_path, chunk_path):
+        try:
+            previous_size = os.path.getsize(chunk_path)
+        except OSError:
+            previous_size = None
+        os.replace(temp_path, chunk_path)
+        size = os.path.getsize(chunk_path)
+        with self._lock:
+            self._usage["bytes"] += size - (previous_size or 0)
+            self._usage["chunks"] += previous_size is None
+
+    def _commit_batch(self, items):
+        """Rename fsynced files into place, then fsync each directory once"""
+        for temp_path, chunk_path in items:
+            self._publish(temp_path, chunk_path)
+        for directory in {os.path.dirname(chunk_path) for _, chunk_path in items}:
+            fsync_dir(directory)
+
+    def delete(self, chunk_id):
+        """Remove a chunk, False if it was not stored"""
+        chunk_path = self.path(chunk_id)
+        if not chunk_path:
+            return False
+        try:
+            size = os.path.getsize(chunk_path)
+            os.remove(chunk_path)
+        except FileNotFoundError:
+            return False
+        with self._lock:
+            self._usage["bytes"] -= size
+            self._usage["chunks"] -= 1
+        return True
+
+    def list(self):
+        return [chunk_id for chunk_ids in self.by_category().values() for chunk_id in chunk_ids]
+
+    def by_category(self):
+        return {category: os.listdir(os.path.join(self.data_dir, category)) for category in self.categories}
+
+    def usage(self):
+        """(bytes, chunks) stored"""
+        with self._lock:
+            return self._usage["bytes"], self._usage["chunks"]
+
+class FileWriter:
+    """Streams one chunk into a temporary file, commit() puts it in place"""
+
+    def __init__(self, store, chunk_id, category, size):
+        self.store = store
+        self.size = size
+        self.written = 0
+        self.chunk_path = os.path.join(store.data_dir, category, chunk_id)
+        self.temp_path = os.path.join(store.incoming_dir, f"{chunk_id}.{uuid.uuid4().hex}")
+        self.file = open(self.temp_path, 'wb')
+        self.committed = False
+
+    def write(self, data):
+        if self.written + len(data) > self.size:
+            raise ValueError(f"Chunk is larger than the {self.size} bytes announced")
+        self.file.write(data)
+        self.written += len(data)
+
+    def commit(self):
+        if self.written != self.size:
+            raise ValueError(f"Chunk ended after {self.written} of {self.size} bytes")
+        self.file.flush()
+        if self.store.durability != NONE:
+            fsync(self.file.fileno())
+        self.file.close()
+        # Every file needs an fsync of its own, a group commit shares the directory fsync after the rename
+        if self.store.durability == GROUP:
+            self.store._committer.wait((self.temp_path, self.chunk_path))
+        else:
+            self.store._publish(self.temp_path, self.chunk_path)
+            if self.store.durability == SYNC:
+                fsync_dir(os.path.dirname(self.chunk_path))
+        self.committed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if not self.committed:
+            self.file.close()
+            try:
+                os.remove(self.temp_path)
+            except FileNotFoundError:
+                pass
+
+class Extent:
+    """A preallocated file chunks are appended to, mapped read-only for reads"""
+
+    def __init__(self, number, path, size=None):
+        self.number = number
+        self.path = path
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        if size is not None:
+            try:
+                os.posix_fallocate(self.fd, 0, size)
+            except OSError:
+                os.ftruncate(self.fd, size)  # file systems without fallocate
+        self.size = os.fstat(self.fd).st_size
+        self.map = mmap.mmap(self.fd, self.size, access=mmap.ACCESS_READ) if self.size else None
+        self.tail = 0  # first byte not handed out to a write
+        self.live = 0  # bytes of the chunks the index places here
+        self.writers = 0  # writes with space reserved here that have not finished
+        self.full = False  # no more space is handed out
+        self.compacting = False  # kept until the copies of its chunks are on disk
+        self.sealed = False  # full, every write finished and fsynced
+
+class ExtentStore:
+    """Chunks appended to large preallocated extent files under data_dir/extents/.
+
+    index.log records where each chunk lives (chunk id -> extent, offset,
+    length, crc32) and is replayed at startup. Reads are slices of the
+    extent's mmap, sent without copying. A full extent is fsynced and sealed
+    whatever the durability mode, so after a crash only chunks in unsealed
+    extents are checked against their crc. Deleted chunks leave holes;
+    compact() moves the live chunks out of sparse sealed extents and removes
+    them.
+    """
+    engine = "extents"
+
+    def __init__(self, data_dir, durability=NONE, group_commit_interval=0, extent_size=64 * 1024 * 1024):
+        self.durability = durability
+        self.extent_size = extent_size
+        self.extent_dir = os.path.join(data_dir, "extents")
+        self.log_path = os.path.join(self.extent_dir, "index.log")
+        os.makedirs(self.extent_dir, exist_ok=True)
+        self._index = {}  # chunk id -> (category, extent number, offset, length, crc32)
+        self._extents = {}
+        self._active = None
+        self._next_extent = 1
+        self._log_fd = None
+        self._log_records = 0
+        self._dirty = set()  # extents written since the last group commit
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._committer = GroupCommitter(group_commit_interval, self._commit_batch) if durability == GROUP else None
+        Gauge("gfs_chunk_server_extent_bytes", "Bytes of extent files, allocated on disk and held by live chunks",
+              ["kind"], callback=lambda: {("allocated",): sum(e.size for e in list(self._extents.values())),
+                                          ("live",): sum(e.live for e in list(self._extents.values()))})
+
+    def load(self):
+        """Replay index.log, returns the chunks dropped because their data was lost"""
+        entries = {}
+        ends = {}
+        sealed = set()
+        if os.path.exists(self.log_path):
+            with open(self.log_path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # torn by a crash
+                    if "put" in record:
+                        entry = (record["category"], record["extent"], record["offset"], record["length"],
+                                 record["crc"])
+                        entries[record["put"]] = entry
+                        ends[entry[1]] = max(ends.get(entry[1], 0), entry[2] + entry[3])
+                    elif "del" in record:
+                        entries.pop(record["del"], None)
+                    elif "seal" in record:
+                        sealed.add(record["seal"])
+
+        for name in os.listdir(self.extent_dir):
+            if name.endswith(".extent"):
+                number = int(name.split(".")[0])
+                extent = self._extents[number] = Extent(number, os.path.join(self.extent_dir, name))
+                extent.tail = ends.get(number, 0)
+                extent.sealed = extent.full = number in sealed
+                self._next_extent = max(self._next_extent, number + 1)
+
+        dropped = []
+        for chunk_id, entry in entries.items():
+            extent = self._extents.get(entry[1])
+            if extent is None or entry[2] + entry[3] > extent.size or (
+                    not extent.sealed and zlib.crc32(extent.map[entry[2]:entry[2] + entry[3]]) != entry[4]):
+                dropped.append(chunk_id)
+                continue
+            self._index[chunk_id] = entry
+            extent.live += entry[3]
+
+        # Appends go on in the newest extent; older unsealed ones were full when the server stopped
+        unsealed = sorted(number for number, extent in self._extents.items() if not extent.sealed)
+        for number in unsealed[:-1]:
+            fsync(self._extents[number].fd)
+            self._extents[number].sealed = self._extents[number].full = True
+        if unsealed:
+            self._active = self._extents[unsealed[-1]]
+        for extent in list(self._extents.values()):
+            if extent.sealed and not extent.live:
+                self._remove_extent(extent)
+        with self._lock:
+            self._rewrite_log()
+        return dropped
+
+    def size(self, chunk_id):
+        entry = self._index.get(chunk_id)
+        return entry[3] if entry else None
+
+    def read(self, chunk_id, offset=0, length=-1):
+        """A memoryview of a range of a chunk, None if it is not stored"""
+        with self._lock:
+            entry = self._index.get(chunk_id)
+            if entry is None:
+                return None
+            extent = self._extents[entry[1]]
+        if length < 0:
+            length = entry[3] - offset
+        start = entry[2] + offset
+        return memoryview(extent.map)[start:start + length] if length else b""
+
+    def writer(self, chunk_id, category, size):
+        return ExtentWriter(self, chunk_id, category, size)
+
+    def _reserve(self, size):
+        """Hand out size bytes at the tail of the active extent, starting a new one when it is full"""
+        full = None
+        with self._lock:
+            extent = self._active
+            if extent is None or extent.tail + size > extent.size:
+                if extent is not None:
+                    extent.full = True
+                    if not extent.writers:
+                        full = extent
+                number = self._next_extent
+                self._next_extent += 1
+                path = os.path.join(self.extent_dir, f"{number:08d}.extent")
+                extent = self._active = self._extents[number] = Extent(number, path, max(self.extent_size, size))
+            offset = extent.tail
+            extent.tail += size
+            extent.writers += 1
+        if full is not None:
+            threading.Thread(target=self._seal, args=(full,), daemon=True).start()
+        return extent, offset
+
+    def _publish(self, chunk_id, entry, replaces=False):
+        """Point the index at a written chunk. With replaces set only if it still holds that entry"""
+        with self._lock:
+            previous = self._index.get(chunk_id)
+            if replaces is not False and previous is not replaces:
+                return False  # deleted or rewritten while compaction copied it
+            self._index[chunk_id] = entry
+            self._extents[entry[1]].live += entry[3]
+            if previous is not None:
+                self._release_space(previous)
+            self._dirty.add(entry[1])
+            self._log({"put": chunk_id, "category": entry[0], "extent": entry[1], "offset": entry[2],
+                       "length": entry[3], "crc": entry[4]})
+            return True
+
+    def _finish(self, extent):
+        """A write into extent is done, seal it if it was the last one into a full extent"""
+        with self._lock:
+            extent.writers -= 1
+            seal = extent.full and not extent.writers and not extent.sealed
+        if seal:
+            threading.Thread(target=self._seal, args=(extent,), daemon=True).start()
+
+    def _seal(self, extent):
+        fsync(extent.fd)
+        with self._lock:
+            if extent.sealed or extent.number not in self._extents:
+                return
+            extent.sealed = True
+            self._log({"seal": extent.number})
+            if not extent.live:
+                self._remove_extent(extent)
+
+    def _release_space(self, entry):
+        extent = self._extents.get(entry[1])
+        if extent is None:
+            return
+        extent.live -= entry[3]
+        if extent.sealed and not extent.live and not extent.compacting:
+            self._remove_extent(extent)
+
+    def _remove_extent(self, extent):
+        # Readers may still hold slices of the map, it is unmapped once they drop them
+        del self._extents[extent.number]
+        self._dirty.discard(extent.number)
+        os.close(extent.fd)
+        os.remove(extent.path)
+
+    def _log(self, record):
+        os.write(self._log_fd, (json.dumps(record, separators=(",", ":")) + "\n").encode())
+        self._log_records += 1
+        if self._log_records > 2 * len(self._index) + 10000:
+            self._rewrite_log()
+
+    def _rewrite_log(self):
+        """Replace index.log with one record per live chunk and sealed extent"""
+        temp_path = f"{self.log_path}.tmp"
+        with open(temp_path, 'w') as f:
+            for number, extent in sorted(self._extents.items()):
+                if extent.sealed:
+                    f.write(json.dumps({"seal": number}) + "\n")
+            for chunk_id, (category, number, offset, length, crc) in self._index.items():
+                f.write(json.dumps({"put": chunk_id, "category": category, "extent": number, "offset": offset,
+                                    "length": length, "crc": crc}, separators=(",", ":")) + "\n")
+            f.flush()
+            fsync(f.fileno())
+        os.replace(temp_path, self.log_path)
+        fsync_dir(self.extent_dir)
+        if self._log_fd is not None:
+            os.close(self._log_fd)
+        self._log_fd = os.open(self.log_path, os.O_WRONLY | os.O_APPEND)
+        self._log_records = len(self._index) + len(self._extents)
+
+    def _sync(self, extents):
+        """fsync the data of extents, then the index records pointing into them"""
+        for extent in extents:
+            fsync(extent.fd)
+        with self._lock:
+            log_fd = os.dup(self._log_fd)  # a log rewrite may close the original meanwhile
+        try:
+            fsync(log_fd)
+        finally:
+            os.close(log_fd)
+
+    def flush(self):
+        """fsync every extent and the index, whatever the durability mode"""
+        with self._lock:
+            extents = list(self._extents.values())
+        self._sync(extents)
+
+    def _commit_batch(self, items):
+        with self._lock:
+            extents = [self._extents[number] for number in self._dirty if number in self._extents]
+            self._dirty.clear()
+        self._sync(extents)
+
+    def delete(self, chunk_id):
+        """Remove a chunk, False if it was not stored"""
+        with self._lock:
+            entry = self._index.pop(chunk_id, None)
+            if entry is None:
+                return False
+            self._release_space(entry)
+            self._log({"del": chunk_id})
+        return True
+
+    def compact(self, threshold=0.5):
+        """Move live chunks out of sealed extents less than threshold full and remove them, returns bytes moved"""
+        moved = 0
+        with self._compact_lock:
+            with self._lock:
+                sparse = [extent for extent in self._extents.values()
+                          if extent.sealed and extent.live < threshold * extent.size]
+                for extent in sparse:
+                    extent.compacting = True
+            for extent in sparse:
+                with self._lock:
+                    chunks = [(chunk_id, entry) for chunk_id, entry in self._index.items() if entry[1] == extent.number]
+                writers = []
+                try:
+                    for chunk_id, entry in chunks:
+                        writer = ExtentWriter(self, chunk_id, entry[0], entry[3], replaces=entry)
+                        writers.append(writer)
+                        writer.write(extent.map[entry[2]:entry[2] + entry[3]])
+                        moved += entry[3]
+                    # The copies must be on disk before an index record points at them
+                    for copied in {writer.extent for writer in writers}:
+                        fsync(copied.fd)
+                    for writer in writers:
+                        writer.commit(durable=False)
+                finally:
+                    for writer in writers:
+                        writer._finish()
+                # and the records before the only other copy goes
+                self._sync(())
+                with self._lock:
+                    extent.compacting = False
+                    if not extent.live and extent.number in self._extents:
+                        self._remove_extent(extent)
+        COMPACTED_BYTES.inc(amount=moved)
+        return moved
+
+    def list(self):
+        with self._lock:
+            return list(self._index)
+
+    def by_category(self):
+        chunks = {}
+        with self._lock:
+            for chunk_id, entry in self._index.items():
+                chunks.setdefault(entry[0], []).append(chunk_id)
+        return chunks
+
+    def usage(self):
+        """(bytes, chunks) held by live chunks; holes left by deletes are not counted"""
+        with self._lock:
+            return sum(entry[3] for entry in self._index.values()), len(self._index)
+
+class ExtentWriter:
+    """Streams one chunk into the space reserved for it, commit() adds it to the index"""
+
+    def __init__(self, store, chunk_id, category, size, replaces=False):
+        self.store = store
+        self.chunk_id = chunk_id
+        self.category = category
+        self.size = size
+        self.replaces = replaces
+        self.written = 0
+        self.crc = 0
+        self.extent, self.offset = store._reserve(size)
+        self.finished = False
+
+    def write(self, data):
+        if self.written + len(data) > self.size:
+            raise ValueError(f"Chunk is larger than the {self.size} bytes announced")
+        view = memoryview(data)
+        while view:
+            n = os.pwrite(self.extent.fd, view, self.offset + self.written)
+            self.crc = zlib.crc32(view[:n], self.crc)
+            self.written += n
+            view = view[n:]
+
+    def commit(self, durable=True):
+        if self.written != self.size:
+            raise ValueError(f"Chunk ended after {self.written} of {self.size} bytes")
+        entry = (self.category, self.extent.number, self.offset, self.size, self.crc)
+        published = self.store._publish(self.chunk_id, entry, self.replaces)
+        self._finish()
+        if published and durable:
+            if self.store.durability == GROUP:
+                self.store._committer.wait(self.chunk_id)
+            elif self.store.durability == SYNC:
+                self.store._sync([self.extent])
+
+    def _finish(self):
+        if not self.finished:
+            self.finished = True
+            self.store._finish(self.extent)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        # An abandoned write leaves a hole, like a deleted chunk
+        self._finish()
+
+def open_store(engine, data_dir, categories, durability=NONE, group_commit_interval=0,
+               extent_size=64 * 1024 * 1024):
+    """The chunk store for the STORAGE_ENGINE setting"""
+    if durability not in DURABILITY_MODES:
+        raise ValueError(f"Unknown durability mode {durability!r}, expected one of {', '.join(DURABILITY_MODES)}")
+    if engine == FileStore.engine:
+        return FileStore(data_dir, categories, durability, group_commit_interval)
+    if engine == ExtentStore.engine:
+        return ExtentStore(data_dir, durability, group_commit_interval, extent_size)
+    raise ValueError(f"Unknown storage engine {engine!r}, expected files or extents")
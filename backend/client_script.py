@@ -1,16 +1,52 @@
 import json
+import os
 import time
+import io
+import math
+import random
 import base64
+import select
+import socket
+import http.client
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import count
 from http.server import HTTPServer, BaseHTTPRequestHandler
-import urllib.request
+from urllib.parse import parse_qs, urlencode, urlsplit
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from metrics import Counter, Gauge, Histogram, InstrumentedHandlerMixin
 
-MASTER_URL = "http://master:8000"
+MASTER_URL = os.environ.get("MASTER_URL", "http://master:8000")
+CLIENT_PORT = int(os.environ.get("CLIENT_PORT", "8001"))
+SHADOW_URLS = [url for url in os.environ.get("SHADOW_URLS", "").split(",") if url]  # read-only masters for lookups
 CHUNK_SIZE = 1024 * 1024  
+UPLOAD_CONCURRENCY = int(os.environ.get("UPLOAD_CONCURRENCY", "4"))  # chunks in flight per upload
+ACK_BATCH = 32  # stored chunks acknowledged to the master per call
+PACK_THRESHOLD = 64 * 1024  # upload_small_files packs files up to this size into shared chunks
+PACKS_PER_COMMIT = 64  # packs allocated and committed per master call, the master's limit
+HEDGE_READS = os.environ.get("HEDGE_READS", "1") == "1"  # ask a second replica when the first is slow
+HEDGE_PERCENTILE = float(os.environ.get("HEDGE_PERCENTILE", "95"))  # reads slower than this percentile are hedged
+READ_THREADS = 16  # chunk reads in flight across all downloads, hedges included
 ENCRYPTION_KEY = None  
 
+# Client metrics
+UPLOADS = Counter("gfs_client_uploads_total", "File uploads by result", ["result"])
+UPLOAD_BYTES = Counter("gfs_client_upload_bytes_total", "File bytes uploaded after encryption")
+CHUNKS_IN_FLIGHT = Gauge("gfs_client_chunks_in_flight", "Streamed chunks read but not yet stored")
+CHUNK_UPLOAD_LATENCY = Histogram("gfs_client_chunk_upload_seconds", "Chunk upload latency per server", ["server"])
+CHUNK_UPLOAD_FAILURES = Counter("gfs_client_chunk_upload_failures_total", "Failed chunk uploads", ["server"])
+MASTER_CALL_LATENCY = Histogram("gfs_client_master_call_seconds", "Master RPC latency", ["call"])
+OVERLOAD_RETRIES = Counter("gfs_client_overload_retries_total", "Requests retried after a 429 from a server")
+SHADOW_FALLBACKS = Counter("gfs_client_shadow_fallbacks_total", "Lookups retried on the primary master")
+CHUNK_READ_LATENCY = Histogram("gfs_client_chunk_read_seconds", "Chunk read latency per server", ["server"])
+HEDGED_READS = Counter("gfs_client_hedged_reads_total", "Chunk reads also sent to a second replica")
+HEDGE_WINS = Counter("gfs_client_hedge_wins_total", "Hedged reads the second replica answered first")
+
+shadow_cursor = count()  # spreads lookups across shadow masters
+
 def generate_encryption_key(password="default_gfs_key"):
     """Generate encryption key from password"""
     kdf = PBKDF2HMAC(
@@ -30,127 +66,700 @@ def encrypt_data(data, cipher):
 def decrypt_data(encrypted_data, cipher):
     return cipher.decrypt(encrypted_data)
 
-def upload_file(filename, content, encrypt=True):
-    print(f"[CLIENT] Starting upload: {filename} (Encryption: {encrypt})")
+class ConnectionPool:
+    """Persistent HTTP/1.1 connections per server with health-based eviction"""
+    
+    def __init__(self, max_idle_per_host=4, idle_timeout=25, failure_threshold=3,
+                 cooldown=10, timeout=10, overload_retries=3, max_retry_after=5):
+        self.max_idle_per_host = max_idle_per_host
+        self.idle_timeout = idle_timeout  # below the servers' KEEPALIVE_TIMEOUT
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.timeout = timeout
+        self.overload_retries = overload_retries  # 429 replies waited out before giving up
+        self.max_retry_after = max_retry_after  # cap on the Retry-After wait in seconds
+        self.idempotent_methods = ("GET", "HEAD")  # safe to resend after the request went out
+        self.connections_opened = 0
+        self._idle = {}  # (host, port) -> [(connection, last_used)]
+        self._failures = {}  # (host, port) -> consecutive failures
+        self._down_until = {}  # (host, port) -> time the server may be retried
+        self._lock = threading.Lock()
+    
+    def _acquire(self, key):
+        now = time.time()
+        with self._lock:
+            idle = self._idle.get(key, [])
+            while idle:
+                conn, last_used = idle.pop()
+                if now - last_used < self.idle_timeout and not self._peer_closed(conn):
+                    return conn, True
+                conn.close()
+            self.connections_opened += 1
+        return http.client.HTTPConnection(key[0], key[1], timeout=self.timeout), False
+    
+    @staticmethod
+    def _peer_closed(conn):
+        """An idle connection only becomes readable when the server closes it"""
+        if conn.sock is None:
+            return True
+        readable, _, _ = select.select([conn.sock], [], [], 0)
+        return bool(readable)
+    
+    def _release(self, key, conn):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append((conn, time.time()))
+                return
+        conn.close()
+    
+    def is_healthy(self, host, port):
+        return time.time() >= self._down_until.get((host, port), 0)
+    
+    def evict(self, host, port, cooldown=None):
+        """Close idle connections to a server and skip it for a while"""
+        key = (host, port)
+        with self._lock:
+            for conn, _ in self._idle.pop(key, []):
+                conn.close()
+            self._down_until[key] = time.time() + (self.cooldown if cooldown is None else cooldown)
+    
+    def sync_health(self, addresses):
+        """Evict servers the master reports as not active"""
+        for info in addresses.values():
+            if info.get("status", "active") != "active":
+                self.evict(info["host"], info["port"])
+    
+    def _record(self, key, ok):
+        if ok:
+            self._failures.pop(key, None)
+            self._down_until.pop(key, None)
+            return
+        failures = self._failures.get(key, 0) + 1
+        self._failures[key] = failures
+        if failures >= self.failure_threshold:
+            self.evict(*key)
+    
+    def request(self, host, port, method, path, body=None, headers=None, cancel=None):
+        """Send a request, returns (status, response body)
+        
+        A 429 is retried after its Retry-After, with jitter so shed clients do not
+        come back together. Passing a CancelToken lets another thread abort the
+        request, which then raises RequestCancelled.
+        """
+        for retry in range(self.overload_retries + 1):
+            status, data, retry_after = self._send(host, port, method, path, body, headers, cancel)
+            if status != 429 or retry == self.overload_retries or (cancel is not None and cancel.cancelled):
+                return status, data
+            OVERLOAD_RETRIES.inc()
+            time.sleep(min(retry_after, self.max_retry_after) * random.uniform(1, 1.5))
+    
+    def _send(self, host, port, method, path, body, headers, cancel):
+        key = (host, port)
+        if not self.is_healthy(host, port):
+            raise ConnectionError(f"{host}:{port} is marked unhealthy")
+        
+        headers = headers or {}
+        for attempt in range(2):
+            conn, reused = self._acquire(key)
+            sent = False
+            try:
+                if cancel is not None:
+                    if conn.sock is None:
+                        conn.connect()
+                    if not cancel.attach(conn):
+                        self._release(key, conn)
+                        raise RequestCancelled(f"{method} {path} to {host}:{port} cancelled")
+                conn.request(method, path, body=body, headers=headers)
+                sent = True
+                response = conn.getresponse()
+                data = response.read()
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                if cancel is not None and cancel.cancelled:
+                    raise RequestCancelled(f"{method} {path} to {host}:{port} cancelled")
+                # The server may have closed an idle keep-alive connection, retry once fresh.
+                # Once the request went out it may have been applied, only idempotent ones are resent.
+                if reused and attempt == 0 and (not sent or method in self.idempotent_methods):
+                    continue
+                self._record(key, False)
+                raise
+            
+            # A cancel that raced the response may have shut the socket down
+            if response.will_close or (cancel is not None and not cancel.detach()):
+                conn.close()
+            else:
+                self._release(key, conn)
+            self._record(key, True)
+            try:
+                retry_after = float(response.getheader("Retry-After", 1))
+            except ValueError:
+                retry_after = 1
+            return response.status, data, retry_after
+    
+    def post_json(self, url, payload):
+        return self.request_json(url, "POST", payload)
+    
+    def get_json(self, url, cancel=None):
+        return self.request_json(url, "GET", cancel=cancel)
+    
+    def request_json(self, url, method, payload=None, cancel=None, headers=None):
+        """Request a JSON endpoint by URL, raising on HTTP errors"""
+        parts = urlsplit(url)
+        path = parts.path + (f"?{parts.query}" if parts.query else "")
+        body = json.dumps(payload).encode() if payload is not None else None
+        headers = dict(headers or {})
+        if body is not None:
+            headers["Content-Type"] = "application/json"
+        
+        status, data = self.request(parts.hostname, parts.port or 80, method, path, body, headers, cancel)
+        if status >= 400:
+            raise RuntimeError(f"{method} {url} failed with HTTP {status}: {data[:200]!r}")
+        return json.loads(data.decode())
 
-    cipher = generate_encryption_key() if encrypt else None
+connection_pool = ConnectionPool()
+caller = threading.local()  # token: login session of the user the current request acts for
+
+class RequestCancelled(Exception):
+    """A pooled request was aborted through its CancelToken"""
+
+class CancelToken:
+    """Aborts a pooled request from another thread by shutting its socket down"""
+    
+    def __init__(self):
+        self.cancelled = False
+        self._conn = None
+        self._lock = threading.Lock()
+    
+    def attach(self, conn):
+        """Track the request's connection, False if it was already cancelled"""
+        with self._lock:
+            if self.cancelled:
+                return False
+            self._conn = conn
+            return True
+    
+    def detach(self):
+        """Stop tracking the connection, False if the request was cancelled meanwhile"""
+        with self._lock:
+            self._conn = None
+            return not self.cancelled
+    
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            conn, self._conn = self._conn, None
+        sock = conn.sock if conn is not None else None
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+class ReplicaSelector:
+    """Ranks replicas by latency EWMA and requests in flight, and sets the hedging deadline"""
+    
+    def __init__(self, alpha=0.2, decay=10, window=1000, percentile=HEDGE_PERCENTILE, min_samples=20):
+        self.alpha = alpha
+        self.decay = decay  # seconds for latency above the best server's to be forgotten
+        self.window = window
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self._latency = {}  # server_id -> (EWMA seconds, time of the last sample)
+        self._in_flight = {}  # server_id -> reads in progress
+        self._recent = {}  # kind of read -> deque of recent latencies
+        self._lock = threading.Lock()
+    
+    def _expected(self, server_id, best, now):
+        ewma, updated = self._latency.get(server_id, (best, now))
+        # A server that was slow once drifts back towards the best, so it gets retried
+        return best + (ewma - best) * math.exp(-(now - updated) / self.decay)
+    
+    def rank(self, server_ids):
+        """Server ids ordered best first, untried servers rank with the fastest"""
+        now = time.time()
+        with self._lock:
+            best = min((ewma for ewma, _ in self._latency.values()), default=0.0)
+            return sorted(server_ids, key=lambda server_id: (
+                self._expected(server_id, best, now) * (1 + self._in_flight.get(server_id, 0)),
+                self._in_flight.get(server_id, 0)))
     
+    def started(self, server_id):
+        with self._lock:
+            self._in_flight[server_id] = self._in_flight.get(server_id, 0) + 1
+    
+    def finished(self, server_id, kind, elapsed=None, lost=False):
+        """Record a finished read, elapsed is None when it failed
+        
+        A read cancelled after losing a hedge (lost) was at least elapsed slow, that
+        counts against the server but stays out of the hedging deadline.
+        """
+        with self._lock:
+            self._in_flight[server_id] -= 1
+            if elapsed is None:
+                return
+            previous = self._latency.get(server_id)
+            ewma = elapsed if previous is None else previous[0] + self.alpha * (elapsed - previous[0])
+            self._latency[server_id] = (ewma, time.time())
+            if not lost:
+                self._recent.setdefault(kind, deque(maxlen=self.window)).append(elapsed)
+    
+    def hedge_delay(self, kind):
+        """Seconds to wait on a replica before asking another, None until there is enough history"""
+        with self._lock:
+            recent = sorted(self._recent.get(kind, ()))
+        if len(recent) < self.min_samples:
+            return None
+        return recent[min(len(recent) - 1, int(len(recent) * self.percentile / 100))]
+
+replica_selector = ReplicaSelector()
+read_executor = ThreadPoolExecutor(max_workers=READ_THREADS)
+
+def server_url(addresses, server_id):
+    """Build a chunk server URL from master-provided addresses"""
+    info = addresses.get(server_id)
+    if not info:
+        raise KeyError(f"No address for {server_id}")
+    return f"http://{info['host']}:{info['port']}"
+
+class UploadInterrupted(Exception):
+    """An upload stopped part way, passing upload_id again resumes it"""
+    
+    def __init__(self, message, upload_id):
+        super().__init__(message)
+        self.upload_id = upload_id
+
+def upload_file(filename, content, encrypt=True, upload_id=None):
+    """Upload an in-memory file, see upload_stream"""
     if isinstance(content, str):
-        content_bytes = content.encode()
-    else:
-        content_bytes = content
+        content = content.encode()
+    return upload_stream(filename, io.BytesIO(content), len(content), encrypt, upload_id)
+
+def store_chunk(filename, allocation, data, addresses):
+    """Send one chunk's raw bytes to its replicas, returns the servers that stored it"""
+    chunk_id = allocation["chunk_id"]
+    path = f"/upload?{urlencode({'chunk_id': chunk_id, 'filename': filename})}"
+    stored_on = []
+    for server_id in allocation["servers"]:
+        try:
+            info = addresses[server_id]
+            start = time.perf_counter()
+            status, body = connection_pool.request(info["host"], info["port"], "POST", path, data,
+                                                   {"Content-Type": "application/octet-stream"})
+            if status >= 400:
+                raise RuntimeError(f"HTTP {status}: {body[:200]!r}")
+            CHUNK_UPLOAD_LATENCY.observe(time.perf_counter() - start, (server_id,))
+            stored_on.append(server_id)
+        except Exception as e:
+            CHUNK_UPLOAD_FAILURES.inc((server_id,))
+            print(f"[CLIENT] Failed to upload {chunk_id} to {server_id}: {e}")
+    return stored_on
+
+def master_call(call, method, payload=None, query=None):
+    """Call a master endpoint, timing it under the call's name"""
+    url = f"{MASTER_URL}/{call}" + (f"?{urlencode(query)}" if query else "")
+    # The master rate limits per user, pass on whose request this is
+    token = getattr(caller, "token", None)
+    headers = {"Authorization": f"Bearer {token}"} if token else None
+    start = time.perf_counter()
+    result = connection_pool.request_json(url, method, payload, headers=headers)
+    MASTER_CALL_LATENCY.observe(time.perf_counter() - start, (call,))
+    return result
+
+def read_exactly(stream, size):
+    """Read size bytes unless the stream ends first"""
+    data = stream.read(size)
+    if len(data) == size or not data:
+        return data
+    parts = [data]
+    received = len(data)
+    while received < size:
+        piece = stream.read(size - received)
+        if not piece:
+            break
+        parts.append(piece)
+        received += len(piece)
+    return b"".join(parts)
+
+def skip_bytes(stream, size):
+    """Move past size bytes of a chunk that is already stored"""
+    if stream.seekable():
+        stream.seek(size, io.SEEK_CUR)
+        return
+    while size > 0:
+        piece = stream.read(min(size, CHUNK_SIZE))
+        if not piece:
+            raise RuntimeError("Upload ended early")
+        size -= len(piece)
+
+def open_upload(filename, length, encryption, upload_id):
+    """Start an upload session, or fetch an existing one with placements for its missing chunks"""
+    if upload_id is None:
+        return master_call("upload_session", "POST", {
+            "filename": filename,
+            "filesize": length,
+            "encryption": encryption
+        })
     
-    if encrypt:
-        print(f"[CLIENT] Encrypting file...")
-        content_bytes = encrypt_data(content_bytes, cipher)
+    session = master_call("upload_session", "GET", query={"upload_id": upload_id})
+    if not session["committed"]:
+        if session["num_chunks"] != (length + CHUNK_SIZE - 1) // CHUNK_SIZE:
+            raise ValueError(f"Upload {upload_id} is for a file of {session['num_chunks']} chunks")
+        if session["encryption"] != encryption:
+            raise ValueError(f"Upload {upload_id} was started with encryption={session['encryption']}")
+    return session
 
+def upload_stream(filename, stream, length, encrypt=True, upload_id=None, concurrency=UPLOAD_CONCURRENCY):
+    """Upload length bytes read from stream, sending each chunk as soon as it is read.
+    
+    At most `concurrency` chunks are held in memory, so a 10GB upload needs no
+    more memory than a 10MB one. The upload runs in a session on the master:
+    stored chunks are acknowledged in batches and the file appears only when
+    the session commits. If the upload fails, UploadInterrupted carries the
+    upload id; passing it back with the same content sends only the chunks
+    the master has no acknowledgement for. With encryption every chunk is its
+    own Fernet token, so resent chunks need not match the first attempt.
+    """
+    encryption = "chunk" if encrypt else None
+    cipher = generate_encryption_key() if encrypt else None
+    
     try:
-        data = json.dumps({
-            "filename": filename,
-            "filesize": len(content_bytes)
-        }).encode()
-        
-        req = urllib.request.Request(
-            f"{MASTER_URL}/allocate_chunks",
-            data=data,
-            headers={"Content-Type": "application/json"}
-        )
-        
-        with urllib.request.urlopen(req, timeout=10) as response:
-            allocation = json.loads(response.read().decode())
+        session = open_upload(filename, length, encryption, upload_id)
+    except Exception as e:
+        UPLOADS.inc(("failed",))
+        raise UploadInterrupted(f"Could not open upload: {e}", upload_id)
+    
+    upload_id = session["upload_id"]
+    if session["committed"]:
+        return {"upload_id": upload_id, "filename": session["filename"], "chunks_sent": 0}
+    filename = session["filename"]
+    print(f"[CLIENT] {'Resuming' if session['acked'] else 'Starting'} upload {upload_id}: {filename} "
+          f"({length} bytes, {len(session['missing'])}/{session['num_chunks']} chunks to send, Encryption: {encrypt})")
+    
+    allocations = {allocation["index"]: allocation for allocation in session["allocations"]}
+    addresses = session["server_addresses"]
+    connection_pool.sync_health(addresses)
+    
+    in_flight = deque()  # (index, future) in chunk order
+    acked = []  # stored chunks not yet acknowledged to the master
+    stored_bytes = 0
+    
+    def finish_oldest():
+        index, future = in_flight.popleft()
+        try:
+            stored_on = future.result()
+        finally:
+            CHUNKS_IN_FLIGHT.dec()
+        if not stored_on:
+            raise RuntimeError(f"No replica stored chunk {index}")
+        acked.append({"index": index, "servers": stored_on})
+    
+    def flush_acks():
+        if acked:
+            master_call("ack_chunks", "POST", {"upload_id": upload_id, "chunks": acked})
+            acked.clear()
+    
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        for index in range(session["num_chunks"]):
+            size = min(CHUNK_SIZE, length - index * CHUNK_SIZE)
+            if index not in allocations:
+                skip_bytes(stream, size)
+                continue
+            
+            # Wait for a free slot before reading the next chunk, this bounds memory
+            while len(in_flight) >= concurrency:
+                finish_oldest()
+            if len(acked) >= ACK_BATCH:
+                flush_acks()
+            
+            data = read_exactly(stream, size)
+            if len(data) < size:
+                raise RuntimeError(f"Upload ended in chunk {index} of {session['num_chunks']}")
+            if cipher:
+                data = cipher.encrypt(data)
+            stored_bytes += len(data)
+            
+            CHUNKS_IN_FLIGHT.inc()
+            in_flight.append((index, executor.submit(store_chunk, filename, allocations[index], data, addresses)))
+            del data
         
-        print(f"[CLIENT] Received allocation for {len(allocation['allocations'])} chunks")
+        while in_flight:
+            finish_oldest()
+        flush_acks()
+        master_call("commit_upload", "POST", {"upload_id": upload_id})
     
     except Exception as e:
-        print(f"[CLIENT] Failed to get allocation: {e}")
-        return False
+        # Whatever did reach the chunk servers is acknowledged so a resume skips it
+        while in_flight:
+            try:
+                finish_oldest()
+            except Exception:
+                pass
+        try:
+            flush_acks()
+        except Exception:
+            pass
+        UPLOADS.inc(("failed",))
+        print(f"[CLIENT] Upload {upload_id} of {filename} interrupted: {e}")
+        raise UploadInterrupted(str(e), upload_id)
+    finally:
+        executor.shutdown(wait=True)
     
-    for alloc in allocation["allocations"]:
-        chunk_id = alloc["chunk_id"]
-        servers = alloc["servers"]
-        index = alloc["index"]
+    print(f"[CLIENT] Upload {upload_id} completed: {filename} ({len(allocations)} chunks sent)")
+    UPLOADS.inc(("completed",))
+    UPLOAD_BYTES.inc(amount=stored_bytes)
+    return {"upload_id": upload_id, "filename": filename, "chunks_sent": len(allocations)}
 
-        start = index * CHUNK_SIZE
-        end = min(start + CHUNK_SIZE, len(content_bytes))
-        chunk_data = content_bytes[start:end]
+def pack_files(files):
+    """Group (filename, data) pairs, in order, into packs of at most CHUNK_SIZE bytes"""
+    packs = []
+    current, size = [], 0
+    for filename, data in files:
+        if current and size + len(data) > CHUNK_SIZE:
+            packs.append(current)
+            current, size = [], 0
+        current.append((filename, data))
+        size += len(data)
+    if current:
+        packs.append(current)
+    return packs
 
-        is_binary = not isinstance(content, str) or encrypt
-        
-        success = False
-        for server_id in servers:
+def store_pack(allocation, members, addresses):
+    """Store a pack as one chunk, returns the servers that stored it"""
+    return store_chunk(allocation["chunk_id"], allocation, b"".join(data for _, data in members), addresses)
+
+def upload_small_files(files, encrypt=True, concurrency=UPLOAD_CONCURRENCY):
+    """Upload many small files packed into shared chunks.
+    
+    files is [(filename, content)]. Files up to PACK_THRESHOLD bytes are
+    concatenated into packs of at most one chunk and the master records each
+    one as (pack, offset, length). A pack costs one chunk write per replica and
+    up to PACKS_PER_COMMIT packs share one allocation and one commit, instead
+    of an upload session per file. A commit publishes all of its files or
+    none. Larger files go through upload_file. With encryption every file is
+    its own Fernet token. Returns {"files", "packs", "failed": [filenames]}.
+    """
+    cipher = generate_encryption_key() if encrypt else None
+    small = []
+    failed = []
+    committed = 0
+    
+    for filename, content in files:
+        if isinstance(content, str):
+            content = content.encode()
+        if len(content) <= PACK_THRESHOLD:
+            small.append((filename, cipher.encrypt(content) if cipher else content))
+            continue
+        try:
+            upload_file(filename, content, encrypt)
+            committed += 1
+        except UploadInterrupted:
+            failed.append(filename)
+    
+    packs = pack_files(small)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for start in range(0, len(packs), PACKS_PER_COMMIT):
+            group = packs[start:start + PACKS_PER_COMMIT]
+            names = [filename for members in group for filename, _ in members]
+            group_failed = []
             try:
-                port_map = {
-                    "chunk_server_1": 9001,
-                    "chunk_server_2": 9002,
-                    "chunk_server_3": 9003
-                }
-                port = port_map.get(server_id, 9001)
-                
-                upload_payload = {
-                    "chunk_id": chunk_id,
-                    "data": base64.b64encode(chunk_data).decode(),
-                    "is_binary": is_binary,
-                    "filename": filename
-                }
+                allocation = master_call("allocate_packs", "POST", {"count": len(group)})
+                addresses = allocation["server_addresses"]
+                connection_pool.sync_health(addresses)
                 
-                req = urllib.request.Request(
-                    f"http://{server_id}:{port}/upload",
-                    data=json.dumps(upload_payload).encode(),
-                    headers={"Content-Type": "application/json"}
-                )
+                stored = [executor.submit(store_pack, chunk, members, addresses)
+                          for chunk, members in zip(allocation["allocations"], group)]
+                described = []
+                for chunk, members, future in zip(allocation["allocations"], group, stored):
+                    stored_on = future.result()
+                    if not stored_on:
+                        group_failed.extend(filename for filename, _ in members)
+                        continue
+                    entries = []
+                    offset = 0
+                    for filename, data in members:
+                        entries.append({"filename": filename, "offset": offset, "length": len(data)})
+                        offset += len(data)
+                    described.append({"chunk_id": chunk["chunk_id"], "servers": stored_on, "files": entries})
                 
-                with urllib.request.urlopen(req, timeout=10) as response:
-                    result = json.loads(response.read().decode())
-                    print(f"[CLIENT] Uploaded {chunk_id} to {server_id}: {result}")
-                    success = True
-            
+                if described:
+                    result = master_call("commit_packs", "POST", {
+                        "packs": described,
+                        "encryption": "chunk" if encrypt else None
+                    })
+                    committed += result["files"]
+            except Exception as e:
+                # Stored packs that were never committed are orphans, GC reclaims them
+                print(f"[CLIENT] Packed upload of {len(names)} files failed: {e}")
+                group_failed = names
+            failed.extend(group_failed)
+    
+    UPLOADS.inc(("completed",), amount=committed)
+    if failed:
+        UPLOADS.inc(("failed",), amount=len(failed))
+    print(f"[CLIENT] Uploaded {committed} small files in {len(packs)} packs ({len(failed)} failed)")
+    return {"files": committed, "packs": len(packs), "failed": failed}
+
+def lookup_file(filename):
+    """Get chunk locations from a shadow master, falling back to the primary"""
+    query = urlencode({'filename': filename})
+    if SHADOW_URLS:
+        shadow_url = SHADOW_URLS[next(shadow_cursor) % len(SHADOW_URLS)]
+        try:
+            return connection_pool.get_json(f"{shadow_url}/lookup?{query}")
+        except Exception:
+            # Too stale, unreachable, or has not replicated the file yet
+            SHADOW_FALLBACKS.inc()
+    return connection_pool.get_json(f"{MASTER_URL}/lookup?{query}")
+
+def read_chunk(addresses, server_id, chunk, cancel=None):
+    """A chunk's bytes from one replica, only its own range for a packed small file"""
+    if "length" in chunk:
+        info = addresses[server_id]
+        query = urlencode({"chunk_id": chunk["chunk_id"], "offset": chunk["offset"], "length": chunk["length"]})
+        status, body = connection_pool.request(info["host"], info["port"], "GET", f"/read?{query}", cancel=cancel)
+        if status >= 400:
+            raise RuntimeError(f"HTTP {status}: {body[:200]!r}")
+        return body
+    
+    result = connection_pool.get_json(f"{server_url(addresses, server_id)}/download/{chunk['chunk_id']}", cancel)
+    data = result["data"]
+    return base64.b64decode(data) if result["is_binary"] else data.encode()
+
+def timed_read(addresses, server_id, chunk, cancel=None):
+    """read_chunk, reporting how it went to the replica selector"""
+    kind = "range" if "length" in chunk else "chunk"
+    replica_selector.started(server_id)
+    start = time.perf_counter()
+    try:
+        data = read_chunk(addresses, server_id, chunk, cancel)
+    except RequestCancelled:
+        replica_selector.finished(server_id, kind, time.perf_counter() - start, lost=True)
+        raise
+    except Exception:
+        replica_selector.finished(server_id, kind)
+        raise
+    elapsed = time.perf_counter() - start
+    replica_selector.finished(server_id, kind, elapsed)
+    CHUNK_READ_LATENCY.observe(elapsed, (server_id,))
+    return data
+
+def fetch_chunk(addresses, chunk, hedge=HEDGE_READS):
+    """Read a chunk from its best replica, also asking the next best if the first is slow"""
+    candidates = deque(replica_selector.rank(chunk["servers"]))
+    kind = "range" if "length" in chunk else "chunk"
+    delay = replica_selector.hedge_delay(kind) if hedge and len(candidates) > 1 else None
+    
+    if delay is None:
+        while candidates:
+            server_id = candidates.popleft()
+            try:
+                return timed_read(addresses, server_id, chunk)
             except Exception as e:
-                print(f"[CLIENT] Failed to upload {chunk_id} to {server_id}: {e}")
+                print(f"[CLIENT] Failed to read {chunk['chunk_id']} from {server_id}: {e}")
+        raise RuntimeError(f"No replica available for {chunk['chunk_id']}")
+    
+    pending = {}  # future -> (server_id, cancel token)
+    
+    def launch():
+        server_id = candidates.popleft()
+        token = CancelToken()
+        pending[read_executor.submit(timed_read, addresses, server_id, chunk, token)] = (server_id, token)
+    
+    first = candidates[0]
+    launch()
+    hedged = False
+    while pending:
+        timeout = delay if candidates and not hedged else None
+        done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        if not done:
+            # Slower than most reads, race the next best replica
+            HEDGED_READS.inc()
+            hedged = True
+            launch()
+            continue
         
-        if success:
+        for future in done:
+            server_id, _ = pending.pop(future)
             try:
-                data = json.dumps({
-                    "filename": filename,
-                    "chunk_id": chunk_id,
-                    "servers": servers
-                }).encode()
-                
-                req = urllib.request.Request(
-                    f"{MASTER_URL}/register_chunk",
-                    data=data,
-                    headers={"Content-Type": "application/json"}
-                )
-                
-                with urllib.request.urlopen(req, timeout=10) as response:
-                    result = json.loads(response.read().decode())
-                    print(f"[CLIENT] Registered {chunk_id} with Master")
-            
+                data = future.result()
             except Exception as e:
-                print(f"[CLIENT] Failed to register {chunk_id}: {e}")
+                if not isinstance(e, RequestCancelled):
+                    print(f"[CLIENT] Failed to read {chunk['chunk_id']} from {server_id}: {e}")
+                continue
+            for loser, (_, token) in pending.items():
+                loser.cancel()
+                token.cancel()
+            if server_id != first:
+                HEDGE_WINS.inc()
+            return data
         
-        time.sleep(0.5)  
+        if not pending and candidates:
+            launch()
+    raise RuntimeError(f"No replica available for {chunk['chunk_id']}")
+
+def download_file(filename, decrypt=True, hedge=HEDGE_READS):
+    """Read a file back from its chunk replicas, decrypted as it was uploaded.
+    
+    The master records each upload's encryption mode; decrypt only decides for
+    files registered before that, which were encrypted whole if at all.
+    """
+    lookup = lookup_file(filename)
+    addresses = lookup["server_addresses"]
+    connection_pool.sync_health(addresses)
+    
+    mode = lookup["encryption"] if "encryption" in lookup else ("file" if decrypt else None)
+    cipher = generate_encryption_key() if mode else None
+    per_chunk = mode == "chunk"
+    
+    parts = []
+    for chunk in lookup["chunks"]:
+        data = fetch_chunk(addresses, chunk, hedge)
+        # Streamed uploads encrypt every chunk on its own
+        parts.append(decrypt_data(data, cipher) if cipher and per_chunk else data)
     
-    print(f"[CLIENT] Upload completed: {filename}")
-    return True
+    content = b"".join(parts)
+    return decrypt_data(content, cipher) if cipher and not per_chunk else content
 
-class ClientHandler(BaseHTTPRequestHandler):
-    def _set_headers(self, status=200):
+class ClientHandler(InstrumentedHandlerMixin, BaseHTTPRequestHandler):
+    metrics_routes = ("/upload", "/upload_stream", "/upload_batch", "/metrics")
+    
+    def _set_headers(self, status=200, content_length=0):
         self.send_response(status)
         self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(content_length))
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
         self.end_headers()
     
+    def _send_json(self, data, status=200):
+        body = json.dumps(data).encode()
+        self._set_headers(status, len(body))
+        self.wfile.write(body)
+    
     def do_OPTIONS(self):
         self._set_headers()
     
+    def do_GET(self):
+        if self.path == "/metrics":
+            self._handle_metrics()
+        else:
+            self._send_json({"error": "Not found"}, 404)
+    
     def do_POST(self):
-        if self.path == "/upload":
+        parsed = urlsplit(self.path)
+        auth = self.headers.get("Authorization", "")
+        caller.token = auth[len("Bearer "):] if auth.startswith("Bearer ") else None
+        if parsed.path == "/upload":
             self._handle_upload_request()
+        elif parsed.path == "/upload_stream":
+            self._handle_upload_stream(parse_qs(parsed.query))
+        elif parsed.path == "/upload_batch":
+            self._handle_upload_batch()
         else:
-            self._set_headers(404)
-            self.wfile.write(json.dumps({"error": "Not found"}).encode())
+            self._send_json({"error": "Not found"}, 404)
     
     def _handle_upload_request(self):
         """Handle upload request from web UI"""
@@ -167,30 +776,88 @@ class ClientHandler(BaseHTTPRequestHandler):
             if content_b64:
                 content = base64.b64decode(content_b64)
             
-            success = upload_file(filename, content, encrypt)
+            result = upload_file(filename, content, encrypt, data.get("upload_id"))
             
-            self._set_headers()
-            self.wfile.write(json.dumps({
-                "success": success,
-                "filename": filename,
+            self._send_json({
+                "success": True,
+                "filename": result["filename"],
+                "upload_id": result["upload_id"],
                 "size": len(content) if isinstance(content, (bytes, str)) else 0,
                 "encrypted": encrypt
-            }).encode())
+            })
+        
+        except UploadInterrupted as e:
+            self._send_json({"success": False, "error": str(e), "upload_id": e.upload_id}, 502)
         
         except Exception as e:
             print(f"[CLIENT] Error: {e}")
             import traceback
             traceback.print_exc()
-            self._set_headers(500)
-            self.wfile.write(json.dumps({"error": str(e)}).encode())
+            self._send_json({"error": str(e)}, 500)
+    
+    def _handle_upload_stream(self, query):
+        """Handle a raw upload, the body is the file and is read one chunk at a time"""
+        filename = query.get("filename", [None])[0]
+        encrypt = query.get("encrypt", ["1"])[0].lower() not in ("0", "false", "no")
+        length = self.headers.get('Content-Length')
+        
+        if not filename:
+            self._send_json({"error": "Missing filename"}, 400)
+            return
+        if length is None or not length.isdigit():
+            self._send_json({"error": "Content-Length required"}, 411)
+            return
+        length = int(length)
+        
+        try:
+            result = upload_stream(filename, self.rfile, length, encrypt, query.get("upload_id", [None])[0])
+            self._send_json({
+                "success": True,
+                "filename": result["filename"],
+                "upload_id": result["upload_id"],
+                "size": length,
+                "chunks_sent": result["chunks_sent"],
+                "encrypted": encrypt
+            })
+        
+        except UploadInterrupted as e:
+            # The rest of the body may be unread, don't reuse the connection
+            self.close_connection = True
+            self._send_json({"success": False, "error": str(e), "upload_id": e.upload_id}, 502)
+    
+    def _handle_upload_batch(self):
+        """Upload many small files at once, packed into shared chunks"""
+        content_length = int(self.headers.get('Content-Length', 0))
+        
+        try:
+            data = json.loads(self.rfile.read(content_length).decode())
+            encrypt = data.get("encrypt", True)
+            files = []
+            for entry in data["files"]:
+                content = entry.get("content", "")
+                if entry.get("content_base64"):
+                    content = base64.b64decode(entry["content_base64"])
+                files.append((entry["filename"], content))
+        except (KeyError, TypeError, ValueError) as e:
+            self._send_json({"error": f"Invalid batch: {e}"}, 400)
+            return
+        
+        result = upload_small_files(files, encrypt)
+        self._send_json({
+            "success": not result["failed"],
+            "files": result["files"],
+            "packs": result["packs"],
+            "failed": result["failed"],
+            "encrypted": encrypt
+        }, 200 if not result["failed"] else 502)
     
     def log_message(self, format, *args):
         """Suppress default logging"""
         pass
 
 def main():
-    server = HTTPServer(('0.0.0.0', 8001), ClientHandler)
-    print("[CLIENT] Client service started on port 8001")
+    server = HTTPServer(('0.0.0.0', CLIENT_PORT), ClientHandler)
+    print(f"[CLIENT] Client service started on port {CLIENT_PORT}")
     print("[CLIENT] Encryption enabled for all uploads")
     server.serve_forever()
 
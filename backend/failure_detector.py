@@ -0,0 +1,165 @@
+import heapq
+import math
+import threading
+import time
+from collections import deque
+from statistics import NormalDist
+
+ACTIVE = "active"
+SUSPECTED = "suspected"
+FAILED = "failed"
+RECOVERED = "recovered"  # transition only, the server is active again afterwards
+
+class _ServerHistory:
+    """Sliding window of heartbeat inter-arrival times for one server"""
+
+    def __init__(self, expected_interval, window):
+        self.intervals = deque(maxlen=window)
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.expected_interval = expected_interval
+        self.last_arrival = None
+        self.state = ACTIVE
+        self.generation = 0  # invalidates deadlines pushed before the latest heartbeat
+
+    def add(self, interval):
+        if len(self.intervals) == self.intervals.maxlen:
+            old = self.intervals[0]
+            self.total -= old
+            self.total_sq -= old * old
+        self.intervals.append(interval)
+        self.total += interval
+        self.total_sq += interval * interval
+
+    def mean_std(self, min_std_ratio, min_std):
+        if len(self.intervals) < 2:
+            # Bootstrap from the negotiated interval until there is history
+            mean = self.expected_interval
+            return mean, max(mean / 4, min_std)
+        n = len(self.intervals)
+        mean = self.total / n
+        variance = max(0.0, self.total_sq / n - mean * mean)
+        return mean, max(math.sqrt(variance), mean * min_std_ratio, min_std)
+
+class PhiAccrualDetector:
+    """Phi accrual failure detector with deadlines kept in a min-heap.
+
+    Each heartbeat pushes the time at which phi will cross the suspect
+    threshold. Checking pops only expired deadlines, so the cost is
+    O(expired log n) instead of a sweep over every server.
+
+    Heartbeat gaps have a long tail (GC pauses, network hiccups) that a normal
+    distribution underestimates, so failing additionally waits pause_intervals
+    mean intervals past the phi deadline. Suspicion does not, it is cheap.
+    """
+
+    def __init__(self, suspect_phi=5.0, fail_phi=8.0, window=100, min_std_ratio=0.1,
+                 min_std=0.2, max_timeout=None, pause_intervals=0.0):
+        self.suspect_phi = suspect_phi
+        self.fail_phi = fail_phi
+        self.window = window
+        self.min_std_ratio = min_std_ratio
+        self.min_std = min_std
+        self.max_timeout = max_timeout  # hard upper bound on silence before failing
+        self.pause_intervals = pause_intervals  # tolerated pause before failing, in mean intervals
+        self._z = {phi: self._z_score(phi) for phi in (suspect_phi, fail_phi)}
+        self._servers = {}
+        self._deadlines = []  # (deadline, server_id, generation, state to enter)
+        self._cond = threading.Condition()
+
+    @staticmethod
+    def _z_score(phi):
+        # phi = -log10(1 - CDF(z)) solved for z
+        return NormalDist().inv_cdf(1 - 10 ** -phi)
+
+    def phi(self, server_id, now=None):
+        """Current suspicion level of a server"""
+        now = time.time() if now is None else now
+        with self._cond:
+            history = self._servers.get(server_id)
+            if history is None or history.last_arrival is None:
+                return 0.0
+            mean, std = history.mean_std(self.min_std_ratio, self.min_std)
+            p_later = 1 - NormalDist(mean, std).cdf(now - history.last_arrival)
+            return -math.log10(max(p_later, 1e-300))
+
+    def state(self, server_id):
+        with self._cond:
+            history = self._servers.get(server_id)
+            return history.state if history else None
+
+    def _deadline(self, history, phi, pause=0.0):
+        mean, std = history.mean_std(self.min_std_ratio, self.min_std)
+        deadline = history.last_arrival + mean * (1 + pause) + std * self._z[phi]
+        if self.max_timeout is not None:
+            deadline = min(deadline, history.last_arrival + self.max_timeout)
+        return deadline
+
+    def heartbeat(self, server_id, now=None, expected_interval=None):
+        """Record a heartbeat, returns RECOVERED if the server was suspected or failed"""
+        now = time.time() if now is None else now
+        with self._cond:
+            history = self._servers.get(server_id)
+            if history is None:
+                history = self._servers[server_id] = _ServerHistory(expected_interval or 5.0, self.window)
+            elif history.last_arrival is not None:
+                history.add(now - history.last_arrival)
+            if expected_interval:
+                history.expected_interval = expected_interval
+
+            previous = history.state
+            history.last_arrival = now
+            history.state = ACTIVE
+            history.generation += 1
+
+            deadline = self._deadline(history, self.suspect_phi)
+            is_earliest = not self._deadlines or deadline < self._deadlines[0][0]
+            heapq.heappush(self._deadlines, (deadline, server_id, history.generation, SUSPECTED))
+            if is_earliest:
+                self._cond.notify()
+
+        return RECOVERED if previous != ACTIVE else None
+
+    def force_fail(self, server_id):
+        """Mark a server failed until its next heartbeat"""
+        with self._cond:
+            history = self._servers.get(server_id)
+            if history:
+                history.state = FAILED
+                history.generation += 1
+
+    def remove(self, server_id):
+        with self._cond:
+            self._servers.pop(server_id, None)
+
+    def expire(self, now=None):
+        """Pop expired deadlines, returns [(server_id, new_state)]"""
+        now = time.time() if now is None else now
+        transitions = []
+        with self._cond:
+            while self._deadlines and self._deadlines[0][0] <= now:
+                _, server_id, generation, target = heapq.heappop(self._deadlines)
+                history = self._servers.get(server_id)
+                # A newer heartbeat superseded this deadline
+                if history is None or history.generation != generation:
+                    continue
+
+                history.state = target
+                transitions.append((server_id, target))
+                if target == SUSPECTED:
+                    deadline = max(now, self._deadline(history, self.fail_phi, self.pause_intervals))
+                    heapq.heappush(self._deadlines, (deadline, server_id, generation, FAILED))
+        return transitions
+
+    def next_deadline(self):
+        with self._cond:
+            return self._deadlines[0][0] if self._deadlines else None
+
+    def wait_expired(self, timeout):
+        """Block until a deadline expires or timeout elapses, then expire"""
+        with self._cond:
+            next_deadline = self._deadlines[0][0] if self._deadlines else None
+            wait = timeout if next_deadline is None else min(timeout, max(0.0, next_deadline - time.time()))
+            if wait > 0:
+                self._cond.wait(wait)
+        return self.expire()
@@ -5,27 +5,106 @@ import threading
 import hashlib
 import secrets
 import socketserver
+import urllib.request
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count, islice
 from http.server import HTTPServer, BaseHTTPRequestHandler
-from urllib.parse import urlparse, parse_qs
+from urllib.parse import urlparse, parse_qs, urlencode
 from datetime import datetime, timedelta
+from metrics import Counter, Gauge, InstrumentedHandlerMixin, InstrumentedLock, RequestLog
+from admission import BULK, CONTROL, AdmissionController, AdmissionMixin, RateLimiter
+from failure_detector import FAILED, RECOVERED, PhiAccrualDetector
+from namespace import RESERVED_DIR, Namespace, NamespaceError, ancestors, normalize_path
 
 # Configuration
-HEARTBEAT_TIMEOUT = 15  # seconds
+HEARTBEAT_INTERVAL = float(os.environ.get("HEARTBEAT_INTERVAL", "5"))  # offered to chunk servers
+MIN_HEARTBEAT_INTERVAL = 0.5  # bounds for intervals requested by chunk servers
+MAX_HEARTBEAT_INTERVAL = 30
+HEARTBEAT_TIMEOUT = float(os.environ.get("HEARTBEAT_TIMEOUT", "15"))  # hard upper bound on silence
+HEARTBEAT_CHECK_INTERVAL = float(os.environ.get("HEARTBEAT_CHECK_INTERVAL", "5"))  # max sleep of the monitor
+PHI_SUSPECT_THRESHOLD = 5.0  # phi above which a server stops receiving new chunks
+PHI_FAIL_THRESHOLD = 8.0  # phi above which a server is failed and re-replicated
+FAIL_PAUSE_INTERVALS = float(os.environ.get("FAIL_PAUSE_INTERVALS", "1.5"))  # extra silence tolerated before failing
 REPLICATION_FACTOR = 2
+REREPLICATION_CONCURRENCY = int(os.environ.get("REREPLICATION_CONCURRENCY", "4"))  # chunk copies in flight after a failure
 CHUNK_SIZE = 1024 * 1024  # 1MB
-DATA_DIR = "/data/master"
+LIST_PAGE_SIZE = 100  # default /list page
+MAX_LIST_PAGE_SIZE = 1000
+DATA_DIR = os.environ.get("DATA_DIR", "/data/master")
+MASTER_PORT = int(os.environ.get("MASTER_PORT", "8000"))
+KEEPALIVE_TIMEOUT = 30  # seconds an idle persistent connection is kept open
 METADATA_FILE = f"{DATA_DIR}/chunks.json"
 USERS_FILE = f"{DATA_DIR}/users.json"
 SESSIONS_FILE = f"{DATA_DIR}/sessions.json"
 
+# Garbage collection
+TOMBSTONE_PREFIX = f"{RESERVED_DIR}/"  # deleted files are renamed under this hidden prefix
+TOMBSTONE_RETENTION = 3600  # seconds a deleted file is kept before its chunks are reclaimed
+GC_INTERVAL = 30  # seconds between garbage collection passes
+GC_BATCH_SIZE = 1000  # max chunk deletions handed to a server per heartbeat
+GC_SCAN_SLICE = 10000  # reported chunks checked per metadata_lock acquisition
+ORPHAN_GRACE_PERIOD = 300  # seconds an unknown chunk may live before it is reclaimed
+
+# Upload sessions
+UPLOAD_SESSION_TTL = 24 * 3600  # seconds an idle upload can still be resumed, then it is aborted
+
+# Small files packed into shared chunks
+PACK_PREFIX = "pack_"  # chunk ids of packs, never produced by chunk_handle
+MAX_PACKS_PER_CALL = 64  # packs allocated or committed per request
+
+# Rebalancing chunks across servers
+REBALANCE_INTERVAL = float(os.environ.get("REBALANCE_INTERVAL", "10"))  # seconds between checks when balanced
+REBALANCE_THRESHOLD = float(os.environ.get("REBALANCE_THRESHOLD", "0.05"))  # utilisation spread tolerated
+REBALANCE_BANDWIDTH = float(os.environ.get("REBALANCE_BANDWIDTH", str(20 * 1024 * 1024)))  # bytes/sec for all copies
+REBALANCE_CONCURRENCY = int(os.environ.get("REBALANCE_CONCURRENCY", "2"))  # chunk copies in flight
+REBALANCE_MAX_MOVES = 64  # moves planned per round, metadata is persisted after each round
+
+# Replication to shadow masters
+OPLOG_RETENTION = 100000  # mutations kept for shadows to catch up from, older ones need a snapshot
+REPLICATION_BATCH_SIZE = 5000  # max mutations per /replication_log response
+REPLICATION_MAX_WAIT = 5  # seconds a /replication_log long poll may wait for new mutations
+
+# Admission control
+WORKER_THREADS = int(os.environ.get("WORKER_THREADS", "16"))  # requests handled at once, 0 disables admission
+MAX_QUEUE = int(os.environ.get("MAX_QUEUE", "64"))  # requests of one class waiting for a worker before shedding
+QUEUE_TIMEOUT = 10  # seconds a request may wait for a worker
+RATE_LIMIT = float(os.environ.get("RATE_LIMIT", "0"))  # requests/sec per user (or address without a session), 0 disables
+RATE_BURST = float(os.environ.get("RATE_BURST", str(2 * RATE_LIMIT)))
+
+# Observability
+REQUEST_LOG_SAMPLE_RATE = 0.01  # fraction of successful requests logged, errors are always logged
+
 # Global state
 chunk_servers = {}
-metadata = {"files": {}, "chunks": {}}
+metadata = {"files": {}, "chunks": {}, "directories": {}, "uploads": {}}
+namespace = Namespace()  # directory tree over metadata["files"], rebuilt on load
 users = {}
 sessions = {}  # Store active sessions
-heartbeat_lock = threading.Lock()
-metadata_lock = threading.Lock()
-session_lock = threading.Lock()
+heartbeat_lock = InstrumentedLock("heartbeat_lock")
+metadata_lock = InstrumentedLock("metadata_lock")
+session_lock = InstrumentedLock("session_lock")
+
+# Garbage collection state
+chunk_reports = {}  # server_id -> chunk ids from its latest heartbeat report
+orphan_candidates = {}  # server_id -> {chunk_id: first time seen as orphan}
+gc_queue = {}  # server_id -> {chunk_id: None}, insertion ordered deletion queue
+incoming_moves = {}  # server_id -> chunk ids being copied onto it, never handed out for deletion
+lost_replicas = {}  # server_id -> chunk ids dropped from its replicas when it failed, guarded by metadata_lock
+gc_lock = InstrumentedLock("gc_lock")
+failure_detector = PhiAccrualDetector(PHI_SUSPECT_THRESHOLD, PHI_FAIL_THRESHOLD,
+                                      max_timeout=HEARTBEAT_TIMEOUT, pause_intervals=FAIL_PAUSE_INTERVALS)
+allocation_cursor = count()  # rotates the first replica so small files spread across servers
+rebalance_adjustments = []  # (server_id, bytes, heartbeat count from which its stats include the move)
+
+# Replication log, shadows follow it and re-apply each mutation
+oplog = deque(maxlen=OPLOG_RETENTION)  # (seq, mutation)
+oplog_seq = 0
+oplog_epoch = secrets.token_hex(8)  # changes on restart, the log is not persisted
+oplog_cond = threading.Condition()
+request_log = RequestLog(REQUEST_LOG_SAMPLE_RATE)
+admission_controller = AdmissionController(WORKER_THREADS, MAX_QUEUE, QUEUE_TIMEOUT)
+rate_limiter = RateLimiter(RATE_LIMIT, RATE_BURST)
 
 # Initialize data directory
 os.makedirs(DATA_DIR, exist_ok=True)
@@ -34,6 +113,7 @@ os.makedirs(DATA_DIR, exist_ok=True)
 class ThreadedHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
     """Handle requests in a separate thread."""
     daemon_threads = True
+    request_queue_size = 128  # listen backlog, the default of 5 drops connections under load
 
 def load_data():
     """Load metadata, users, and sessions from disk"""
@@ -43,6 +123,9 @@ def load_data():
     if os.path.exists(METADATA_FILE):
         with open(METADATA_FILE, 'r') as f:
             metadata = json.load(f)
+    metadata.setdefault("directories", {})
+    metadata.setdefault("uploads", {})
+    rebuild_namespace()
     
     # Load users or create defaults
     if os.path.exists(USERS_FILE):
@@ -77,11 +160,20 @@ def load_data():
         # Clean expired sessions
         clean_expired_sessions()
 
+def rebuild_namespace():
+    """Index every live file and explicit directory in the directory tree"""
+    namespace.rebuild((name for name in metadata["files"] if not is_tombstone(name)),
+                      metadata["directories"])
+
 def save_metadata():
     """Save metadata to disk"""
     with metadata_lock:
-        with open(METADATA_FILE, 'w') as f:
-            json.dump(metadata, f, indent=2)
+        _write_metadata()
+
+def _write_metadata():
+    """Write metadata to disk, caller must hold metadata_lock"""
+    with open(METADATA_FILE, 'w') as f:
+        json.dump(metadata, f, indent=2)
 
 def save_users():
     """Save users to disk"""
@@ -144,70 +236,1078 @@ def clean_expired_sessions():
             with open(SESSIONS_FILE, 'w') as f:
                 json.dump(sessions, f, indent=2)
 
-def register_chunk_server(server_id, host, port):
-    """Register or update a chunk server"""
+def log_mutation(op):
+    """Append a mutation to the replication log and wake waiting shadows"""
+    global oplog_seq
+    with oplog_cond:
+        oplog_seq += 1
+        oplog.append((oplog_seq, op))
+        oplog_cond.notify_all()
+        return oplog_seq
+
+def apply_mutation(op):
+    """Apply a logged mutation, caller must hold metadata_lock.
+    
+    The primary and shadow masters both go through here, so replaying the
+    log reproduces the primary's metadata exactly.
+    """
+    kind = op["op"]
+    files = metadata["files"]
+    chunks = metadata["chunks"]
+    
+    if kind == "register_chunk":
+        filename = op["filename"]
+        if filename not in files:
+            files[filename] = {"chunks": [], "upload_time": op["upload_time"]}
+            namespace.add_file(filename)
+        # A retried registration must not list the chunk twice
+        chunk_info = chunks.get(op["chunk_id"])
+        if chunk_info is None or chunk_info["filename"] != filename:
+            files[filename]["chunks"].append(op["chunk_id"])
+        chunks[op["chunk_id"]] = {"servers": list(op["servers"]), "filename": filename}
+    elif kind == "set_chunk_servers":
+        chunk_info = chunks.get(op["chunk_id"])
+        if chunk_info:
+            chunk_info["servers"] = list(op["servers"])
+    elif kind == "delete_file":
+        _tombstone_file(op["filename"], op["tombstone"], op["deleted_at"])
+        namespace.remove_file(op["filename"])
+    elif kind == "collect_file":
+        name = op["filename"]
+        released = 0
+        for chunk_id in files.pop(name)["chunks"]:
+            chunk_info = chunks.get(chunk_id)
+            if chunk_info is None:
+                continue
+            if "pack_files" in chunk_info:
+                # A pack is released with the last file stored in it
+                chunk_info["pack_files"] -= 1
+                if chunk_info["pack_files"] == 0:
+                    del chunks[chunk_id]
+                    released += 1
+            # A re-upload under the same name may have reclaimed the chunk id
+            elif chunk_info["filename"] == name:
+                del chunks[chunk_id]
+                released += 1
+        return released
+    elif kind == "mkdir":
+        metadata["directories"][op["path"]] = {"created": op["created"]}
+        namespace.mkdir(op["path"], parents=True)
+    elif kind == "begin_upload":
+        metadata["uploads"][op["upload_id"]] = {
+            "filename": op["filename"],
+            "num_chunks": op["num_chunks"],
+            "encryption": op["encryption"],
+            "created": op["time"],
+            "updated": op["time"],
+            "chunks": {}  # str(index) -> chunk id, acknowledged chunks only
+        }
+    elif kind == "ack_chunks":
+        upload_id = op["upload_id"]
+        session = metadata["uploads"][upload_id]
+        for index, chunk_id, servers in op["chunks"]:
+            session["chunks"][str(index)] = chunk_id
+            # Acknowledged chunks are known to GC and re-replication before the commit
+            chunk_info = chunks.setdefault(chunk_id, {"servers": [], "filename": session["filename"],
+                                                      "upload_id": upload_id})
+            chunk_info["servers"].extend(sid for sid in servers if sid not in chunk_info["servers"])
+        session["updated"] = op["time"]
+    elif kind == "commit_upload":
+        upload_id = op["upload_id"]
+        session = metadata["uploads"][upload_id]
+        filename = session["filename"]
+        if filename in files:
+            _tombstone_file(filename, op["tombstone"], op["time"])
+        else:
+            namespace.add_file(filename)
+        chunk_ids = [session["chunks"][str(index)] for index in range(session["num_chunks"])]
+        for chunk_id in chunk_ids:
+            chunk_info = chunks[chunk_id]
+            chunk_info["filename"] = filename
+            chunk_info.pop("upload_id", None)
+        # Recorded even when off, readers decrypt by it rather than by what they assume
+        files[filename] = {"chunks": chunk_ids, "upload_time": op["upload_time"],
+                           "encryption": session["encryption"]}
+        # Kept until it expires so a retried commit still succeeds
+        metadata["uploads"][upload_id] = {"filename": filename, "committed": op["upload_time"],
+                                          "updated": op["time"]}
+    elif kind == "commit_packs":
+        for pack in op["packs"]:
+            chunk_id = pack["chunk_id"]
+            chunks[chunk_id] = {"servers": list(pack["servers"]), "filename": None,
+                                "pack_files": len(pack["files"])}
+            for filename, offset, length in pack["files"]:
+                if filename in files:
+                    _tombstone_file(filename, op["tombstones"][filename], op["time"])
+                else:
+                    namespace.add_file(filename)
+                files[filename] = {"chunks": [chunk_id], "offset": offset, "length": length,
+                                   "upload_time": op["upload_time"], "encryption": op["encryption"]}
+    elif kind == "abort_upload":
+        upload_id = op["upload_id"]
+        session = metadata["uploads"].pop(upload_id, None)
+        for chunk_id in (session or {}).get("chunks", {}).values():
+            chunk_info = chunks.get(chunk_id)
+            # Stored replicas become orphans and are reclaimed by GC
+            if chunk_info and chunk_info.get("upload_id") == upload_id:
+                del chunks[chunk_id]
+    elif kind == "set_user":
+        users[op["username"]] = op["user"]
+    else:
+        raise ValueError(f"Unknown mutation: {kind}")
+
+def _tombstone_file(filename, tombstone, deleted_at):
+    """Move a file entry under a tombstone name, caller must hold metadata_lock"""
+    file_info = metadata["files"].pop(filename)
+    file_info["deleted_at"] = deleted_at
+    file_info["original_name"] = filename
+    metadata["files"][tombstone] = file_info
+    for chunk_id in file_info["chunks"]:
+        chunk_info = metadata["chunks"].get(chunk_id)
+        if chunk_info and chunk_info["filename"] == filename:
+            chunk_info["filename"] = tombstone
+
+def commit_mutation(op):
+    """Apply a metadata mutation and log it for shadows, caller must hold metadata_lock"""
+    result = apply_mutation(op)
+    log_mutation(op)
+    return result
+
+def log_user(username):
+    """Replicate a user's public fields, password hashes stay on the primary"""
+    info = users[username]
+    log_mutation({"op": "set_user", "username": username, "user": {
+        "role": info["role"],
+        "created_by": info.get("created_by", "unknown")
+    }})
+
+def replication_batch(since, epoch, wait=0):
+    """Return (latest seq, mutations after since), or (latest seq, None) if a snapshot is needed"""
+    with oplog_cond:
+        if epoch == oplog_epoch and since == oplog_seq and wait > 0:
+            oplog_cond.wait_for(lambda: oplog_seq > since, timeout=wait)
+        
+        behind = oplog_seq - since
+        first_seq = oplog[0][0] if oplog else oplog_seq + 1
+        # A restarted primary or a shadow that fell out of the retained log must resync
+        if epoch != oplog_epoch or behind < 0 or since + 1 < first_seq:
+            return oplog_seq, None
+        
+        # Shadows normally trail by a few entries, so walk from the newest end
+        newest = list(islice(reversed(oplog), behind))
+        newest.reverse()
+        return oplog_seq, newest[:REPLICATION_BATCH_SIZE]
+
+def replication_snapshot():
+    """Encode metadata, public user fields and the log position they correspond to"""
+    with metadata_lock:
+        # Metadata mutations are logged under metadata_lock, so seq matches exactly
+        seq = oplog_seq
+        # set_user is idempotent, users changed after seq are simply replayed
+        public_users = {username: {"role": info["role"], "created_by": info.get("created_by", "unknown")}
+                        for username, info in list(users.items())}
+        return json.dumps({
+            "epoch": oplog_epoch,
+            "seq": seq,
+            "metadata": metadata,
+            "users": public_users
+        }).encode()
+
+def chunk_server_table():
+    """Chunk server state as shown on /status, shadows copy it wholesale"""
     with heartbeat_lock:
-        chunk_servers[server_id] = {
+        return {sid: {
+            "status": info["status"],
+            "last_heartbeat": info["last_heartbeat"],
+            "host": info["host"],
+            "port": info["port"],
+            "phi": round(failure_detector.phi(sid), 2),
+            "used_bytes": info.get("stats", {}).get("used_bytes"),
+            "capacity_bytes": info.get("stats", {}).get("capacity_bytes"),
+            "utilization": utilization(info.get("stats"))
+        } for sid, info in chunk_servers.items()}
+
+def utilization(stats):
+    """Fraction of a server's capacity in use, None before it reported storage stats"""
+    if not stats or not stats.get("capacity_bytes"):
+        return None
+    return round(stats["used_bytes"] / stats["capacity_bytes"], 4)
+
+def negotiate_heartbeat_interval(requested):
+    """Agree on a heartbeat interval, chunk servers may ask for one within bounds"""
+    try:
+        requested = float(requested)
+    except (TypeError, ValueError):
+        return HEARTBEAT_INTERVAL
+    return min(max(requested, MIN_HEARTBEAT_INTERVAL), MAX_HEARTBEAT_INTERVAL)
+
+def register_chunk_server(server_id, host, port, heartbeat_interval=HEARTBEAT_INTERVAL, stats=None):
+    """Register or update a chunk server, stats is the storage usage it reported"""
+    now = time.time()
+    transition = failure_detector.heartbeat(server_id, now, heartbeat_interval)
+    
+    with heartbeat_lock:
+        info = chunk_servers.get(server_id)
+        is_new = info is None
+        if is_new:
+            info = chunk_servers[server_id] = {}
+        info.update({
             "host": host,
             "port": port,
-            "last_heartbeat": time.time(),
-            "status": "active"
-        }
-    print(f"[MASTER] Registered chunk server: {server_id}")
+            "last_heartbeat": now,
+            "status": "active",
+            "heartbeat_interval": heartbeat_interval,
+            "beats": info.get("beats", 0) + 1
+        })
+        if stats:
+            info["stats"] = stats
+        if transition == RECOVERED and not is_new:
+            info["recovered_at"] = now
+    
+    if is_new:
+        print(f"[MASTER] Registered chunk server: {server_id}")
+    elif transition == RECOVERED:
+        print(f"[MASTER] Server {server_id} RECOVERED")
+
+def server_addresses(server_ids=None):
+    """Return host, port and status for chunk servers, as reported in heartbeats"""
+    with heartbeat_lock:
+        return {sid: {"host": info["host"], "port": info["port"], "status": info["status"]}
+                for sid, info in chunk_servers.items()
+                if server_ids is None or sid in server_ids}
 
 def check_heartbeats():
-    """Monitor chunk server heartbeats and detect failures"""
+    """Apply failure detector transitions as heartbeat deadlines expire"""
+    last_session_clean = time.time()
+    
     while True:
-        time.sleep(5)
-        current_time = time.time()
+        transitions = failure_detector.wait_expired(HEARTBEAT_CHECK_INTERVAL)
         
         with heartbeat_lock:
-            for server_id, info in chunk_servers.items():
-                if info["status"] == "active":
-                    if current_time - info["last_heartbeat"] > HEARTBEAT_TIMEOUT:
-                        info["status"] = "failed"
-                        print(f"[MASTER] Server {server_id} marked as FAILED")
-                        threading.Thread(target=re_replicate_chunks, args=(server_id,), daemon=True).start()
+            for server_id, state in transitions:
+                info = chunk_servers.get(server_id)
+                # A heartbeat may have arrived since the deadline expired
+                if info is None or failure_detector.state(server_id) != state:
+                    continue
+                
+                info["status"] = state
+                print(f"[MASTER] Server {server_id} marked as {state.upper()}")
+                if state == FAILED:
+                    threading.Thread(target=re_replicate_chunks, args=(server_id,), daemon=True).start()
         
         # Clean expired sessions periodically
-        clean_expired_sessions()
+        if time.time() - last_session_clean >= HEARTBEAT_CHECK_INTERVAL:
+            clean_expired_sessions()
+            last_session_clean = time.time()
 
 def re_replicate_chunks(failed_server):
-    """Re-replicate chunks from a failed server"""
+    """Drop a failed server's replicas and copy chunks left under-replicated to active servers.
+    
+    A server is only listed for a chunk once its copy matches a live replica.
+    Chunks with no live replica left wait for the failed server to come back
+    and report them, see find_orphan_chunks.
+    """
     print(f"[MASTER] Starting re-replication for failed server: {failed_server}")
+    REREPLICATIONS_IN_PROGRESS.inc()
     
-    with metadata_lock:
-        active_servers = [sid for sid, info in chunk_servers.items() 
-                         if info["status"] == "active"]
+    try:
+        with metadata_lock:
+            dropped = [chunk_id for chunk_id, chunk_info in metadata["chunks"].items()
+                       if failed_server in chunk_info["servers"]]
+            for chunk_id in dropped:
+                servers = [sid for sid in metadata["chunks"][chunk_id]["servers"] if sid != failed_server]
+                commit_mutation({"op": "set_chunk_servers", "chunk_id": chunk_id, "servers": servers})
+            lost_replicas.setdefault(failed_server, set()).update(dropped)
+            _write_metadata()
         
+        active_servers = active_server_ids()
         if not active_servers:
             print("[MASTER] No active servers for re-replication!")
             return
         
-        # Find chunks on failed server
-        for chunk_id, chunk_info in metadata["chunks"].items():
-            if failed_server in chunk_info["servers"]:
-                # Remove failed server
-                chunk_info["servers"].remove(failed_server)
-                
-                # Add to new server if below replication factor
-                if len(chunk_info["servers"]) < REPLICATION_FACTOR:
-                    new_server = active_servers[hash(chunk_id) % len(active_servers)]
-                    if new_server not in chunk_info["servers"]:
-                        chunk_info["servers"].append(new_server)
-                        print(f"[MASTER] Re-replicating {chunk_id} to {new_server}")
+        copies = []
+        with metadata_lock:
+            for chunk_id in dropped:
+                chunk_info = metadata["chunks"].get(chunk_id)
+                if chunk_info is None or len(chunk_info["servers"]) >= REPLICATION_FACTOR:
+                    continue
+                sources = [sid for sid in chunk_info["servers"] if sid in active_servers]
+                targets = [sid for sid in active_servers if sid not in chunk_info["servers"]]
+                if sources and targets:
+                    copies.append((chunk_id, sources[0], targets[hash(chunk_id) % len(targets)]))
+        
+        def attempt(copy):
+            chunk_id, source, destination = copy
+            try:
+                return add_replica(chunk_id, source, destination) is not None
+            except Exception as e:
+                print(f"[MASTER] Re-replicating {chunk_id} from {source} to {destination} failed: {e}")
+                return False
+        
+        with ThreadPoolExecutor(max_workers=REREPLICATION_CONCURRENCY) as executor:
+            replicated = sum(executor.map(attempt, copies))
+        if replicated:
+            save_metadata()
+        print(f"[MASTER] Re-replicated {replicated} of {len(copies)} chunks from {failed_server}")
+    finally:
+        REREPLICATIONS_IN_PROGRESS.dec()
+
+def is_tombstone(filename):
+    """Check whether a file entry is a deleted file awaiting collection"""
+    return filename.startswith(TOMBSTONE_PREFIX)
+
+def tombstone_name(filename, deleted_at):
+    """Unused tombstone name for a file deleted at deleted_at, caller must hold metadata_lock"""
+    tombstone = f"{TOMBSTONE_PREFIX}{int(deleted_at)}/{filename}"
+    n = 1
+    while tombstone in metadata["files"]:
+        tombstone = f"{TOMBSTONE_PREFIX}{int(deleted_at)}-{n}/{filename}"
+        n += 1
+    return tombstone
+
+def delete_file(filename):
+    """Rename a file to a hidden tombstone, its chunks are reclaimed lazily by GC"""
+    deleted_at = time.time()
+    
+    with metadata_lock:
+        if filename not in metadata["files"] or is_tombstone(filename):
+            return None
+        
+        tombstone = tombstone_name(filename, deleted_at)
+        commit_mutation({"op": "delete_file", "filename": filename, "tombstone": tombstone,
+                         "deleted_at": deleted_at})
+        _write_metadata()
+    
+    print(f"[MASTER] Deleted {filename} (tombstone: {tombstone})")
+    return tombstone
+
+def chunk_handle(filename, index, upload_id=None):
+    """Chunk id for a file's index-th chunk, flat so it can name a file on a chunk server"""
+    escaped = filename.replace('%', '%25').replace('/', '%2F')
+    if upload_id:
+        # Unique per upload, a re-upload never overwrites the chunks of the live file
+        return f"{escaped}_{upload_id}_chunk_{index}"
+    return f"{escaped}_chunk_{index}"
+
+def active_server_ids():
+    with heartbeat_lock:
+        return [sid for sid, info in chunk_servers.items() if info["status"] == "active"]
+
+def place_chunk(active_servers, offset, index):
+    """Replica servers for a chunk, rotated by offset so small files spread across servers"""
+    return [active_servers[j % len(active_servers)]
+            for j in range(offset + index, offset + index + min(REPLICATION_FACTOR, len(active_servers)))]
+
+def upload_allocations(upload_id, session, indexes):
+    """Fresh replica placement for the given chunks of an upload session"""
+    active_servers = active_server_ids()
+    if not active_servers:
+        return [], {}
+    offset = next(allocation_cursor)
+    allocations = [{
+        "chunk_id": chunk_handle(session["filename"], index, upload_id),
+        "servers": place_chunk(active_servers, offset, index),
+        "index": index
+    } for index in indexes]
+    return allocations, server_addresses(active_servers)
+
+class UploadError(Exception):
+    """An upload session request that cannot be applied, status is the HTTP code to answer with"""
+    
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+def begin_upload(filename, filesize, encryption=None):
+    """Open an upload session, raises NamespaceError if filename cannot be a file"""
+    upload_id = secrets.token_hex(8)
+    with metadata_lock:
+        namespace.check_file(filename)
+        commit_mutation({
+            "op": "begin_upload",
+            "upload_id": upload_id,
+            "filename": filename,
+            "num_chunks": (filesize + CHUNK_SIZE - 1) // CHUNK_SIZE,
+            "encryption": encryption,
+            "time": time.time()
+        })
+        _write_metadata()
+    return upload_id
+
+def upload_status(upload_id):
+    """A session's progress, None if there is no such upload"""
+    with metadata_lock:
+        session = metadata["uploads"].get(upload_id)
+        if session is None:
+            return None
+        if "committed" in session:
+            return {"upload_id": upload_id, "filename": session["filename"], "committed": True, "missing": []}
+        acked = session["chunks"]
+        missing = [index for index in range(session["num_chunks"]) if str(index) not in acked]
+        return {
+            "upload_id": upload_id,
+            "filename": session["filename"],
+            "num_chunks": session["num_chunks"],
+            "encryption": session["encryption"],
+            "committed": False,
+            "acked": len(acked),
+            "missing": missing
+        }
+
+def ack_chunks(upload_id, acked):
+    """Record chunks as durably stored, acked is [(index, servers)]. Acking twice is harmless"""
+    with metadata_lock:
+        session = metadata["uploads"].get(upload_id)
+        if session is None:
+            raise UploadError(f"Unknown upload: {upload_id}", 404)
+        if "committed" in session:
+            return 0
+        entries = []
+        for index, servers in acked:
+            index = int(index)
+            if not 0 <= index < session["num_chunks"] or not servers:
+                raise UploadError(f"Invalid chunk acknowledgement: {index}")
+            entries.append([index, chunk_handle(session["filename"], index, upload_id), list(servers)])
+        commit_mutation({"op": "ack_chunks", "upload_id": upload_id, "chunks": entries, "time": time.time()})
+        _write_metadata()
+        return session["num_chunks"] - len(session["chunks"])
+
+def commit_upload(upload_id):
+    """Publish a completed upload as its file in one mutation.
+    
+    Returns (filename, missing chunk indexes), the file is only committed when
+    nothing is missing. An existing file of that name is replaced and its
+    chunks are reclaimed by GC like a deleted file.
+    """
+    now = time.time()
+    with metadata_lock:
+        session = metadata["uploads"].get(upload_id)
+        if session is None:
+            raise UploadError(f"Unknown upload: {upload_id}", 404)
+        filename = session["filename"]
+        if "committed" in session:
+            return filename, []
+        num_chunks = session["num_chunks"]
+        missing = [index for index in range(num_chunks) if str(index) not in session["chunks"]]
+        if missing:
+            return filename, missing
+        # The path may have become a directory since the upload began
+        namespace.check_file(filename)
+        
+        replaced = filename in metadata["files"]
+        commit_mutation({
+            "op": "commit_upload",
+            "upload_id": upload_id,
+            "upload_time": datetime.now().isoformat(),
+            "tombstone": tombstone_name(filename, now) if replaced else None,
+            "time": now
+        })
+        _write_metadata()
+    
+    print(f"[MASTER] Committed upload {upload_id}: {filename} ({num_chunks} chunks)")
+    return filename, []
+
+def abort_upload(upload_id):
+    """Drop an upload session, its stored chunks become orphans. Returns False if unknown"""
+    with metadata_lock:
+        if upload_id not in metadata["uploads"]:
+            return False
+        commit_mutation({"op": "abort_upload", "upload_id": upload_id})
+        _write_metadata()
+    return True
+
+def expire_upload_sessions(now):
+    """Abort uploads idle past UPLOAD_SESSION_TTL and forget old commits"""
+    with metadata_lock:
+        expired = [upload_id for upload_id, session in metadata["uploads"].items()
+                   if now - session["updated"] > UPLOAD_SESSION_TTL]
+        for upload_id in expired:
+            commit_mutation({"op": "abort_upload", "upload_id": upload_id})
+        if expired:
+            _write_metadata()
+    return len(expired)
+
+def allocate_packs(count):
+    """Fresh pack chunk ids with replica placements, ([], {}) without active servers"""
+    active_servers = active_server_ids()
+    if not active_servers:
+        return [], {}
+    offset = next(allocation_cursor)
+    allocations = [{
+        "chunk_id": f"{PACK_PREFIX}{secrets.token_hex(8)}",
+        "servers": place_chunk(active_servers, offset, i)
+    } for i in range(count)]
+    return allocations, server_addresses(active_servers)
+
+def commit_packs(packs, encryption=None):
+    """Publish small files stored in shared pack chunks, all of them in one mutation.
+    
+    packs is [{"chunk_id", "servers", "files": [{"filename", "offset", "length"}]}].
+    Each file is recorded as a byte range of its pack, existing files of the
+    same names are replaced. Returns the number of files committed.
+    """
+    now = time.time()
+    entries = []
+    names = set()
+    with metadata_lock:
+        for pack in packs:
+            chunk_id = pack["chunk_id"]
+            if not str(chunk_id).startswith(PACK_PREFIX) or chunk_id in metadata["chunks"]:
+                raise UploadError(f"Invalid or reused pack: {chunk_id}")
+            if not pack["servers"]:
+                raise UploadError(f"Pack {chunk_id} is not stored on any server")
+            files = []
+            for entry in pack["files"]:
+                filename = normalize_path(entry["filename"])
+                namespace.check_file(filename)
+                offset, length = int(entry["offset"]), int(entry["length"])
+                if offset < 0 or length < 0 or offset + length > CHUNK_SIZE:
+                    raise UploadError(f"Invalid byte range for {filename}")
+                if filename in names:
+                    raise UploadError(f"{filename} appears twice", 409)
+                names.add(filename)
+                files.append([filename, offset, length])
+            entries.append({"chunk_id": chunk_id, "servers": list(pack["servers"]), "files": files})
+        
+        # A file and a directory of the same name cannot both come from one batch
+        for filename in names:
+            if any(parent in names for parent in ancestors(filename)):
+                raise NamespaceError(f"Not a directory: {filename}", 409)
         
+        tombstones = {filename: tombstone_name(filename, now) for filename in names
+                      if filename in metadata["files"]}
+        
+        commit_mutation({
+            "op": "commit_packs",
+            "packs": entries,
+            "encryption": encryption,
+            "tombstones": tombstones,
+            "upload_time": datetime.now().isoformat(),
+            "time": now
+        })
+        _write_metadata()
+    
+    print(f"[MASTER] Committed {len(names)} small files in {len(entries)} packs")
+    return len(names)
+
+def make_directory(path, parents=False):
+    """Create a directory, returns False if it already existed"""
+    with metadata_lock:
+        if not namespace.check_mkdir(path, parents):
+            return False
+        commit_mutation({"op": "mkdir", "path": path, "created": datetime.now().isoformat()})
+        _write_metadata()
+    return True
+
+def list_directory(path, prefix="", after="", limit=LIST_PAGE_SIZE):
+    """One page of a directory listing with file details, in name order"""
+    entries, truncated = namespace.list(path, prefix, after, limit)
+    files = metadata["files"]
+    listing = []
+    for name, is_dir in entries:
+        full_path = f"{path}/{name}" if path else name
+        if is_dir:
+            listing.append({"name": name, "path": full_path, "type": "directory"})
+            continue
+        # Single dict reads need no metadata_lock, the entry may be a moment old
+        file_info = files.get(full_path, {})
+        listing.append({
+            "name": name,
+            "path": full_path,
+            "type": "file",
+            "chunks": len(file_info.get("chunks", [])),
+            "upload_time": file_info.get("upload_time")
+        })
+    return listing, (entries[-1][0] if truncated else None)
+
+def stat_path(path):
+    """Describe a file or directory, raises NamespaceError if it does not exist"""
+    kind, entries = namespace.stat(path)
+    if kind == "directory":
+        info = metadata["directories"].get(path, {})
+        return {"path": path, "type": kind, "entries": entries, "created": info.get("created")}
+    file_info = metadata["files"].get(path, {})
+    return {
+        "path": path,
+        "type": kind,
+        "chunks": len(file_info.get("chunks", [])),
+        "upload_time": file_info.get("upload_time")
+    }
+
+def collect_deleted_files(now):
+    """Drop tombstones past retention along with the chunks they own"""
+    with metadata_lock:
+        expired = [name for name, info in metadata["files"].items()
+                   if is_tombstone(name) and now - info.get("deleted_at", 0) > TOMBSTONE_RETENTION]
+    
+    released = 0
+    pending = iter(expired)
+    while True:
+        # Release metadata_lock every GC_SCAN_SLICE chunks to keep foreground latency flat
+        with metadata_lock:
+            budget = GC_SCAN_SLICE
+            for name in pending:
+                file_info = metadata["files"].get(name)
+                if file_info is None:
+                    continue
+                budget -= len(file_info["chunks"])
+                released += commit_mutation({"op": "collect_file", "filename": name})
+                if budget <= 0:
+                    break
+            else:
+                break
+    
+    if expired:
         save_metadata()
+    
+    return len(expired), released
+
+def find_orphan_chunks(server_id, reported_chunks):
+    """Return reported chunks the metadata does not place on this server.
+    
+    Replicas dropped when the server failed are adopted back instead while
+    their chunk is still under-replicated.
+    """
+    with heartbeat_lock:
+        active = chunk_servers.get(server_id, {}).get("status") == "active"
+    if not active:
+        return []  # reported before the server failed, its chunks may be adopted back later
+    
+    orphans = []
+    adopted = 0
+    
+    # Scan in slices so foreground requests can take metadata_lock in between
+    for start in range(0, len(reported_chunks), GC_SCAN_SLICE):
+        with metadata_lock:
+            chunks = metadata["chunks"]
+            lost = lost_replicas.get(server_id, ())
+            for chunk_id in reported_chunks[start:start + GC_SCAN_SLICE]:
+                chunk_info = chunks.get(chunk_id)
+                if chunk_info is not None and server_id in chunk_info["servers"]:
+                    continue
+                if chunk_id in lost and chunk_info is not None and len(chunk_info["servers"]) < REPLICATION_FACTOR:
+                    commit_mutation({"op": "set_chunk_servers", "chunk_id": chunk_id,
+                                     "servers": chunk_info["servers"] + [server_id]})
+                    adopted += 1
+                else:
+                    orphans.append(chunk_id)
+    
+    with metadata_lock:
+        # A full report settles every lost replica, it was adopted or has been replaced
+        lost_replicas.pop(server_id, None)
+        if adopted:
+            _write_metadata()
+    if adopted:
+        print(f"[MASTER] Adopted {adopted} replicas back from recovered server {server_id}")
+    
+    return orphans
+
+def queue_orphan_chunks(server_id, orphans, now):
+    """Queue orphans that outlived the grace period for deletion"""
+    previous = orphan_candidates.get(server_id, {})
+    candidates = {}
+    expired = []
+    
+    for chunk_id in orphans:
+        first_seen = previous.get(chunk_id, now)
+        # Recent chunks may belong to an upload that has not registered yet
+        if now - first_seen >= ORPHAN_GRACE_PERIOD:
+            expired.append(chunk_id)
+        else:
+            candidates[chunk_id] = first_seen
+    
+    with gc_lock:
+        orphan_candidates[server_id] = candidates
+        queue = gc_queue.setdefault(server_id, {})
+        for chunk_id in expired:
+            queue[chunk_id] = None
+    
+    return len(expired)
+
+def next_gc_batch(server_id):
+    """Pop the next batch of chunk deletions for a server"""
+    with gc_lock:
+        queue = gc_queue.get(server_id)
+        if not queue:
+            return []
+        
+        batch = list(islice(queue, GC_BATCH_SIZE))
+        for chunk_id in batch:
+            del queue[chunk_id]
+        
+        # A chunk queued as an orphan may since have been moved or re-replicated onto this server.
+        # metadata_lock is taken before gc_lock elsewhere; servers lists are only ever replaced
+        # whole, so they are read here without it.
+        moving = incoming_moves.get(server_id, ())
+        chunks = metadata["chunks"]
+        return [chunk_id for chunk_id in batch
+                if chunk_id not in moving and server_id not in chunks.get(chunk_id, {}).get("servers", ())]
+
+def forget_deletion(server_id, chunk_id):
+    """Drop a chunk from a server's deletion queue and orphan candidates, call with gc_lock held"""
+    gc_queue.get(server_id, {}).pop(chunk_id, None)
+    orphan_candidates.get(server_id, {}).pop(chunk_id, None)
 
-class MasterHandler(BaseHTTPRequestHandler):
-    def _set_headers(self, status=200):
+def run_gc_pass(now=None):
+    """Run one garbage collection pass and return its statistics"""
+    now = now or time.time()
+    files_collected, chunks_released = collect_deleted_files(now)
+    uploads_expired = expire_upload_sessions(now)
+    
+    with gc_lock:
+        reports = list(chunk_reports.items())
+        chunk_reports.clear()
+    
+    chunks_scanned = 0
+    chunks_queued = 0
+    for server_id, reported_chunks in reports:
+        orphans = find_orphan_chunks(server_id, reported_chunks)
+        chunks_scanned += len(reported_chunks)
+        chunks_queued += queue_orphan_chunks(server_id, orphans, now)
+    
+    with gc_lock:
+        backlog = sum(len(queue) for queue in gc_queue.values())
+    
+    return {
+        "files_collected": files_collected,
+        "chunks_released": chunks_released,
+        "chunks_scanned": chunks_scanned,
+        "chunks_queued": chunks_queued,
+        "uploads_expired": uploads_expired,
+        "deletion_backlog": backlog
+    }
+
+def garbage_collector():
+    """Periodically reclaim deleted files and orphaned chunks"""
+    while True:
+        time.sleep(GC_INTERVAL)
+        
+        try:
+            stats = run_gc_pass()
+        except Exception as e:
+            print(f"[MASTER] Garbage collection failed: {e}")
+            continue
+        
+        GC_CHUNKS_QUEUED.inc(amount=stats["chunks_queued"])
+        GC_FILES_COLLECTED.inc(amount=stats["files_collected"])
+        
+        if stats["files_collected"] or stats["chunks_queued"]:
+            print(f"[MASTER] GC collected {stats['files_collected']} files, "
+                  f"queued {stats['chunks_queued']} chunks for deletion "
+                  f"(backlog: {stats['deletion_backlog']})")
+        if stats["uploads_expired"]:
+            print(f"[MASTER] GC aborted {stats['uploads_expired']} expired upload sessions")
+
+def server_usage():
+    """{server_id: [used bytes, capacity, chunks]} of active servers.
+    
+    Heartbeat stats trail the rebalancer: a copy shows up in the destination's
+    next report, a deletion only after the source was handed it in a
+    heartbeat reply. Moves its stats do not include yet are added back in.
+    """
+    with heartbeat_lock:
+        beats = {sid: info.get("beats", 0) for sid, info in chunk_servers.items()}
+        usage = {sid: [info["stats"]["used_bytes"], info["stats"]["capacity_bytes"], info["stats"]["chunks"]]
+                 for sid, info in chunk_servers.items()
+                 if info["status"] == "active" and utilization(info.get("stats")) is not None}
+    
+    pending = []
+    for server_id, size, reported_from in rebalance_adjustments:
+        if beats.get(server_id, reported_from) < reported_from:
+            pending.append((server_id, size, reported_from))
+            if server_id in usage:
+                usage[server_id][0] += size
+                usage[server_id][2] += 1 if size > 0 else -1
+    rebalance_adjustments[:] = pending
+    return usage
+
+def rebalance_candidates(server_ids):
+    """{server_id: [chunk_id]} of committed chunks with a replica on each of the given servers"""
+    candidates = {sid: [] for sid in server_ids}
+    chunk_ids = list(metadata["chunks"])
+    # Scan in slices so foreground requests can take metadata_lock in between
+    for start in range(0, len(chunk_ids), GC_SCAN_SLICE):
+        with metadata_lock:
+            for chunk_id in chunk_ids[start:start + GC_SCAN_SLICE]:
+                chunk_info = metadata["chunks"].get(chunk_id)
+                # Chunks of open upload sessions still get acknowledgements naming their servers
+                if chunk_info is None or "upload_id" in chunk_info:
+                    continue
+                for server_id in chunk_info["servers"]:
+                    if server_id in candidates:
+                        candidates[server_id].append(chunk_id)
+    return candidates
+
+def plan_moves(usage, max_moves=REBALANCE_MAX_MOVES):
+    """Greedy moves from the fullest server to the emptiest until the spread is within threshold.
+    
+    Returns [(chunk_id, source, destination)]. Chunk sizes are estimated from
+    the source's average, the real sizes are accounted once copies finish.
+    """
+    if len(usage) < 2:
+        return []
+    projected = {sid: [used, capacity, chunks] for sid, (used, capacity, chunks) in usage.items()}
+    
+    def fill(sid):
+        return projected[sid][0] / projected[sid][1]
+    
+    if max(map(fill, projected)) - min(map(fill, projected)) <= REBALANCE_THRESHOLD:
+        return []
+    
+    target = sum(used for used, _, _ in usage.values()) / sum(capacity for _, capacity, _ in usage.values())
+    candidates = rebalance_candidates([sid for sid in usage if usage[sid][0] / usage[sid][1] > target])
+    placed = {}  # chunk_id -> servers, as planned so far
+    with metadata_lock:
+        for sid, chunk_ids in candidates.items():
+            for chunk_id in chunk_ids:
+                chunk_info = metadata["chunks"].get(chunk_id)
+                if chunk_info is not None and chunk_id not in placed:
+                    placed[chunk_id] = set(chunk_info["servers"])
+    
+    moves = []
+    while len(moves) < max_moves:
+        source = max(projected, key=fill)
+        destination = min(projected, key=fill)
+        if fill(source) - fill(destination) <= REBALANCE_THRESHOLD:
+            break
+        
+        pool = candidates.get(source, [])
+        while pool and (destination in placed.get(pool[-1], ()) or source not in placed.get(pool[-1], ())):
+            pool.pop()
+        if not pool:
+            # Nothing left to move off the fullest server this round
+            projected.pop(source)
+            if len(projected) < 2:
+                break
+            continue
+        
+        chunk_id = pool.pop()
+        size = projected[source][0] / max(projected[source][2], 1)
+        projected[source][0] -= size
+        projected[source][2] -= 1
+        projected[destination][0] += size
+        projected[destination][2] += 1
+        placed[chunk_id] = (placed[chunk_id] - {source}) | {destination}
+        moves.append((chunk_id, source, destination))
+    
+    return moves
+
+def chunk_server_request(address, path, payload=None, timeout=60):
+    """Call a chunk server JSON endpoint, GET without payload"""
+    data = json.dumps(payload).encode() if payload is not None else None
+    req = urllib.request.Request(f"http://{address['host']}:{address['port']}{path}", data=data,
+                                 headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=timeout) as response:
+        return json.loads(response.read().decode())
+
+def copy_replica(chunk_id, source, destination, max_rate, place):
+    """Copy a chunk to destination, verify it against the source, then list it.
+    
+    place(servers) returns the chunk's new servers, or None if the chunk changed
+    meanwhile and the copy is not needed; it runs under metadata_lock. Returns
+    the bytes copied, or None if the copy was discarded.
+    """
+    addresses = server_addresses([source, destination])
+    with metadata_lock:
+        chunk_info = metadata["chunks"].get(chunk_id)
+        filename = chunk_info["filename"] if chunk_info else None
+    
+    # A stale copy on the destination may be queued for deletion, the new one must not be
+    with gc_lock:
+        incoming_moves.setdefault(destination, set()).add(chunk_id)
+        forget_deletion(destination, chunk_id)
+    try:
+        copied = chunk_server_request(addresses[destination], "/copy_chunk", {
+            "chunk_id": chunk_id,
+            "filename": filename,
+            "source": addresses[source],
+            "max_rate": max_rate
+        })
+        original = chunk_server_request(addresses[source], f"/checksum?{urlencode({'chunk_id': chunk_id})}")
+        
+        with metadata_lock:
+            chunk_info = metadata["chunks"].get(chunk_id)
+            verified = (copied["sha256"] == original["sha256"] and copied["bytes"] == original["bytes"])
+            servers = place(chunk_info["servers"]) if verified and chunk_info is not None else None
+            discard = servers is None
+            if not discard:
+                commit_mutation({"op": "set_chunk_servers", "chunk_id": chunk_id, "servers": servers})
+    finally:
+        with gc_lock:
+            incoming_moves[destination].discard(chunk_id)
+            # A GC pass during the copy may have queued it again from its old orphan candidates
+            forget_deletion(destination, chunk_id)
+    
+    if discard:
+        with gc_lock:
+            gc_queue.setdefault(destination, {})[chunk_id] = None
+        if not verified:
+            raise RuntimeError(f"Copy of {chunk_id} on {destination} does not match {source}")
+        return None
+    return copied["bytes"]
+
+def move_chunk(chunk_id, source, destination, max_rate):
+    """Copy a replica to destination, verify it against the source, then swap the servers.
+    
+    Returns the bytes moved, or None if the chunk changed meanwhile and the
+    copy was discarded. The source replica is left for the caller to delete.
+    """
+    def swap(servers):
+        if source not in servers or destination in servers:
+            return None
+        return [destination if sid == source else sid for sid in servers]
+    
+    return copy_replica(chunk_id, source, destination, max_rate, swap)
+
+def add_replica(chunk_id, source, destination):
+    """Copy a chunk to destination as an extra replica while it is under-replicated"""
+    def add(servers):
+        if len(servers) >= REPLICATION_FACTOR or destination in servers:
+            return None
+        return servers + [destination]
+    
+    # Not throttled like the rebalancer, a lost replica is urgent
+    return copy_replica(chunk_id, source, destination, 0, add)
+
+def rebalance_pass():
+    """Plan and run one round of moves, returns (chunks moved, bytes moved)"""
+    moves = plan_moves(server_usage())
+    if not moves:
+        return 0, 0
+    
+    # Every copy gets an equal share of the bandwidth cap
+    max_rate = REBALANCE_BANDWIDTH / REBALANCE_CONCURRENCY
+    
+    def attempt(move):
+        try:
+            return move, move_chunk(*move, max_rate)
+        except Exception as e:
+            print(f"[MASTER] Moving {move[0]} from {move[1]} to {move[2]} failed: {e}")
+            return move, None
+    
+    with ThreadPoolExecutor(max_workers=REBALANCE_CONCURRENCY) as executor:
+        done = [(move, size) for move, size in executor.map(attempt, moves) if size is not None]
+    REBALANCE_MOVES.inc(("moved",), amount=len(done))
+    REBALANCE_MOVES.inc(("skipped",), amount=len(moves) - len(done))
+    if not done:
+        return 0, 0
+    
+    # Persist before the old replicas go, a restart must never point at a deleted copy
+    save_metadata()
+    with gc_lock:
+        for (chunk_id, source, _), _ in done:
+            gc_queue.setdefault(source, {})[chunk_id] = None
+    with heartbeat_lock:
+        beats = {sid: info.get("beats", 0) for sid, info in chunk_servers.items()}
+    for (_, source, destination), size in done:
+        # The destination's next report includes the copy, the source deletes on the next reply
+        rebalance_adjustments.append((destination, size, beats.get(destination, 0) + 2))
+        rebalance_adjustments.append((source, -size, beats.get(source, 0) + 2))
+    
+    moved_bytes = sum(size for _, size in done)
+    REBALANCE_BYTES.inc(amount=moved_bytes)
+    return len(done), moved_bytes
+
+def rebalancer():
+    """Move replicas from the fullest chunk servers to the emptiest ones"""
+    while True:
+        try:
+            moved, moved_bytes = rebalance_pass()
+        except Exception as e:
+            print(f"[MASTER] Rebalancing failed: {e}")
+            moved = 0
+        
+        if moved:
+            print(f"[MASTER] Rebalancer moved {moved} chunks ({moved_bytes / (1024 * 1024):.1f}MB)")
+        else:
+            time.sleep(REBALANCE_INTERVAL)
+
+def utilization_spread():
+    fills = [utilization(info.get("stats")) for info in list(chunk_servers.values()) if info["status"] == "active"]
+    fills = [fill for fill in fills if fill is not None]
+    return max(fills) - min(fills) if fills else 0.0
+
+def under_replicated_chunks():
+    """Count chunks below REPLICATION_FACTOR, the re-replication backlog"""
+    # list() snapshots the values atomically so no lock is held during the scan
+    return sum(1 for chunk_info in list(metadata["chunks"].values())
+               if len(chunk_info["servers"]) < REPLICATION_FACTOR)
+
+def chunk_servers_by_status():
+    counts = {}
+    for info in list(chunk_servers.values()):
+        key = (info["status"],)
+        counts[key] = counts.get(key, 0) + 1
+    return counts
+
+# Master metrics
+GC_CHUNKS_QUEUED = Counter("gfs_master_gc_chunks_queued_total", "Orphaned chunks queued for deletion")
+GC_FILES_COLLECTED = Counter("gfs_master_gc_files_collected_total", "Deleted files whose chunks were released")
+REREPLICATIONS_IN_PROGRESS = Gauge("gfs_master_rereplications_in_progress", "Running re-replication passes")
+REBALANCE_MOVES = Counter("gfs_master_rebalance_moves_total", "Planned chunk moves by result", ["result"])
+REBALANCE_BYTES = Counter("gfs_master_rebalance_bytes_total", "Chunk bytes moved by the rebalancer")
+Gauge("gfs_master_utilization_spread", "Utilisation of the fullest minus the emptiest active chunk server",
+      callback=utilization_spread)
+Gauge("gfs_master_gc_deletion_backlog", "Chunk deletions waiting to be handed to chunk servers",
+      callback=lambda: sum(len(queue) for queue in list(gc_queue.values())))
+Gauge("gfs_master_chunk_reports_pending", "Heartbeat chunk reports waiting for a GC scan",
+      callback=lambda: len(chunk_reports))
+Gauge("gfs_master_under_replicated_chunks", "Chunks with fewer than REPLICATION_FACTOR replicas",
+      callback=under_replicated_chunks)
+Gauge("gfs_master_chunk_servers", "Registered chunk servers", ["status"],
+      callback=chunk_servers_by_status)
+Gauge("gfs_master_files", "Files in the namespace", callback=lambda: len(metadata["files"]))
+Gauge("gfs_master_chunks", "Chunks tracked in metadata", callback=lambda: len(metadata["chunks"]))
+Gauge("gfs_master_sessions", "Active login sessions", callback=lambda: len(sessions))
+Gauge("gfs_master_upload_sessions", "Upload sessions open or recently committed",
+      callback=lambda: len(metadata["uploads"]))
+Gauge("gfs_master_directories", "Directories in the namespace", callback=lambda: namespace.directories)
+Gauge("gfs_master_path_locks", "Path locks currently held or waited on", callback=lambda: len(namespace.locks))
+Gauge("gfs_master_replication_seq", "Sequence number of the latest logged mutation", callback=lambda: oplog_seq)
+
+class MasterHandler(AdmissionMixin, InstrumentedHandlerMixin, BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, every response carries Content-Length
+    timeout = KEEPALIVE_TIMEOUT
+    disable_nagle_algorithm = True  # headers and body are separate writes on a reused socket
+    metrics_routes = ("/status", "/users", "/logs", "/lookup", "/metrics", "/heartbeat", "/login",
+                      "/logout", "/signup", "/create_user", "/promote_user", "/allocate_chunks",
+                      "/register_chunk", "/simulate_failure", "/delete_file",
+                      "/replication_log", "/replication_snapshot", "/mkdir", "/list", "/stat",
+                      "/upload_session", "/ack_chunks", "/commit_upload", "/abort_upload",
+                      "/allocate_packs", "/commit_packs")
+    admission = admission_controller
+    rate_limiter = rate_limiter
+    # Heartbeats first, a late one looks like a failed server; everything else is interactive
+    request_classes = {
+        "/heartbeat": CONTROL, "/replication_log": CONTROL, "/replication_snapshot": CONTROL,
+        "/metrics": CONTROL, "/allocate_chunks": BULK, "/register_chunk": BULK, "/delete_file": BULK,
+        "/mkdir": BULK, "/upload_session": BULK, "/ack_chunks": BULK, "/commit_upload": BULK,
+        "/abort_upload": BULK, "/allocate_packs": BULK, "/commit_packs": BULK
+    }
+    
+    def _client_key(self):
+        """Rate limit by the user of a session token, by address without one"""
+        auth = self.headers.get("Authorization", "")
+        if auth.startswith("Bearer "):
+            session = validate_session(auth[len("Bearer "):])
+            if session:
+                return f"user:{session['username']}"
+        return super()._client_key()
+    
+    def _set_headers(self, status=200, content_length=0):
         self.send_response(status)
         self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(content_length))
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
         self.end_headers()
     
+    def _send_json(self, data, status=200):
+        body = json.dumps(data).encode()
+        self._set_headers(status, len(body))
+        self.wfile.write(body)
+    
     def do_OPTIONS(self):
         self._set_headers()
     
@@ -221,9 +1321,22 @@ class MasterHandler(BaseHTTPRequestHandler):
             self._handle_get_users()
         elif path == "/logs":
             self._handle_logs()
+        elif path == "/lookup":
+            self._handle_lookup(parse_qs(parsed.query))
+        elif path == "/list":
+            self._handle_list(parse_qs(parsed.query))
+        elif path == "/stat":
+            self._handle_stat(parse_qs(parsed.query))
+        elif path == "/upload_session":
+            self._handle_upload_status(parse_qs(parsed.query))
+        elif path == "/replication_log":
+            self._handle_replication_log(parse_qs(parsed.query))
+        elif path == "/replication_snapshot":
+            self._handle_replication_snapshot()
+        elif path == "/metrics":
+            self._handle_metrics()
         else:
-            self._set_headers(404)
-            self.wfile.write(json.dumps({"error": "Not found"}).encode())
+            self._send_json({"error": "Not found"}, 404)
     
     def do_POST(self):
         parsed = urlparse(self.path)
@@ -255,22 +1368,38 @@ class MasterHandler(BaseHTTPRequestHandler):
             self._handle_register_chunk(data)
         elif path == "/simulate_failure":
             self._handle_simulate_failure(data)
+        elif path == "/delete_file":
+            self._handle_delete_file(data)
+        elif path == "/mkdir":
+            self._handle_mkdir(data)
+        elif path == "/upload_session":
+            self._handle_begin_upload(data)
+        elif path == "/ack_chunks":
+            self._handle_ack_chunks(data)
+        elif path == "/commit_upload":
+            self._handle_commit_upload(data)
+        elif path == "/abort_upload":
+            self._handle_abort_upload(data)
+        elif path == "/allocate_packs":
+            self._handle_allocate_packs(data)
+        elif path == "/commit_packs":
+            self._handle_commit_packs(data)
         else:
-            self._set_headers(404)
-            self.wfile.write(json.dumps({"error": "Not found"}).encode())
+            self._send_json({"error": "Not found"}, 404)
+    
+    def _replication_info(self):
+        return {"role": "primary", "seq": oplog_seq}
+    
+    def _server_table(self):
+        return chunk_server_table()
     
     def _handle_status(self):
         """Return system status"""
-        with heartbeat_lock:
-            servers_status = {sid: {
-                "status": info["status"],
-                "last_heartbeat": info["last_heartbeat"],
-                "host": info["host"],
-                "port": info["port"]
-            } for sid, info in chunk_servers.items()}
+        servers_status = self._server_table()
         
         with metadata_lock:
-            files_info = metadata["files"]
+            files_info = {name: info for name, info in metadata["files"].items()
+                          if not is_tombstone(name)}
             chunks_info = metadata["chunks"]
         
         active_count = sum(1 for s in chunk_servers.values() if s["status"] == "active")
@@ -282,11 +1411,11 @@ class MasterHandler(BaseHTTPRequestHandler):
             "files": files_info,
             "chunks": chunks_info,
             "fault_tolerance": round(fault_tolerance, 2),
-            "timestamp": datetime.now().isoformat()
+            "timestamp": datetime.now().isoformat(),
+            "replication": self._replication_info()
         }
         
-        self._set_headers()
-        self.wfile.write(json.dumps(response).encode())
+        self._send_json(response)
     
     def _handle_heartbeat(self, data):
         """Handle heartbeat from chunk server"""
@@ -295,12 +1424,22 @@ class MasterHandler(BaseHTTPRequestHandler):
         port = data.get("port", 0)
         
         if server_id:
-            register_chunk_server(server_id, host, port)
-            self._set_headers()
-            self.wfile.write(json.dumps({"status": "ok"}).encode())
+            interval = negotiate_heartbeat_interval(data.get("heartbeat_interval"))
+            stats = data.get("stats") if isinstance(data.get("stats"), dict) else None
+            register_chunk_server(server_id, host, port, interval, stats)
+            
+            # Full chunk reports are scanned by the garbage collector thread
+            if "chunks" in data:
+                with gc_lock:
+                    chunk_reports[server_id] = data["chunks"]
+            
+            self._send_json({
+                "status": "ok",
+                "heartbeat_interval": interval,
+                "delete_chunks": next_gc_batch(server_id)
+            })
         else:
-            self._set_headers(400)
-            self.wfile.write(json.dumps({"error": "Missing server_id"}).encode())
+            self._send_json({"error": "Missing server_id"}, 400)
     
     def _handle_login(self, data):
         """Authenticate user and create session"""
@@ -310,8 +1449,7 @@ class MasterHandler(BaseHTTPRequestHandler):
         
         if not username or not password:
             print("[MASTER] Login failed: Missing credentials")
-            self._set_headers(400)
-            self.wfile.write(json.dumps({"success": False, "error": "Missing credentials"}).encode())
+            self._send_json({"success": False, "error": "Missing credentials"}, 400)
             return
         
         print(f"[MASTER] Hashing password for {username}")
@@ -323,18 +1461,16 @@ class MasterHandler(BaseHTTPRequestHandler):
             token = create_session(username, users[username]["role"])
             print(f"[MASTER] Session created, sending response")
             
-            self._set_headers()
-            self.wfile.write(json.dumps({
+            self._send_json({
                 "success": True,
                 "role": users[username]["role"],
                 "username": username,
                 "token": token
-            }).encode())
+            })
             print(f"[MASTER] Login successful for {username}")
         else:
             print(f"[MASTER] Login failed: Invalid credentials for {username}")
-            self._set_headers(401)
-            self.wfile.write(json.dumps({"success": False, "error": "Invalid credentials"}).encode())
+            self._send_json({"success": False, "error": "Invalid credentials"}, 401)
     
     def _handle_logout(self, data):
         """Logout user and invalidate session"""
@@ -348,8 +1484,7 @@ class MasterHandler(BaseHTTPRequestHandler):
                     with open(SESSIONS_FILE, 'w') as f:
                         json.dump(sessions, f, indent=2)
         
-        self._set_headers()
-        self.wfile.write(json.dumps({"success": True}).encode())
+        self._send_json({"success": True})
     
     def _handle_signup(self, data):
         """Public signup - creates basic user account"""
@@ -357,13 +1492,11 @@ class MasterHandler(BaseHTTPRequestHandler):
         password = data.get("password")
         
         if not username or not password:
-            self._set_headers(400)
-            self.wfile.write(json.dumps({"success": False, "error": "Missing credentials"}).encode())
+            self._send_json({"success": False, "error": "Missing credentials"}, 400)
             return
         
         if username in users:
-            self._set_headers(400)
-            self.wfile.write(json.dumps({"success": False, "error": "Username already exists"}).encode())
+            self._send_json({"success": False, "error": "Username already exists"}, 400)
             return
         
         # Create new user with default role
@@ -375,9 +1508,9 @@ class MasterHandler(BaseHTTPRequestHandler):
             "created_at": datetime.now().isoformat()
         }
         save_users()
+        log_user(username)
         
-        self._set_headers()
-        self.wfile.write(json.dumps({"success": True, "message": "Account created successfully"}).encode())
+        self._send_json({"success": True, "message": "Account created successfully"})
     
     def _handle_get_users(self):
         """Get all users (admin only)"""
@@ -387,8 +1520,7 @@ class MasterHandler(BaseHTTPRequestHandler):
             "created_by": info.get("created_by", "unknown")
         } for username, info in users.items()]
         
-        self._set_headers()
-        self.wfile.write(json.dumps({"users": user_list}).encode())
+        self._send_json({"users": user_list})
     
     def _handle_create_user(self, data):
         """Create new user (admin/manager only)"""
@@ -398,8 +1530,7 @@ class MasterHandler(BaseHTTPRequestHandler):
         created_by = data.get("created_by", "admin")
         
         if username in users:
-            self._set_headers(400)
-            self.wfile.write(json.dumps({"success": False, "error": "User exists"}).encode())
+            self._send_json({"success": False, "error": "User exists"}, 400)
             return
         
         password_hash = hashlib.sha256(password.encode()).hexdigest()
@@ -410,95 +1541,330 @@ class MasterHandler(BaseHTTPRequestHandler):
             "created_at": datetime.now().isoformat()
         }
         save_users()
+        log_user(username)
         
-        self._set_headers()
-        self.wfile.write(json.dumps({"success": True}).encode())
+        self._send_json({"success": True})
     
     def _handle_promote_user(self, data):
         """Promote user to manager"""
         username = data.get("username")
         
         if username not in users:
-            self._set_headers(404)
-            self.wfile.write(json.dumps({"success": False, "error": "User not found"}).encode())
+            self._send_json({"success": False, "error": "User not found"}, 404)
             return
         
         users[username]["role"] = "manager"
         save_users()
+        log_user(username)
         
-        self._set_headers()
-        self.wfile.write(json.dumps({"success": True}).encode())
+        self._send_json({"success": True})
     
     def _handle_allocate_chunks(self, data):
         """Allocate chunks for a file upload"""
-        filename = data.get("filename")
         filesize = data.get("filesize", 0)
+        try:
+            filename = normalize_path(data.get("filename"))
+            namespace.check_file(filename)
+        except NamespaceError as e:
+            self._send_json({"error": str(e)}, e.status)
+            return
         
         num_chunks = (filesize + CHUNK_SIZE - 1) // CHUNK_SIZE
-        
-        with heartbeat_lock:
-            active_servers = [sid for sid, info in chunk_servers.items() 
-                            if info["status"] == "active"]
+        active_servers = active_server_ids()
         
         if not active_servers:
-            self._set_headers(503)
-            self.wfile.write(json.dumps({"error": "No active servers"}).encode())
+            self._send_json({"error": "No active servers"}, 503)
             return
         
+        offset = next(allocation_cursor)
         allocations = []
         for i in range(num_chunks):
-            chunk_id = f"{filename}_chunk_{i}"
-            servers = [active_servers[j % len(active_servers)] 
-                      for j in range(i, i + min(REPLICATION_FACTOR, len(active_servers)))]
             allocations.append({
-                "chunk_id": chunk_id,
-                "servers": servers,
+                "chunk_id": chunk_handle(filename, i),
+                "servers": place_chunk(active_servers, offset, i),
                 "index": i
             })
         
-        self._set_headers()
-        self.wfile.write(json.dumps({"allocations": allocations}).encode())
+        self._send_json({
+            "filename": filename,
+            "allocations": allocations,
+            "chunk_size": CHUNK_SIZE,
+            "server_addresses": server_addresses(active_servers)
+        })
+    
+    def _handle_lookup(self, query):
+        """Return a file's chunk locations with chunk server addresses"""
+        try:
+            filename = normalize_path(query.get("filename", [None])[0])
+        except NamespaceError as e:
+            self._send_json({"error": str(e)}, e.status)
+            return
+        
+        with metadata_lock:
+            file_info = metadata["files"].get(filename) if filename else None
+            if file_info is None or is_tombstone(filename):
+                file_info = None
+            else:
+                recorded = "encryption" in file_info
+                encryption = file_info.get("encryption")
+                chunks = [{
+                    "chunk_id": chunk_id,
+                    "index": index,
+                    "servers": list(metadata["chunks"].get(chunk_id, {}).get("servers", []))
+                } for index, chunk_id in enumerate(file_info["chunks"])]
+                if "offset" in file_info:
+                    # A packed small file is a byte range of a shared chunk
+                    chunks[0].update(offset=file_info["offset"], length=file_info["length"])
+        
+        if file_info is None:
+            self._send_json({"error": "File not found"}, 404)
+            return
+        
+        involved = {sid for chunk in chunks for sid in chunk["servers"]}
+        response = {
+            "filename": filename,
+            "chunks": chunks,
+            "chunk_size": CHUNK_SIZE,
+            "server_addresses": server_addresses(involved)
+        }
+        # Files registered before uploads recorded their encryption mode have none
+        if recorded:
+            response["encryption"] = encryption
+        self._send_json(response)
     
     def _handle_register_chunk(self, data):
         """Register completed chunk upload"""
-        filename = data.get("filename")
         chunk_id = data.get("chunk_id")
         servers = data.get("servers", [])
         
         with metadata_lock:
-            if filename not in metadata["files"]:
-                metadata["files"][filename] = {
-                    "chunks": [],
-                    "upload_time": datetime.now().isoformat()
-                }
-            
-            metadata["files"][filename]["chunks"].append(chunk_id)
-            metadata["chunks"][chunk_id] = {
+            try:
+                filename = normalize_path(data.get("filename"))
+                # The path may have become a directory since allocation
+                namespace.check_file(filename)
+            except NamespaceError as e:
+                self._send_json({"success": False, "error": str(e)}, e.status)
+                return
+            commit_mutation({
+                "op": "register_chunk",
+                "filename": filename,
+                "chunk_id": chunk_id,
                 "servers": servers,
-                "filename": filename
-            }
-            save_metadata()
+                "upload_time": datetime.now().isoformat()
+            })
+            # A re-upload reuses the chunk id, older copies on failed servers must not come back
+            for lost in lost_replicas.values():
+                lost.discard(chunk_id)
+            _write_metadata()
         
-        self._set_headers()
-        self.wfile.write(json.dumps({"success": True}).encode())
+        self._send_json({"success": True})
     
     def _handle_simulate_failure(self, data):
         """Simulate server failure"""
         server_id = data.get("server_id")
         
         if server_id not in chunk_servers:
-            self._set_headers(404)
-            self.wfile.write(json.dumps({"error": "Server not found"}).encode())
+            self._send_json({"error": "Server not found"}, 404)
             return
         
+        failure_detector.force_fail(server_id)
         with heartbeat_lock:
             chunk_servers[server_id]["status"] = "failed"
             chunk_servers[server_id]["last_heartbeat"] = 0
         
         threading.Thread(target=re_replicate_chunks, args=(server_id,), daemon=True).start()
         
-        self._set_headers()
-        self.wfile.write(json.dumps({"success": True}).encode())
+        self._send_json({"success": True})
+    
+    def _handle_delete_file(self, data):
+        """Delete a file, storage is reclaimed by garbage collection"""
+        try:
+            filename = normalize_path(data.get("filename"))
+        except NamespaceError as e:
+            self._send_json({"success": False, "error": str(e)}, e.status)
+            return
+        
+        tombstone = delete_file(filename) if filename else None
+        if not tombstone:
+            self._send_json({"success": False, "error": "File not found"}, 404)
+            return
+        
+        self._send_json({"success": True, "tombstone": tombstone})
+    
+    def _handle_begin_upload(self, data):
+        """Open a resumable upload, returns its id and where to store every chunk"""
+        try:
+            filename = normalize_path(data.get("filename"))
+            filesize = int(data.get("filesize", 0))
+            upload_id = begin_upload(filename, filesize, data.get("encryption"))
+        except NamespaceError as e:
+            self._send_json({"error": str(e)}, e.status)
+            return
+        except ValueError:
+            self._send_json({"error": "Invalid filesize"}, 400)
+            return
+        
+        self._handle_upload_status({"upload_id": [upload_id]})
+    
+    def _handle_upload_status(self, query):
+        """Which chunks of an upload are still missing, with fresh placements for them"""
+        upload_id = query.get("upload_id", [None])[0]
+        status = upload_status(upload_id)
+        if status is None:
+            self._send_json({"error": f"Unknown upload: {upload_id}"}, 404)
+            return
+        
+        if not status["committed"]:
+            with metadata_lock:
+                session = metadata["uploads"][upload_id]
+            allocations, addresses = upload_allocations(upload_id, session, status["missing"])
+            if status["missing"] and not allocations:
+                self._send_json({"error": "No active servers"}, 503)
+                return
+            status.update(allocations=allocations, chunk_size=CHUNK_SIZE, server_addresses=addresses)
+        
+        self._send_json(status)
+    
+    def _handle_ack_chunks(self, data):
+        """Record chunks of an upload as stored on the given servers"""
+        try:
+            acked = [(chunk["index"], chunk["servers"]) for chunk in data.get("chunks", [])]
+            missing = ack_chunks(data.get("upload_id"), acked)
+        except UploadError as e:
+            self._send_json({"success": False, "error": str(e)}, e.status)
+            return
+        except (KeyError, TypeError, ValueError):
+            self._send_json({"success": False, "error": "Invalid chunk acknowledgement"}, 400)
+            return
+        
+        self._send_json({"success": True, "missing": missing})
+    
+    def _handle_commit_upload(self, data):
+        """Publish an upload once every chunk is acknowledged"""
+        try:
+            filename, missing = commit_upload(data.get("upload_id"))
+        except (UploadError, NamespaceError) as e:
+            self._send_json({"success": False, "error": str(e)}, e.status)
+            return
+        
+        if missing:
+            self._send_json({"success": False, "error": f"{len(missing)} chunks not stored yet",
+                             "filename": filename, "missing": missing}, 409)
+            return
+        
+        self._send_json({"success": True, "filename": filename})
+    
+    def _handle_abort_upload(self, data):
+        if not abort_upload(data.get("upload_id")):
+            self._send_json({"success": False, "error": "Unknown upload"}, 404)
+            return
+        self._send_json({"success": True})
+    
+    def _handle_allocate_packs(self, data):
+        """Allocate shared chunks for the client to pack small files into"""
+        try:
+            count = int(data.get("count", 1))
+        except (TypeError, ValueError):
+            count = 0
+        if not 1 <= count <= MAX_PACKS_PER_CALL:
+            self._send_json({"error": f"count must be 1 to {MAX_PACKS_PER_CALL}"}, 400)
+            return
+        
+        allocations, addresses = allocate_packs(count)
+        if not allocations:
+            self._send_json({"error": "No active servers"}, 503)
+            return
+        
+        self._send_json({
+            "allocations": allocations,
+            "chunk_size": CHUNK_SIZE,
+            "server_addresses": addresses
+        })
+    
+    def _handle_commit_packs(self, data):
+        """Publish the small files stored in a batch of packs"""
+        packs = data.get("packs", [])
+        if not isinstance(packs, list) or len(packs) > MAX_PACKS_PER_CALL:
+            self._send_json({"success": False, "error": f"packs must be a list of at most {MAX_PACKS_PER_CALL}"}, 400)
+            return
+        
+        try:
+            committed = commit_packs(packs, data.get("encryption"))
+        except (UploadError, NamespaceError) as e:
+            self._send_json({"success": False, "error": str(e)}, e.status)
+            return
+        except (KeyError, TypeError, ValueError):
+            self._send_json({"success": False, "error": "Invalid pack description"}, 400)
+            return
+        
+        self._send_json({"success": True, "files": committed})
+    
+    def _handle_replication_log(self, query):
+        """Long poll for mutations after since, used by shadow masters"""
+        try:
+            since = int(query.get("since", ["0"])[0])
+            wait = min(float(query.get("wait", ["0"])[0]), REPLICATION_MAX_WAIT)
+        except ValueError:
+            self._send_json({"error": "Invalid since or wait"}, 400)
+            return
+        epoch = query.get("epoch", [None])[0]
+        
+        seq, ops = replication_batch(since, epoch, wait)
+        response = {"epoch": oplog_epoch, "seq": seq}
+        if ops is None:
+            response["snapshot_required"] = True
+        else:
+            response["ops"] = ops
+        if query.get("servers", ["0"])[0] == "1":
+            response["servers"] = chunk_server_table()
+        
+        self._send_json(response)
+    
+    def _handle_replication_snapshot(self):
+        """Full metadata snapshot for a shadow master to start from"""
+        body = replication_snapshot()
+        self._set_headers(200, len(body))
+        self.wfile.write(body)
+    
+    def _handle_mkdir(self, data):
+        """Create a directory, parents=true also creates missing ancestors"""
+        parents = bool(data.get("parents", False))
+        try:
+            path = normalize_path(data.get("path"))
+            if not path:
+                raise NamespaceError("Cannot create the root directory", 409)
+            created = make_directory(path, parents)
+        except NamespaceError as e:
+            self._send_json({"success": False, "error": str(e)}, e.status)
+            return
+        
+        if not created and not parents:
+            self._send_json({"success": False, "error": f"Directory exists: {path}"}, 409)
+            return
+        self._send_json({"success": True, "path": path, "created": created})
+    
+    def _handle_list(self, query):
+        """Page through a directory in name order, optionally only names with a prefix"""
+        try:
+            path = normalize_path(query.get("path", [""])[0])
+            limit = min(max(int(query.get("limit", [LIST_PAGE_SIZE])[0]), 1), MAX_LIST_PAGE_SIZE)
+            entries, next_after = list_directory(path, query.get("prefix", [""])[0],
+                                                 query.get("after", [""])[0], limit)
+        except ValueError:
+            self._send_json({"error": "Invalid limit"}, 400)
+            return
+        except NamespaceError as e:
+            self._send_json({"error": str(e)}, e.status)
+            return
+        
+        self._send_json({"path": path, "entries": entries, "next_after": next_after})
+    
+    def _handle_stat(self, query):
+        """Describe a file or directory"""
+        try:
+            self._send_json(stat_path(normalize_path(query.get("path", [""])[0])))
+        except NamespaceError as e:
+            self._send_json({"error": str(e)}, e.status)
     
     def _handle_logs(self):
         """Return system logs"""
@@ -512,12 +1878,16 @@ class MasterHandler(BaseHTTPRequestHandler):
                     "event": f"Status: {info['status']}"
                 })
         
-        self._set_headers()
-        self.wfile.write(json.dumps({"logs": logs[-50:]}).encode())
+        self._send_json({"logs": logs[-50:]})
+    
+    def log_request(self, code='-', size='-'):
+        """Log a sample of requests, errors are always logged"""
+        if request_log.should_log(code):
+            super().log_request(code, size)
     
     def log_message(self, format, *args):
-        """Log HTTP requests"""
-        print(f"[MASTER] {self.address_string()} - {format % args}")
+        """Log HTTP requests off the request thread"""
+        request_log.submit(f"[MASTER] {self.address_string()} - {format % args}")
 
 def main():
     load_data()
@@ -525,9 +1895,15 @@ def main():
     # Start heartbeat monitor
     threading.Thread(target=check_heartbeats, daemon=True).start()
     
+    # Start garbage collector
+    threading.Thread(target=garbage_collector, daemon=True).start()
+    
+    # Start rebalancer
+    threading.Thread(target=rebalancer, daemon=True).start()
+    
     # Start HTTP server with threading support
-    server = ThreadedHTTPServer(('0.0.0.0', 8000), MasterHandler)
-    print("[MASTER] Master Node started on port 8000 (threaded)")
+    server = ThreadedHTTPServer(('0.0.0.0', MASTER_PORT), MasterHandler)
+    print(f"[MASTER] Master Node started on port {MASTER_PORT} (threaded)")
     server.serve_forever()
 
 if __name__ == "__main__":
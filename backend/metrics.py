@@ -0,0 +1,389 @@
+import bisect
+import queue
+import random
+import threading
+import time
+from collections import deque
+
+# Configuration
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+DRAIN_THRESHOLD = 10000  # pending observations before the recording thread folds them in
+REQUEST_LOG_QUEUE_SIZE = 10000
+
+class Registry:
+    """Collection of metrics rendered together on /metrics"""
+
+    def __init__(self):
+        self._metrics = []
+        self._hooks = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def add_collect_hook(self, hook):
+        """Run hook before every render, used to fold in batched observations"""
+        with self._lock:
+            self._hooks.append(hook)
+
+    def render(self):
+        """Render all metrics in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics)
+            hooks = list(self._hooks)
+
+        for hook in hooks:
+            hook()
+
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+def _format_labels(label_names, label_values, extra=()):
+    pairs = list(zip(label_names, label_values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = [(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+               for name, value in pairs]
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+def _format_value(value):
+    if isinstance(value, float) and value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    """Base metric, recording appends to a deque so the hot path takes no lock"""
+    kind = "untyped"
+
+    def __init__(self, name, help_text, label_names=(), registry=REGISTRY):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._pending = deque()
+        self._drain_lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def _record(self, labels, value):
+        # deque.append is atomic, aggregation happens later under _drain_lock
+        self._pending.append((labels, value))
+        if len(self._pending) > DRAIN_THRESHOLD:
+            self._drain()
+
+    def _drain(self):
+        with self._drain_lock:
+            popleft = self._pending.popleft
+            while True:
+                try:
+                    labels, value = popleft()
+                except IndexError:
+                    break
+                self._apply(labels, value)
+
+    def _apply(self, labels, value):
+        raise NotImplementedError
+
+    def samples(self):
+        raise NotImplementedError
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, labels=(), amount=1):
+        pending = self._pending
+        pending.append((labels, amount))
+        if len(pending) > DRAIN_THRESHOLD:
+            self._drain()
+
+    def _apply(self, labels, value):
+        self._values[labels] = self._values.get(labels, 0) + value
+
+    def value(self, labels=()):
+        self._drain()
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        self._drain()
+        return [f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}"
+                for labels, value in sorted(self._values.items())]
+
+class Gauge(_Metric):
+    """Gauge that is either set directly or computed by a callback at scrape time"""
+    kind = "gauge"
+
+    def __init__(self, name, help_text, label_names=(), callback=None, registry=REGISTRY):
+        super().__init__(name, help_text, label_names, registry)
+        self._callback = callback
+
+    def set(self, value, labels=()):
+        self._drain()
+        self._values[labels] = value
+
+    def inc(self, labels=(), amount=1):
+        self._record(labels, amount)
+
+    def dec(self, labels=(), amount=1):
+        self._record(labels, -amount)
+
+    def _apply(self, labels, value):
+        self._values[labels] = self._values.get(labels, 0) + value
+
+    def samples(self):
+        if self._callback:
+            try:
+                result = self._callback()
+            except Exception:
+                return []
+            values = result if isinstance(result, dict) else {(): result}
+        else:
+            self._drain()
+            values = self._values
+        return [f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}"
+                for labels, value in sorted(values.items())]
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        super().__init__(name, help_text, label_names, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, labels=()):
+        pending = self._pending
+        pending.append((labels, value))
+        if len(pending) > DRAIN_THRESHOLD:
+            self._drain()
+
+    def _apply(self, labels, value):
+        state = self._values.get(labels)
+        if state is None:
+            # per-bucket counts followed by the +Inf bucket, then sum
+            state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+
+    def snapshot(self, labels=()):
+        """Return (count, sum) for one label set"""
+        self._drain()
+        state = self._values.get(labels)
+        return (sum(state[0]), state[1]) if state else (0, 0.0)
+
+    def samples(self):
+        self._drain()
+        lines = []
+        for labels, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = _format_labels(self.label_names, labels, [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            label_str = _format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{label_str} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_str} {cumulative}")
+        return lines
+
+# Lock instrumentation
+LOCK_CONTENTIONS = Counter("gfs_lock_contentions_total", "Lock acquisitions that had to wait", ["lock"])
+LOCK_WAIT = Histogram("gfs_lock_wait_seconds", "Time spent waiting for contended locks", ["lock"],
+                      buckets=(0.00001, 0.0001, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5))
+_instrumented_locks = []
+
+class InstrumentedLock:
+    """Drop-in threading.Lock that records acquisitions and contended wait time"""
+
+    def __init__(self, name, lock=None):
+        self.name = name
+        self.acquisitions = 0
+        self._labels = (name,)
+        self._lock = lock or threading.Lock()
+        _instrumented_locks.append(self)
+
+    def acquire(self, blocking=True, timeout=-1):
+        if not self._lock.acquire(False):
+            if not blocking or not self._acquire_contended(timeout):
+                return False
+        # Incremented while holding the lock, so the plain += is safe
+        self.acquisitions += 1
+        return True
+
+    def _acquire_contended(self, timeout=-1):
+        start = time.perf_counter()
+        acquired = self._lock.acquire(True, timeout)
+        LOCK_WAIT.observe(time.perf_counter() - start, self._labels)
+        LOCK_CONTENTIONS.inc(self._labels)
+        return acquired
+
+    def release(self):
+        self._lock.release()
+
+    def locked(self):
+        return self._lock.locked()
+
+    def __enter__(self):
+        if not self._lock.acquire(False):
+            self._acquire_contended()
+        self.acquisitions += 1
+        return self
+
+    def __exit__(self, *exc):
+        self._lock.release()
+
+Gauge("gfs_lock_acquisitions", "Lock acquisitions since start", ["lock"],
+      callback=lambda: {(lock.name,): lock.acquisitions for lock in list(_instrumented_locks)})
+
+# Request logging
+REQUEST_LOG_DROPPED = Counter("gfs_request_log_dropped_total", "Request log lines dropped on a full queue")
+
+class RequestLog:
+    """Sampled request log written by a background thread"""
+
+    def __init__(self, sample_rate=0.01, maxsize=REQUEST_LOG_QUEUE_SIZE):
+        self.sample_rate = sample_rate
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._thread = None
+        Gauge("gfs_request_log_queue_depth", "Request log lines waiting to be written",
+              callback=self._queue.qsize)
+
+    def should_log(self, status):
+        """Always log errors, sample everything else"""
+        try:
+            if int(status) >= 400:
+                return True
+        except (TypeError, ValueError):
+            return True
+        return random.random() < self.sample_rate
+
+    def submit(self, line):
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(line)
+        except queue.Full:
+            REQUEST_LOG_DROPPED.inc()
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            print(self._queue.get())
+
+# HTTP instrumentation
+HTTP_REQUESTS = Counter("gfs_http_requests_total", "HTTP requests handled", ["method", "route", "status"])
+HTTP_LATENCY = Histogram("gfs_http_request_duration_seconds", "HTTP request latency", ["method", "route"])
+HTTP_BYTES_IN = Counter("gfs_http_request_bytes_total", "HTTP request body bytes received", ["route"])
+HTTP_BYTES_OUT = Counter("gfs_http_response_bytes_total", "HTTP response bytes sent", ["route"])
+_http_pending = deque()  # one (method, route, status, seconds, bytes_in, bytes_out) per request
+_http_drain_lock = threading.Lock()
+
+def _drain_http():
+    """Fold batched request records into the per-route HTTP metrics"""
+    with _http_drain_lock:
+        popleft = _http_pending.popleft
+        while True:
+            try:
+                method, route, status, seconds, bytes_in, bytes_out = popleft()
+            except IndexError:
+                break
+            HTTP_LATENCY._apply((method, route), seconds)
+            HTTP_REQUESTS._apply((method, route, status), 1)
+            HTTP_BYTES_OUT._apply((route,), bytes_out)
+            if bytes_in:
+                HTTP_BYTES_IN._apply((route,), bytes_in)
+
+REGISTRY.add_collect_hook(_drain_http)
+
+class _CountingWriter:
+    """Wraps a handler's wfile to count bytes written"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.count = 0
+
+    def write(self, data):
+        self.count += len(data)
+        return self.raw.write(data)
+
+    def flush(self):
+        return self.raw.flush()
+
+    def close(self):
+        return self.raw.close()
+
+    @property
+    def closed(self):
+        return self.raw.closed
+
+class InstrumentedHandlerMixin:
+    """Records per-route request counts, latency and bytes for a BaseHTTPRequestHandler"""
+    metrics_routes = ()  # exact routes, entries ending in "/" match as prefixes
+    _metrics_start = None
+    _metrics_status = None
+
+    def setup(self):
+        super().setup()
+        self.wfile = _CountingWriter(self.wfile)
+
+    def handle_one_request(self):
+        self._metrics_start = None
+        self.wfile.count = 0
+        super().handle_one_request()
+        if self._metrics_start is not None:
+            self._observe_request()
+
+    def parse_request(self):
+        self._metrics_start = time.perf_counter()
+        return super().parse_request()
+
+    def send_response(self, code, message=None):
+        self._metrics_status = code
+        super().send_response(code, message)
+
+    def _route_label(self, path):
+        cls = type(self)
+        exact = cls.__dict__.get("_metrics_exact")
+        if exact is None:
+            exact = cls._metrics_exact = frozenset(r for r in cls.metrics_routes if not r.endswith("/"))
+            cls._metrics_prefixes = tuple(r for r in cls.metrics_routes if r.endswith("/"))
+
+        path = path.split("?", 1)[0]
+        if path in exact:
+            return path
+        for prefix in cls._metrics_prefixes:
+            if path.startswith(prefix):
+                return prefix
+        return "other"
+
+    def _observe_request(self):
+        headers = getattr(self, "headers", None)
+        length = headers.get("Content-Length") if headers else None
+
+        _http_pending.append((
+            self.command or "-",
+            self._route_label(getattr(self, "path", "")),
+            str(self._metrics_status),
+            time.perf_counter() - self._metrics_start,
+            int(length) if length and length.isdigit() else 0,
+            self.wfile.count
+        ))
+        if len(_http_pending) > DRAIN_THRESHOLD:
+            _drain_http()
+
+    def _handle_metrics(self):
+        """Expose the registry in Prometheus text format"""
+        body = REGISTRY.render().encode()
+        self.send_response(200)
+        self.send_header('Content-type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
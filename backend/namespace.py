@@ -0,0 +1,342 @@
+import threading
+from bisect import bisect_left, bisect_right, insort
+from contextlib import contextmanager
+
+BUCKET_SIZE = 1000  # names per sorted bucket, a bucket splits at twice this
+RESERVED_DIR = ".deleted"  # top level directory the master keeps deleted files under, never a user path
+
+class NamespaceError(Exception):
+    """A namespace operation that cannot be applied, status is the HTTP code to answer with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+def normalize_path(path):
+    """Canonical form of a path: no leading, trailing or doubled slashes, root is ''"""
+    if path is None:
+        raise NamespaceError("Missing path")
+    parts = [part for part in str(path).split("/") if part and part != "."]
+    if ".." in parts:
+        raise NamespaceError(f"Invalid path: {path}")
+    if parts and parts[0] == RESERVED_DIR:
+        raise NamespaceError(f"Reserved path: {path}")
+    return "/".join(parts)
+
+def split_path(path):
+    """'a/b/c' -> ('a/b', 'c')"""
+    parent, _, name = path.rpartition("/")
+    return parent, name
+
+def ancestors(path):
+    """'a/b/c' -> ['', 'a', 'a/b']"""
+    parts = path.split("/") if path else []
+    return ["/".join(parts[:i]) for i in range(len(parts))]
+
+class SortedNames:
+    """Sorted list of names kept in buckets, inserts stay cheap in huge directories"""
+    __slots__ = ("_buckets", "_maxes", "_len")
+
+    def __init__(self, names=()):
+        ordered = sorted(names)
+        self._buckets = [ordered[i:i + BUCKET_SIZE] for i in range(0, len(ordered), BUCKET_SIZE)]
+        self._maxes = [bucket[-1] for bucket in self._buckets]
+        self._len = len(ordered)
+
+    def __len__(self):
+        return self._len
+
+    def add(self, name):
+        if not self._buckets:
+            self._buckets.append([name])
+            self._maxes.append(name)
+        else:
+            index = min(bisect_left(self._maxes, name), len(self._buckets) - 1)
+            bucket = self._buckets[index]
+            insort(bucket, name)
+            self._maxes[index] = bucket[-1]
+            if len(bucket) > 2 * BUCKET_SIZE:
+                self._buckets[index:index + 1] = [bucket[:BUCKET_SIZE], bucket[BUCKET_SIZE:]]
+                self._maxes[index:index + 1] = [bucket[BUCKET_SIZE - 1], bucket[-1]]
+        self._len += 1
+
+    def remove(self, name):
+        index = bisect_left(self._maxes, name)
+        bucket = self._buckets[index]
+        del bucket[bisect_left(bucket, name)]
+        if bucket:
+            self._maxes[index] = bucket[-1]
+        else:
+            del self._buckets[index]
+            del self._maxes[index]
+        self._len -= 1
+
+    def iter_from(self, start, inclusive=True):
+        """Names >= start (or > start), in order"""
+        index = bisect_left(self._maxes, start) if inclusive else bisect_right(self._maxes, start)
+        for bucket_index in range(index, len(self._buckets)):
+            bucket = self._buckets[bucket_index]
+            position = 0
+            if bucket_index == index:
+                position = bisect_left(bucket, start) if inclusive else bisect_right(bucket, start)
+            yield from bucket[position:]
+
+class Directory:
+    """A directory node: child name -> Directory, or None for a file"""
+    __slots__ = ("children", "names")
+
+    def __init__(self):
+        self.children = {}
+        self.names = SortedNames()
+
+class _RWLock:
+    """Readers-writer lock that lets waiting writers in ahead of new readers"""
+    __slots__ = ("cond", "readers", "writer", "waiting_writers", "refs")
+
+    def __init__(self):
+        self.cond = threading.Condition(threading.Lock())
+        self.readers = 0
+        self.writer = False
+        self.waiting_writers = 0
+        self.refs = 0  # holders and waiters, the entry is dropped from the table at zero
+
+    def acquire(self, write):
+        with self.cond:
+            if write:
+                self.waiting_writers += 1
+                while self.writer or self.readers:
+                    self.cond.wait()
+                self.waiting_writers -= 1
+                self.writer = True
+            else:
+                while self.writer or self.waiting_writers:
+                    self.cond.wait()
+                self.readers += 1
+
+    def release(self, write):
+        with self.cond:
+            if write:
+                self.writer = False
+            else:
+                self.readers -= 1
+            if not self.writer and not self.readers:
+                self.cond.notify_all()
+
+class PathLocks:
+    """Per-path readers-writer locks, created on demand and dropped when unused.
+
+    Like GFS, an operation read-locks every ancestor of the directory it
+    touches and read- or write-locks the directory itself, so operations in
+    different directories never wait for each other.
+    """
+
+    def __init__(self):
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    def _ref(self, path):
+        with self._guard:
+            lock = self._locks.get(path)
+            if lock is None:
+                lock = self._locks[path] = _RWLock()
+            lock.refs += 1
+            return lock
+
+    def _unref(self, path, lock):
+        with self._guard:
+            lock.refs -= 1
+            if lock.refs == 0:
+                del self._locks[path]
+
+    @contextmanager
+    def locked(self, path, write=False):
+        # Ancestors first, a fixed order that cannot deadlock
+        plan = [(ancestor, False) for ancestor in ancestors(path)] + [(path, write)]
+        held = []
+        try:
+            for lock_path, lock_write in plan:
+                lock = self._ref(lock_path)
+                try:
+                    lock.acquire(lock_write)
+                except BaseException:
+                    self._unref(lock_path, lock)
+                    raise
+                held.append((lock_path, lock, lock_write))
+            yield
+        finally:
+            for lock_path, lock, lock_write in reversed(held):
+                lock.release(lock_write)
+                self._unref(lock_path, lock)
+
+    def __len__(self):
+        return len(self._locks)
+
+class Namespace:
+    """Directory tree over the master's file table.
+
+    File metadata stays in metadata["files"] keyed by full path, the tree only
+    records which names exist in which directory so a directory can be listed
+    in order without scanning every file. Mutations are applied by the master
+    under metadata_lock, reads only take path locks.
+    """
+
+    def __init__(self):
+        self.root = Directory()
+        self.locks = PathLocks()
+        self.directories = 1
+        self.files = 0
+
+    def _walk(self, path):
+        """Directory node for path, caller holds a lock on it"""
+        node = self.root
+        for part in path.split("/") if path else []:
+            node = node.children.get(part, False)
+            if node is False:
+                raise NamespaceError(f"No such directory: {path}", 404)
+            if node is None:
+                raise NamespaceError(f"Not a directory: {path}", 409)
+        return node
+
+    def _insert(self, node, name, child):
+        node.children[name] = child
+        node.names.add(name)
+
+    def check_file(self, path):
+        """Raise unless path could be created or overwritten as a file"""
+        if not path:
+            raise NamespaceError("Invalid file path: root is a directory")
+        node = self.root
+        for part in path.split("/"):
+            if node is None:
+                raise NamespaceError(f"Not a directory: {path}", 409)
+            node = node.children.get(part, False)
+            if node is False:
+                return
+        if node is not None:
+            raise NamespaceError(f"Is a directory: {path}", 409)
+
+    def check_mkdir(self, path, parents=False):
+        """True if mkdir would create path, False if it is already a directory, raises otherwise"""
+        node = self.root
+        parts = path.split("/") if path else []
+        for depth, part in enumerate(parts):
+            child = node.children.get(part, False)
+            if child is None:
+                raise NamespaceError(f"Not a directory: {'/'.join(parts[:depth + 1])}", 409)
+            if child is False:
+                if not parents and depth < len(parts) - 1:
+                    raise NamespaceError(f"No such directory: {'/'.join(parts[:depth + 1])}", 404)
+                return True
+            node = child
+        return False
+
+    def mkdir(self, path, parents=False):
+        """Create a directory, with parents create missing ancestors. Returns False if it existed"""
+        if not path:
+            return False
+        parent_path = ""
+        created = False
+        parts = path.split("/")
+        for depth, part in enumerate(parts):
+            current = f"{parent_path}/{part}" if parent_path else part
+            with self.locks.locked(parent_path, write=True):
+                parent = self._walk(parent_path)
+                child = parent.children.get(part, False)
+                if child is None:
+                    raise NamespaceError(f"Not a directory: {current}", 409)
+                if child is False:
+                    if not parents and depth < len(parts) - 1:
+                        raise NamespaceError(f"No such directory: {current}", 404)
+                    self._insert(parent, part, Directory())
+                    self.directories += 1
+                    created = True
+            parent_path = current
+        return created
+
+    def add_file(self, path):
+        """Add a file entry, creating missing parent directories"""
+        parent_path, name = split_path(path)
+        if parent_path:
+            self.mkdir(parent_path, parents=True)
+        with self.locks.locked(parent_path, write=True):
+            parent = self._walk(parent_path)
+            existing = parent.children.get(name, False)
+            if existing is False:
+                self._insert(parent, name, None)
+                self.files += 1
+            elif existing is not None:
+                raise NamespaceError(f"Is a directory: {path}", 409)
+
+    def remove_file(self, path):
+        parent_path, name = split_path(path)
+        with self.locks.locked(parent_path, write=True):
+            parent = self._walk(parent_path)
+            if name in parent.children and parent.children[name] is None:
+                del parent.children[name]
+                parent.names.remove(name)
+                self.files -= 1
+
+    def list(self, path, prefix="", after="", limit=100):
+        """One page of a directory: ([(name, is_dir)], more entries follow)"""
+        with self.locks.locked(path):
+            node = self._walk(path)
+            start = max(prefix, after)
+            entries = []
+            for name in node.names.iter_from(start, inclusive=not after or start != after):
+                if not name.startswith(prefix) or len(entries) > limit:
+                    break
+                entries.append((name, node.children[name] is not None))
+        return entries[:limit], len(entries) > limit
+
+    def stat(self, path):
+        """('directory', entry count) or ('file', None), raises if path does not exist"""
+        parent_path, name = split_path(path)
+        with self.locks.locked(parent_path):
+            if not path:
+                return "directory", len(self.root.names)
+            child = self._walk(parent_path).children.get(name, False)
+            if child is False:
+                raise NamespaceError(f"No such file or directory: {path}", 404)
+            if child is None:
+                return "file", None
+            return "directory", len(child.names)
+
+    def rebuild(self, filenames, directories=()):
+        """Replace the tree, used at startup and when a shadow loads a snapshot"""
+        root = Directory()
+        pending = {}  # directory node -> names to insert, sorted once at the end
+        directory_count = 1
+        file_count = 0
+
+        def ensure(parts):
+            nonlocal directory_count
+            node = root
+            for part in parts:
+                child = node.children.get(part, False)
+                if child is False:
+                    child = node.children[part] = Directory()
+                    pending.setdefault(id(node), (node, []))[1].append(part)
+                    directory_count += 1
+                elif child is None:
+                    return None
+                node = child
+            return node
+
+        for path in directories:
+            ensure(path.split("/") if path else [])
+        for path in filenames:
+            parts = path.split("/")
+            # Legacy names that are not canonical paths stay out of the tree
+            if "" in parts or "." in parts or ".." in parts:
+                continue
+            parent = ensure(parts[:-1])
+            if parent is not None and parts[-1] not in parent.children:
+                parent.children[parts[-1]] = None
+                pending.setdefault(id(parent), (parent, []))[1].append(parts[-1])
+                file_count += 1
+
+        for node, names in pending.values():
+            node.names = SortedNames(names)
+        self.root = root
+        self.directories = directory_count
+        self.files = file_count
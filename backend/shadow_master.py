@@ -0,0 +1,210 @@
+import json
+import os
+import time
+import threading
+import http.client
+from urllib.parse import urlencode, urlparse, parse_qs, urlsplit
+import master_node
+from master_node import MasterHandler, ThreadedHTTPServer, apply_mutation, heartbeat_lock, metadata_lock
+from metrics import Counter, Gauge
+
+PRIMARY_URL = os.environ.get("PRIMARY_URL", "http://master:8000")
+SHADOW_ID = os.environ.get("SHADOW_ID", "shadow_1")
+SHADOW_PORT = int(os.environ.get("SHADOW_PORT", "8010"))
+MAX_STALENESS = float(os.environ.get("SHADOW_MAX_STALENESS", "5"))  # seconds before reads are refused
+POLL_WAIT = 1.0  # seconds the primary holds a replication long poll open
+SERVER_SYNC_INTERVAL = 1.0  # seconds between chunk server table refreshes
+RETRY_DELAY = 1.0  # seconds before retrying after the primary was unreachable
+
+# Replication state
+epoch = None  # primary log epoch, None until a snapshot was loaded
+applied_seq = 0
+primary_seq = 0
+caught_up_at = None  # time.monotonic() of the last reply that left nothing to apply
+state_lock = threading.Lock()
+
+# Shadow metrics
+MUTATIONS_APPLIED = Counter("gfs_shadow_mutations_applied_total", "Mutations replayed from the primary")
+SNAPSHOTS_LOADED = Counter("gfs_shadow_snapshots_loaded_total", "Full snapshots loaded from the primary")
+STALE_REJECTIONS = Counter("gfs_shadow_stale_rejections_total", "Reads refused because the shadow was too stale")
+Gauge("gfs_shadow_staleness_seconds", "Upper bound on how far this shadow trails the primary",
+      callback=lambda: staleness())
+Gauge("gfs_shadow_replication_lag", "Mutations logged on the primary but not yet applied",
+      callback=lambda: primary_seq - applied_seq)
+
+def staleness():
+    """Upper bound in seconds on how far reads trail the primary"""
+    with state_lock:
+        if caught_up_at is None:
+            return float("inf")
+        return time.monotonic() - caught_up_at
+
+class PrimaryConnection:
+    """Persistent connection to the primary, reopened after errors"""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.conn = None
+
+    def get(self, path, timeout):
+        if self.conn is None:
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=timeout)
+        self.conn.timeout = timeout
+        try:
+            self.conn.request("GET", path)
+            response = self.conn.getresponse()
+            data = response.read()
+        except (http.client.HTTPException, OSError):
+            self.conn.close()
+            self.conn = None
+            raise
+        if response.status >= 400:
+            raise RuntimeError(f"GET {path} failed with HTTP {response.status}")
+        return json.loads(data.decode())
+
+def load_snapshot(primary):
+    """Replace local metadata and users with a snapshot of the primary"""
+    global epoch, applied_seq, primary_seq, caught_up_at
+    snapshot = primary.get("/replication_snapshot", timeout=60)
+    
+    with metadata_lock:
+        master_node.metadata = snapshot["metadata"]
+        master_node.metadata.setdefault("directories", {})
+        master_node.metadata.setdefault("uploads", {})
+        master_node.rebuild_namespace()
+        master_node.users.clear()
+        master_node.users.update(snapshot["users"])
+        with state_lock:
+            epoch = snapshot["epoch"]
+            applied_seq = primary_seq = snapshot["seq"]
+            caught_up_at = None  # mutations may have happened since, wait for the first poll
+    
+    SNAPSHOTS_LOADED.inc()
+    print(f"[{SHADOW_ID}] Loaded snapshot at seq {snapshot['seq']} "
+          f"({len(snapshot['metadata']['files'])} files)")
+
+def replicate():
+    """Follow the primary's replication log forever"""
+    global epoch, applied_seq, primary_seq, caught_up_at
+    primary = PrimaryConnection(PRIMARY_URL)
+    last_server_sync = 0
+    
+    while True:
+        try:
+            if epoch is None:
+                load_snapshot(primary)
+            
+            query = {"since": applied_seq, "epoch": epoch, "wait": POLL_WAIT}
+            if time.monotonic() - last_server_sync >= SERVER_SYNC_INTERVAL:
+                query["servers"] = 1
+            reply = primary.get(f"/replication_log?{urlencode(query)}", timeout=POLL_WAIT + 10)
+            received_at = time.monotonic()
+            
+            if reply.get("snapshot_required"):
+                print(f"[{SHADOW_ID}] Fell out of the primary's log, resyncing")
+                with state_lock:
+                    epoch = None
+                continue
+            
+            ops = reply["ops"]
+            if ops:
+                with metadata_lock:
+                    for seq, op in ops:
+                        apply_mutation(op)
+                    with state_lock:
+                        applied_seq = ops[-1][0]
+                MUTATIONS_APPLIED.inc(amount=len(ops))
+            
+            if "servers" in reply:
+                with heartbeat_lock:
+                    master_node.chunk_servers.clear()
+                    master_node.chunk_servers.update(reply["servers"])
+                last_server_sync = received_at
+            
+            with state_lock:
+                primary_seq = reply["seq"]
+                if applied_seq >= primary_seq:
+                    caught_up_at = received_at
+        
+        except Exception as e:
+            print(f"[{SHADOW_ID}] Replication from {PRIMARY_URL} failed: {e}")
+            time.sleep(RETRY_DELAY)
+
+class ShadowHandler(MasterHandler):
+    """Serves the primary's read-only routes from replicated state"""
+    read_routes = ("/status", "/users", "/logs", "/lookup", "/list", "/stat")
+
+    def _replication_info(self):
+        with state_lock:
+            seq, latest = applied_seq, primary_seq
+        return {
+            "role": "shadow",
+            "shadow_id": SHADOW_ID,
+            "primary": PRIMARY_URL,
+            "applied_seq": seq,
+            "primary_seq": latest,
+            "staleness_seconds": round(staleness(), 3),
+            "max_staleness_seconds": MAX_STALENESS
+        }
+
+    def _server_table(self):
+        with heartbeat_lock:
+            return {sid: dict(info) for sid, info in master_node.chunk_servers.items()}
+
+    def end_headers(self):
+        # Every reply says how current it is, clients can decide to go to the primary
+        self.send_header("X-GFS-Role", "shadow")
+        self.send_header("X-GFS-Staleness", f"{staleness():.3f}")
+        super().end_headers()
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        path = parsed.path
+        
+        if path == "/metrics":
+            self._handle_metrics()
+            return
+        if path not in self.read_routes:
+            self._send_json({"error": "Not found"}, 404)
+            return
+        
+        query = parse_qs(parsed.query)
+        try:
+            limit = min(float(query.get("max_staleness", [MAX_STALENESS])[0]), MAX_STALENESS)
+        except ValueError:
+            limit = MAX_STALENESS
+        current = staleness()
+        if current > limit:
+            STALE_REJECTIONS.inc()
+            self._send_json({
+                "error": "Shadow master is too stale",
+                "staleness_seconds": None if current == float("inf") else round(current, 3),
+                "primary": PRIMARY_URL
+            }, 503)
+            return
+        
+        super().do_GET()
+
+    def do_POST(self):
+        content_length = int(self.headers.get('Content-Length', 0))
+        if content_length > 0:
+            self.rfile.read(content_length)
+        self._send_json({"error": "Read-only shadow master, send writes to the primary",
+                         "primary": PRIMARY_URL}, 403)
+
+    def log_message(self, format, *args):
+        """Log HTTP requests off the request thread"""
+        master_node.request_log.submit(f"[{SHADOW_ID}] {self.address_string()} - {format % args}")
+
+def main():
+    # Start following the primary
+    threading.Thread(target=replicate, daemon=True).start()
+    
+    server = ThreadedHTTPServer(('0.0.0.0', SHADOW_PORT), ShadowHandler)
+    print(f"[{SHADOW_ID}] Shadow master of {PRIMARY_URL} started on port {SHADOW_PORT}")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
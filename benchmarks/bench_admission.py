@@ -0,0 +1,259 @@
+"""Heartbeat latency and false failures while one user floods the master.
+
+Starts a local cluster with --fake-servers extra chunk servers whose
+heartbeats come from this process, so every heartbeat round trip is timed.
+After a quiet --baseline-seconds, --flood-procs processes with
+--flood-threads threads each send requests as a single logged-in user for
+--seconds without pausing:
+
+  upload  /allocate_chunks then /register_chunk, a bulk upload of many
+          files at once; mostly waits on metadata_lock
+  lookup  /lookup of one file, a bulk download; CPU bound
+
+Refused requests are retried after their Retry-After as client_script does;
+--ignore-retry-after retries them at once instead. Meanwhile another user
+looks a file up every 50ms.
+
+Each flood runs with admission control off (WORKER_THREADS=0, one thread
+per request as before) and on (bounded workers, heartbeats first, a token
+bucket per user). Reports heartbeat latency, servers the master suspected
+or failed although they never stopped beating, what the flood got through
+and the other user's lookup latency.
+
+    python3 benchmarks/bench_admission.py --flood-procs 2 --flood-threads 32 --seconds 30
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+from cluster import LocalCluster, http_json  # noqa: E402
+from run_benchmarks import latency_summary  # noqa: E402
+
+
+def login(master_url, username):
+    http_json(f"{master_url}/signup", {"username": username, "password": "bench"})
+    return http_json(f"{master_url}/login", {"username": username, "password": "bench"})["token"]
+
+
+class Timed:
+    """Persistent JSON requests to the master recording (phase, status, latency)"""
+
+    def __init__(self, port, token=None):
+        self.port = port
+        self.headers = {"Content-Type": "application/json"}
+        if token:
+            self.headers["Authorization"] = f"Bearer {token}"
+        self.conn = None
+        self.samples = []
+
+    def call(self, method, path, payload=None, phase=None):
+        start = time.perf_counter()
+        self.retry_after = 0
+        try:
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=30)
+            self.conn.request(method, path, body=json.dumps(payload) if payload is not None else None,
+                              headers=self.headers)
+            response = self.conn.getresponse()
+            body = response.read()
+            status = response.status
+            self.retry_after = float(response.getheader("Retry-After", 0))
+            if response.will_close:
+                self.conn.close()
+                self.conn = None
+        except (http.client.HTTPException, OSError):
+            if self.conn is not None:
+                self.conn.close()
+            self.conn = None
+            status, body = None, b""
+        if phase is not None:
+            self.samples.append((phase, status, time.perf_counter() - start))
+        return status, body
+
+
+def heartbeats(port, server_id, interval, state, samples):
+    client = Timed(port)
+    payload = {"server_id": server_id, "host": "127.0.0.1", "port": 1, "heartbeat_interval": interval}
+    while state["running"]:
+        start = time.perf_counter()
+        client.call("POST", "/heartbeat", payload, state["phase"])
+        time.sleep(max(0.0, interval - (time.perf_counter() - start)))
+    samples.extend(client.samples)
+
+
+def lookups(port, token, filename, state, samples):
+    client = Timed(port, token)
+    while state["running"]:
+        client.call("GET", f"/lookup?filename={filename}", phase=state["phase"])
+        time.sleep(0.05)
+    samples.extend(client.samples)
+
+
+def flood_worker(kind, port, token, deadline, counts, lock, worker, honor_retry_after):
+    client = Timed(port, token)
+    ok = shed = failed = 0
+    n = 0
+    while time.time() < deadline:
+        if kind == "lookup":
+            status, _ = client.call("GET", "/lookup?filename=bench/probe.bin")
+        else:
+            filename = f"bench/flood/{os.getpid()}-{worker}-{n}.bin"
+            n += 1
+            status, body = client.call("POST", "/allocate_chunks", {"filename": filename, "filesize": 1024})
+        if kind == "upload" and status == 200:
+            allocation = json.loads(body)["allocations"][0]
+            status, _ = client.call("POST", "/register_chunk", {
+                "filename": filename, "chunk_id": allocation["chunk_id"], "servers": allocation["servers"]})
+        if status == 200:
+            ok += 1
+        elif status == 429:
+            shed += 1
+            if honor_retry_after:
+                time.sleep(client.retry_after * random.uniform(1, 1.5))
+        else:
+            failed += 1
+    with lock:
+        counts["ok"] += ok
+        counts["shed"] += shed
+        counts["failed"] += failed
+
+
+def flood_process(kind, port, token, seconds, threads, honor_retry_after, queue):
+    counts = {"ok": 0, "shed": 0, "failed": 0}
+    lock = threading.Lock()
+    deadline = time.time() + seconds
+    workers = [threading.Thread(target=flood_worker, args=(kind, port, token, deadline, counts, lock, i,
+                                                           honor_retry_after))
+               for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    queue.put(counts)
+
+
+def failure_transitions(log_path, offset, fake_ids):
+    """Suspected and failed transitions of servers that kept beating, logged after offset"""
+    with open(log_path, "rb") as f:
+        f.seek(offset)
+        lines = f.read().decode(errors="replace").splitlines()
+    transitions = {"suspected": 0, "failed": 0}
+    for line in lines:
+        for state in transitions:
+            if f"marked as {state.upper()}" in line and any(f"Server {sid} " in line for sid in fake_ids):
+                transitions[state] += 1
+    return transitions
+
+
+def run(args, kind, mode):
+    if mode == "off":
+        env = {"WORKER_THREADS": "0", "RATE_LIMIT": "0"}
+    else:
+        env = {"WORKER_THREADS": str(args.workers), "MAX_QUEUE": str(args.max_queue),
+               "RATE_LIMIT": str(args.rate_limit)}
+    with LocalCluster(args.chunk_servers, heartbeat_interval=args.heartbeat_interval,
+                      heartbeat_timeout=args.heartbeat_timeout, extra_env=env) as cluster:
+        port = cluster.master_port
+        flood_token = login(cluster.master_url, "flooder")
+        reader_token = login(cluster.master_url, "reader")
+        allocation = http_json(f"{cluster.master_url}/allocate_chunks",
+                               {"filename": "bench/probe.bin", "filesize": 1024})["allocations"][0]
+        http_json(f"{cluster.master_url}/register_chunk", {"filename": "bench/probe.bin",
+                  "chunk_id": allocation["chunk_id"], "servers": allocation["servers"]})
+
+        state = {"running": True, "phase": "baseline"}
+        heartbeat_samples, lookup_samples = [], []
+        fake_ids = [f"bench_server_{i}" for i in range(args.fake_servers)]
+        threads = [threading.Thread(target=heartbeats, args=(port, sid, args.heartbeat_interval, state,
+                                                              heartbeat_samples)) for sid in fake_ids]
+        threads.append(threading.Thread(target=lookups, args=(port, reader_token, "bench/probe.bin", state,
+                                                              lookup_samples)))
+        for thread in threads:
+            thread.start()
+        time.sleep(args.baseline_seconds)
+
+        log_offset = os.path.getsize(cluster.master.log_path)
+        state["phase"] = "overload"
+        queue = multiprocessing.Queue()
+        floods = [multiprocessing.get_context("fork").Process(
+            target=flood_process,
+            args=(kind, port, flood_token, args.seconds, args.flood_threads, not args.ignore_retry_after, queue))
+            for _ in range(args.flood_procs)]
+        for flood in floods:
+            flood.start()
+        counts = {"ok": 0, "shed": 0, "failed": 0}
+        for _ in floods:
+            for key, value in queue.get().items():
+                counts[key] += value
+        for flood in floods:
+            flood.join()
+        state["phase"] = "after"
+        time.sleep(args.heartbeat_interval * 4)  # late verdicts on heartbeats sent during the flood
+
+        state["running"] = False
+        for thread in threads:
+            thread.join()
+        transitions = failure_transitions(cluster.master.log_path, log_offset, fake_ids)
+
+    def summary(samples, phase):
+        done = [latency for p, status, latency in samples if p == phase and status == 200]
+        result = latency_summary(done) if done else {"count": 0}
+        if done:
+            result["max_ms"] = round(max(done) * 1000, 3)
+        result["rejected"] = sum(1 for p, status, _ in samples if p == phase and status == 429)
+        result["errors"] = sum(1 for p, status, _ in samples if p == phase and status not in (200, 429))
+        return result
+
+    return {
+        "flood": kind,
+        "admission": mode,
+        "heartbeat": {phase: summary(heartbeat_samples, phase) for phase in ("baseline", "overload")},
+        "false_suspicions": transitions["suspected"],
+        "false_failures": transitions["failed"],
+        "false_failure_rate": round(transitions["failed"] / args.fake_servers, 3),
+        "flood_ok_per_sec": round(counts["ok"] / args.seconds, 1),
+        "flood_shed_per_sec": round(counts["shed"] / args.seconds, 1),
+        "flood_errors": counts["failed"],
+        "other_user_lookup": {phase: summary(lookup_samples, phase) for phase in ("baseline", "overload")},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunk-servers", type=int, default=3)
+    parser.add_argument("--fake-servers", type=int, default=20, help="chunk servers beating from this process")
+    parser.add_argument("--heartbeat-interval", type=float, default=0.5)
+    parser.add_argument("--heartbeat-timeout", type=float, default=5.0)
+    parser.add_argument("--flood-procs", type=int, default=2)
+    parser.add_argument("--flood-threads", type=int, default=32, help="threads per flooding process")
+    parser.add_argument("--seconds", type=float, default=30, help="length of the flood")
+    parser.add_argument("--baseline-seconds", type=float, default=10)
+    parser.add_argument("--workers", type=int, default=16, help="WORKER_THREADS with admission on")
+    parser.add_argument("--max-queue", type=int, default=64, help="MAX_QUEUE with admission on")
+    parser.add_argument("--rate-limit", type=float, default=100, help="RATE_LIMIT per user with admission on")
+    parser.add_argument("--ignore-retry-after", action="store_true", help="flood retries refusals at once")
+    parser.add_argument("--floods", nargs="+", choices=["upload", "lookup"], default=["upload", "lookup"])
+    parser.add_argument("--modes", nargs="+", choices=["off", "on"], default=["off", "on"])
+    args = parser.parse_args()
+
+    results = {"config": vars(args), "runs": []}
+    for kind in args.floods:
+        for mode in args.modes:
+            result = run(args, kind, mode)
+            print(f"[BENCH] {json.dumps(result)}", file=sys.stderr)
+            results["runs"].append(result)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
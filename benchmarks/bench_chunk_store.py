@@ -0,0 +1,206 @@
+"""Chunk write throughput and read latency of the chunk server storage engines.
+
+Runs each engine in this process against a fresh directory under --dir:
+
+  legacy   the layout before chunk_store: open(path, 'wb').write in place,
+           no rename, no fsync
+  files    a file per chunk, written to .incoming and renamed into place
+  extents  chunks appended to preallocated extent files with an index log
+
+files and extents run with each durability mode (none, group commit every
+--group-commit-ms, fsync per write). --writers threads write --chunks chunks
+of --chunk-kb each; every write is timed up to its acknowledgement. Then
+--reads random whole chunks and --reads random 4KB ranges (packed small file
+reads) are read and sent over a local socket, as the /read handler does, with
+the page cache warm. Also reports fsyncs per write, writes per group commit
+and the files the engine left on disk.
+
+    python3 benchmarks/bench_chunk_store.py --chunks 2000 --chunk-kb 1024 --writers 8
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "backend"))
+
+from run_benchmarks import latency_summary  # noqa: E402
+
+import chunk_store  # noqa: E402
+
+KB = 1024
+MB = 1024 * KB
+CATEGORIES = ['text', 'images', 'documents', 'other']
+RANGE_BYTES = 4 * KB
+
+
+class LegacyWriter:
+    def __init__(self, path):
+        self.file = open(path, 'wb')
+
+    def write(self, data):
+        self.file.write(data)
+
+    def commit(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.file.close()
+
+
+class LegacyStore:
+    """Chunk writes and reads as chunk_server.py did them before the storage engines"""
+
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        for category in CATEGORIES:
+            os.makedirs(os.path.join(data_dir, category), exist_ok=True)
+
+    def load(self):
+        pass
+
+    def writer(self, chunk_id, category, size):
+        return LegacyWriter(os.path.join(self.data_dir, category, chunk_id))
+
+    def read(self, chunk_id, offset=0, length=-1):
+        with open(os.path.join(self.data_dir, 'other', chunk_id), 'rb') as f:
+            f.seek(offset)
+            return f.read(length)
+
+
+class Sink:
+    """One end of a socket pair drained by a thread, stands in for a client connection"""
+
+    def __init__(self):
+        self.send_side, receive_side = socket.socketpair()
+        threading.Thread(target=self._drain, args=(receive_side,), daemon=True).start()
+
+    def _drain(self, sock):
+        while sock.recv(MB):
+            pass
+
+    def close(self):
+        self.send_side.close()
+
+
+def disk_files(directory):
+    files = 0
+    allocated = 0
+    for root, _, names in os.walk(directory):
+        for name in names:
+            files += 1
+            allocated += os.stat(os.path.join(root, name)).st_blocks * 512
+    return files, allocated
+
+
+def fsyncs():
+    return chunk_store.FSYNC_LATENCY.snapshot()[0]
+
+
+def group_commits():
+    return chunk_store.GROUP_COMMIT_WRITES.snapshot()
+
+
+def run(args, engine, durability, payloads, rng):
+    data_dir = tempfile.mkdtemp(prefix=f"gfs-bench-{engine}-", dir=args.dir)
+    try:
+        if engine == "legacy":
+            store = LegacyStore(data_dir)
+        else:
+            store = chunk_store.open_store(engine, data_dir, CATEGORIES, durability, args.group_commit_ms / 1000,
+                                           args.extent_mb * MB)
+        store.load()
+        os.sync()  # start without writeback left over from the previous run
+        chunk_ids = [f"bench_chunk_{i:06d}" for i in range(args.chunks)]
+
+        def write(chunk_id):
+            data = payloads[int(chunk_id[-6:]) % len(payloads)]
+            start = time.perf_counter()
+            with store.writer(chunk_id, 'other', len(data)) as writer:
+                for offset in range(0, len(data), 256 * KB):  # as the upload handler streams it
+                    writer.write(data[offset:offset + 256 * KB])
+                writer.commit()
+            return time.perf_counter() - start
+
+        fsyncs_before = fsyncs()
+        commits_before = group_commits()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.writers) as executor:
+            write_latencies = list(executor.map(write, chunk_ids))
+        elapsed = time.perf_counter() - start
+        commits = [after - before for after, before in zip(group_commits(), commits_before)]
+
+        sink = Sink()
+
+        def read(chunk_id, offset, length):
+            start = time.perf_counter()
+            data = store.read(chunk_id, offset, length)
+            sink.send_side.sendall(data)
+            return time.perf_counter() - start
+
+        size = len(payloads[0])
+        whole = [read(rng.choice(chunk_ids), 0, -1) for _ in range(args.reads)]
+        ranges = [read(rng.choice(chunk_ids), rng.randrange(0, size - RANGE_BYTES), RANGE_BYTES)
+                  for _ in range(args.reads)]
+        sink.close()
+
+        files, allocated = disk_files(data_dir)
+        return {
+            "engine": engine,
+            "durability": durability,
+            "write_mb_per_sec": round(args.chunks * size / MB / elapsed, 1),
+            "writes_per_sec": round(args.chunks / elapsed, 1),
+            "write_latency": latency_summary(write_latencies),
+            "fsyncs_per_write": round((fsyncs() - fsyncs_before) / args.chunks, 2),
+            "writes_per_group_commit": round(commits[1] / commits[0], 1) if commits[0] else None,
+            "read_whole_chunk": latency_summary(whole),
+            "read_4kb_range": latency_summary(ranges),
+            "files_on_disk": files,
+            "disk_allocated_mb": round(allocated / MB, 1),
+        }
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--chunk-kb", type=int, default=1024)
+    parser.add_argument("--writers", type=int, default=8, help="concurrent writing threads")
+    parser.add_argument("--reads", type=int, default=5000, help="reads of each kind")
+    parser.add_argument("--group-commit-ms", type=float, default=0)
+    parser.add_argument("--extent-mb", type=int, default=64)
+    parser.add_argument("--dir", default=None, help="directory on the disk to measure, default the temp dir")
+    parser.add_argument("--engines", nargs="+", default=["legacy", "files", "extents"],
+                        choices=["legacy", "files", "extents"])
+    parser.add_argument("--durability", nargs="+", default=list(chunk_store.DURABILITY_MODES),
+                        choices=chunk_store.DURABILITY_MODES)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    payloads = [os.urandom(args.chunk_kb * KB) for _ in range(8)]
+    results = {"config": vars(args), "runs": []}
+    for engine in args.engines:
+        for durability in (["none"] if engine == "legacy" else args.durability):
+            result = run(args, engine, durability, payloads, rng)
+            print(f"[BENCH] {json.dumps(result)}", file=sys.stderr)
+            results["runs"].append(result)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Small-chunk upload latency with and without pooled connections.
+
+Starts a local cluster (50 chunk servers by default) and uploads small files
+through client_script.upload_file, alternating between a pool that never
+keeps connections (one TCP connection per request, like the old urllib path)
+and the default persistent pool. Reports per-file
+upload latency and how many connections each run opened.
+
+    python3 benchmarks/bench_connection_pool.py --chunk-servers 50 --files 500
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "backend"))
+
+from cluster import LocalCluster  # noqa: E402
+from run_benchmarks import latency_summary  # noqa: E402
+
+import client_script  # noqa: E402
+
+
+def upload_timed(pool, filename, payload):
+    client_script.connection_pool = pool
+    start = time.perf_counter()
+    client_script.upload_file(filename, payload, encrypt=False)
+    return time.perf_counter() - start
+
+
+def summarize(pool, latencies):
+    return {
+        "files": len(latencies),
+        "files_per_sec": round(len(latencies) / sum(latencies), 1),
+        "upload_latency": latency_summary(latencies),
+        "connections_opened": pool.connections_opened,
+        # open, acknowledge and commit the upload on the master plus one upload per replica
+        "requests": len(latencies) * 5,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunk-servers", type=int, default=50)
+    parser.add_argument("--files", type=int, default=500)
+    parser.add_argument("--file-size", type=int, default=4096)
+    args = parser.parse_args()
+
+    payload = "x" * args.file_size
+
+    # Silence the per-chunk progress prints so they don't dominate timings
+    stdout, sys.stdout = sys.stdout, open(os.devnull, "w")
+    try:
+        with LocalCluster(args.chunk_servers, heartbeat_interval=2.0, heartbeat_timeout=30.0) as cluster:
+            client_script.MASTER_URL = cluster.master_url
+            unpooled = client_script.ConnectionPool(max_idle_per_host=0)
+            pooled = client_script.ConnectionPool()
+            unpooled_latencies, pooled_latencies = [], []
+            # Interleave so the growing metadata file slows both variants equally
+            for i in range(args.files):
+                unpooled_latencies.append(upload_timed(unpooled, f"unpooled_{i}.txt", payload))
+                pooled_latencies.append(upload_timed(pooled, f"pooled_{i}.txt", payload))
+            before = summarize(unpooled, unpooled_latencies)
+            after = summarize(pooled, pooled_latencies)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    print(json.dumps({
+        "config": vars(args),
+        "per_request_connections": before,
+        "pooled_connections": after,
+        "p50_speedup": round(before["upload_latency"]["p50_ms"] / after["upload_latency"]["p50_ms"], 2),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
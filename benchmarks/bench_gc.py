@@ -0,0 +1,198 @@
+"""Garbage collection throughput and foreground latency benchmark.
+
+Builds a master metadata table of deleted files owning N chunks, then times
+each GC stage (tombstone collection, orphan scan of heartbeat chunk reports,
+batched deletion hand-out) while a foreground thread keeps taking
+metadata_lock the way request handlers do. Chunk server unlink throughput is
+measured separately on a temp directory.
+
+    python3 benchmarks/bench_gc.py --chunks 1000000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+import master_node  # noqa: E402
+import chunk_server  # noqa: E402
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def latency_summary(samples):
+    return {
+        "requests": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3) if samples else 0.0,
+    }
+
+
+class ForegroundProbe(threading.Thread):
+    """Simulates chunk lookups competing with GC for metadata_lock"""
+
+    def __init__(self, chunk_ids):
+        super().__init__(daemon=True)
+        self.chunk_ids = chunk_ids
+        self.samples = []
+        self.running = True
+
+    def run(self):
+        i = 0
+        while self.running:
+            chunk_id = self.chunk_ids[i % len(self.chunk_ids)]
+            start = time.perf_counter()
+            with master_node.metadata_lock:
+                master_node.metadata["chunks"].get(chunk_id)
+            self.samples.append(time.perf_counter() - start)
+            i += 1
+            time.sleep(0.001)
+
+    def stop(self):
+        self.running = False
+        self.join()
+        return latency_summary(self.samples)
+
+
+def build_metadata(num_chunks, servers, replicas, chunks_per_file):
+    """Populate metadata with tombstones already past retention"""
+    files = {}
+    chunks = {}
+    placement = {sid: [] for sid in servers}
+
+    for start in range(0, num_chunks, chunks_per_file):
+        tombstone = f"{master_node.TOMBSTONE_PREFIX}0/file_{start}.bin"
+        chunk_ids = [f"file_{start}.bin_chunk_{i}" for i in range(min(chunks_per_file, num_chunks - start))]
+        files[tombstone] = {"chunks": chunk_ids, "upload_time": "", "deleted_at": 0}
+        for n, chunk_id in enumerate(chunk_ids):
+            owners = [servers[(start + n + r) % len(servers)] for r in range(replicas)]
+            chunks[chunk_id] = {"servers": owners, "filename": tombstone}
+            for sid in owners:
+                placement[sid].append(chunk_id)
+
+    master_node.metadata = {"files": files, "chunks": chunks}
+    return placement
+
+
+def bench_master(args):
+    servers = [f"chunk_server_{i + 1}" for i in range(args.servers)]
+    placement = build_metadata(args.chunks, servers, args.replicas, args.chunks_per_file)
+    probe_ids = list(master_node.metadata["chunks"])[:1000]
+    results = {}
+
+    probe = ForegroundProbe(probe_ids)
+    probe.start()
+    time.sleep(args.baseline_seconds)
+    results["foreground_idle"] = probe.stop()
+
+    probe = ForegroundProbe(probe_ids)
+    probe.start()
+
+    start = time.perf_counter()
+    files, released = master_node.collect_deleted_files(time.time())
+    elapsed = time.perf_counter() - start
+    results["tombstone_collection"] = {
+        "files": files,
+        "chunks_released": released,
+        "seconds": round(elapsed, 3),
+        "chunks_per_sec": round(released / elapsed) if elapsed else 0,
+    }
+
+    for sid in servers:
+        master_node.chunk_reports[sid] = placement[sid]
+
+    start = time.perf_counter()
+    stats = master_node.run_gc_pass()
+    elapsed = time.perf_counter() - start
+    results["orphan_scan"] = {
+        "chunks_scanned": stats["chunks_scanned"],
+        "chunks_queued": stats["chunks_queued"],
+        "seconds": round(elapsed, 3),
+        "chunks_per_sec": round(stats["chunks_scanned"] / elapsed) if elapsed else 0,
+    }
+
+    start = time.perf_counter()
+    batches = 0
+    handed_out = 0
+    while True:
+        drained = [master_node.next_gc_batch(sid) for sid in servers]
+        if not any(drained):
+            break
+        batches += 1
+        handed_out += sum(len(batch) for batch in drained)
+    elapsed = time.perf_counter() - start
+    heartbeat_interval = chunk_server.HEARTBEAT_INTERVAL
+    results["batch_handout"] = {
+        "chunks": handed_out,
+        "heartbeat_rounds": batches,
+        "seconds": round(elapsed, 3),
+        "wall_clock_at_heartbeat_rate_s": batches * heartbeat_interval,
+    }
+
+    results["foreground_during_gc"] = probe.stop()
+    return results
+
+
+def bench_chunk_server(num_chunks):
+    """Measure chunk server unlink throughput on a temp directory"""
+    with tempfile.TemporaryDirectory() as tmp:
+        chunk_server.DATA_DIR = tmp
+        for category in chunk_server.CATEGORIES:
+            os.makedirs(os.path.join(tmp, category))
+
+        chunk_ids = [f"bench.bin_chunk_{i}" for i in range(num_chunks)]
+        for chunk_id in chunk_ids:
+            with open(os.path.join(tmp, "other", chunk_id), "wb") as f:
+                f.write(b"x" * 64)
+
+        start = time.perf_counter()
+        reported = len(chunk_server.list_chunks())
+        list_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        deleted = 0
+        batch = master_node.GC_BATCH_SIZE
+        for i in range(0, num_chunks, batch):
+            deleted += chunk_server.delete_chunks(chunk_ids[i:i + batch])
+        elapsed = time.perf_counter() - start
+
+    return {
+        "chunks_reported": reported,
+        "report_seconds": round(list_elapsed, 3),
+        "chunks_deleted": deleted,
+        "delete_seconds": round(elapsed, 3),
+        "chunks_per_sec": round(deleted / elapsed) if elapsed else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=1000000)
+    parser.add_argument("--servers", type=int, default=3)
+    parser.add_argument("--replicas", type=int, default=master_node.REPLICATION_FACTOR)
+    parser.add_argument("--chunks-per-file", type=int, default=64)
+    parser.add_argument("--disk-chunks", type=int, default=20000)
+    parser.add_argument("--baseline-seconds", type=float, default=2.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        master_node.METADATA_FILE = os.path.join(tmp, "chunks.json")
+        master_node.ORPHAN_GRACE_PERIOD = 0
+        results = {"config": vars(args), "master": bench_master(args)}
+
+    results["chunk_server"] = bench_chunk_server(args.disk_chunks)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
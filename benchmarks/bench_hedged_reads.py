@@ -0,0 +1,155 @@
+"""Read tail latency with one slow chunk server, with and without hedged reads.
+
+Uploads --files single-chunk files to a local cluster, then makes one chunk
+server slow by freezing its process (SIGSTOP) for --stall-ms at random
+intervals averaging --period-ms, the way a GC pause or a saturated disk
+stalls a replica. --readers threads read random files back, with replicas
+ordered two ways, each with and without hedging:
+
+  listed  replicas in the order the master lists them, the old behaviour
+  ewma    latency EWMA and in-flight ranking
+
+A hedged read sends a second request to the next replica once the first
+outlives the HEDGE_PERCENTILE of recent reads and cancels the loser. Each
+mode starts from a fresh selector and --warmup reads that are not counted.
+Reports latency percentiles, the fraction of reads hedged and how many of
+those the second replica won.
+
+    python3 benchmarks/bench_hedged_reads.py --files 200 --reads 5000 --stall-ms 150 --period-ms 500
+"""
+import argparse
+import json
+import os
+import random
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "backend"))
+
+from cluster import LocalCluster  # noqa: E402
+from run_benchmarks import latency_summary  # noqa: E402
+
+import client_script  # noqa: E402
+
+KB = 1024
+
+
+class ListedOrder(client_script.ReplicaSelector):
+    """Keeps the master's replica order, as reads did before replica selection"""
+
+    def rank(self, server_ids):
+        return list(server_ids)
+
+
+class Staller(threading.Thread):
+    """Freezes a process for stall seconds at exponentially distributed intervals"""
+
+    def __init__(self, pid, stall, period, seed):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.stall = stall
+        self.period = period
+        self.rng = random.Random(seed)
+        self.running = True
+        self.stalled_seconds = 0.0
+
+    def run(self):
+        while self.running:
+            time.sleep(self.rng.expovariate(1 / self.period))
+            os.kill(self.pid, signal.SIGSTOP)
+            try:
+                time.sleep(self.stall)
+            finally:
+                os.kill(self.pid, signal.SIGCONT)
+            self.stalled_seconds += self.stall
+
+
+def read_files(names, files, count, hedge, readers, rng):
+    def read(filename):
+        start = time.perf_counter()
+        if client_script.download_file(filename, decrypt=False, hedge=hedge) != files[filename]:
+            raise RuntimeError(f"{filename} read back wrong")
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=readers) as executor:
+        return list(executor.map(read, [rng.choice(names) for _ in range(count)]))
+
+
+def run_mode(mode, names, files, args, rng):
+    ordering, _, hedged = mode.partition("_")
+    client_script.replica_selector = ListedOrder() if ordering == "listed" else client_script.ReplicaSelector()
+    hedge = bool(hedged)
+    read_files(names, files, args.warmup, hedge, args.readers, rng)
+
+    hedged_before = client_script.HEDGED_READS.value()
+    wins_before = client_script.HEDGE_WINS.value()
+    start = time.perf_counter()
+    latencies = read_files(names, files, args.reads, hedge, args.readers, rng)
+    elapsed = time.perf_counter() - start
+    hedged = client_script.HEDGED_READS.value() - hedged_before
+    wins = client_script.HEDGE_WINS.value() - wins_before
+
+    result = {"mode": mode, "reads_per_sec": round(args.reads / elapsed, 1), **latency_summary(latencies)}
+    result["p999_ms"] = round(sorted(latencies)[int(len(latencies) * 0.999)] * 1000, 3)
+    result["hedged_fraction"] = round(hedged / args.reads, 4)
+    result["hedge_wins"] = wins
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunk-servers", type=int, default=3)
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--file-kb", type=int, default=256)
+    parser.add_argument("--reads", type=int, default=5000)
+    parser.add_argument("--readers", type=int, default=2, help="concurrent reading threads")
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--stall-ms", type=float, default=150, help="how long the slow server freezes")
+    parser.add_argument("--period-ms", type=float, default=500, help="mean time between freezes")
+    modes = ["listed", "listed_hedged", "ewma", "ewma_hedged"]
+    parser.add_argument("--modes", nargs="+", choices=modes, default=modes)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    results = {"config": vars(args), "runs": []}
+    # Silence per-upload progress prints
+    stdout, sys.stdout = sys.stdout, open(os.devnull, "w")
+    try:
+        # Stalls must not look like failures to the master
+        with LocalCluster(args.chunk_servers, heartbeat_interval=1.0, heartbeat_timeout=30.0) as cluster:
+            client_script.MASTER_URL = cluster.master_url
+            client_script.connection_pool = client_script.ConnectionPool()
+            files = {f"bench/hedge/{i:05d}.bin": os.urandom(args.file_kb * KB) for i in range(args.files)}
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                list(executor.map(lambda item: client_script.upload_file(item[0], item[1], encrypt=False),
+                                  files.items()))
+            names = sorted(files)
+
+            slow_server = sorted(cluster.chunk_servers)[0]
+            staller = Staller(cluster.chunk_servers[slow_server].proc.pid,
+                              args.stall_ms / 1000, args.period_ms / 1000, args.seed)
+            staller.start()
+            try:
+                for mode in args.modes:
+                    result = run_mode(mode, names, files, args, rng)
+                    result["slow_server"] = slow_server
+                    print(f"[BENCH] {json.dumps(result)}", file=sys.stderr)
+                    results["runs"].append(result)
+            finally:
+                staller.running = False
+                staller.join()
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
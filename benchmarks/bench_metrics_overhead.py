@@ -0,0 +1,145 @@
+"""Instrumentation overhead benchmark.
+
+Runs the same threaded JSON handler with and without InstrumentedHandlerMixin
+and InstrumentedLock in a separate server process, drives it from several
+client processes, and reports the throughput difference. Rounds alternate
+between the two variants to cancel out machine noise. Also reports the raw
+per-call cost of the hot-path primitives.
+
+    python3 benchmarks/bench_metrics_overhead.py --seconds 5 --rounds 5
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import threading
+import time
+import timeit
+from http.server import BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+import metrics  # noqa: E402
+from master_node import ThreadedHTTPServer  # noqa: E402
+
+STATE = {f"chunk_{i}": {"servers": ["chunk_server_1", "chunk_server_2"]} for i in range(50)}
+
+
+def make_handler(instrumented):
+    lock = metrics.InstrumentedLock("bench_lock") if instrumented else threading.Lock()
+    bases = (metrics.InstrumentedHandlerMixin, BaseHTTPRequestHandler) if instrumented else (BaseHTTPRequestHandler,)
+
+    class Handler(*bases):
+        metrics_routes = ("/status", "/metrics")
+
+        def do_GET(self):
+            if self.path == "/metrics":
+                self._handle_metrics()
+                return
+            with lock:
+                body = json.dumps(STATE).encode()
+            self.send_response(200)
+            self.send_header("Content-type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(instrumented, port_queue):
+    server = ThreadedHTTPServer(("127.0.0.1", 0), make_handler(instrumented))
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+def drive(port, seconds, result_queue):
+    deadline = time.perf_counter() + seconds
+    completed = 0
+    while time.perf_counter() < deadline:
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+        conn.request("GET", "/status")
+        conn.getresponse().read()
+        conn.close()
+        completed += 1
+    result_queue.put(completed)
+
+
+def run_round(instrumented, seconds, clients):
+    port_queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(instrumented, port_queue), daemon=True)
+    server.start()
+    port = port_queue.get(timeout=10)
+
+    result_queue = multiprocessing.Queue()
+    drivers = [multiprocessing.Process(target=drive, args=(port, seconds, result_queue)) for _ in range(clients)]
+    for proc in drivers:
+        proc.start()
+    total = sum(result_queue.get(timeout=seconds + 30) for _ in drivers)
+    for proc in drivers:
+        proc.join()
+
+    server.terminate()
+    server.join()
+    return total / seconds
+
+
+def microbenchmarks(number=200000):
+    registry = metrics.Registry()
+    counter = metrics.Counter("bench_total", "bench", ["route"], registry=registry)
+    histogram = metrics.Histogram("bench_seconds", "bench", ["route"], registry=registry)
+    plain_lock = threading.Lock()
+    lock = metrics.InstrumentedLock("micro_lock")
+
+    def with_plain_lock():
+        with plain_lock:
+            pass
+
+    def with_instrumented_lock():
+        with lock:
+            pass
+
+    def per_call_ns(fn):
+        return round(timeit.timeit(fn, number=number) / number * 1e9, 1)
+
+    return {
+        "counter_inc_ns": per_call_ns(lambda: counter.inc(("/status",))),
+        "histogram_observe_ns": per_call_ns(lambda: histogram.observe(0.0042, ("/status",))),
+        "lock_plain_ns": per_call_ns(with_plain_lock),
+        "lock_instrumented_ns": per_call_ns(with_instrumented_lock),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--clients", type=int, default=4)
+    args = parser.parse_args()
+
+    plain, instrumented = [], []
+    for _ in range(args.rounds):
+        plain.append(run_round(False, args.seconds, args.clients))
+        instrumented.append(run_round(True, args.seconds, args.clients))
+
+    plain_rps = statistics.median(plain)
+    instrumented_rps = statistics.median(instrumented)
+    results = {
+        "config": vars(args),
+        "plain_rps": round(plain_rps, 1),
+        "instrumented_rps": round(instrumented_rps, 1),
+        "overhead_pct": round((plain_rps - instrumented_rps) / plain_rps * 100, 2),
+        "rounds": {"plain": [round(r, 1) for r in plain], "instrumented": [round(r, 1) for r in instrumented]},
+        "primitives": microbenchmarks(),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""Directory listing latency in a large namespace.
+
+Fills the master's file table with N files laid out as data/dXXX/dYYYYY/ with
+--dir-size files per directory, rebuilds the directory tree the way the
+master does at startup, then times /list and /stat style operations on
+random directories: a full page, a walk in pages of 10, a prefix filter and
+stat. For comparison it times the flat scan a listing needed before (every
+filename checked against the prefix). Finally a writer thread keeps creating
+files, holding metadata_lock for --persist-ms per create the way the master
+does while it writes chunks.json, and listing is timed against reads that
+take metadata_lock like /status.
+
+All files share one metadata entry object so the table fits in memory, the
+namespace itself is built per file.
+
+    python3 benchmarks/bench_namespace.py --files 5000000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+import master_node  # noqa: E402
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def latency_summary(samples):
+    return {
+        "requests": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3) if samples else 0.0,
+    }
+
+
+def rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def directory(index):
+    return f"data/d{index // 1000:03d}/d{index:05d}"
+
+
+def timed(samples, func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    samples.append(time.perf_counter() - start)
+    return result
+
+
+def measure_listing(num_dirs, rng, samples):
+    latencies = []
+    for _ in range(samples):
+        entries, _ = timed(latencies, master_node.list_directory, directory(rng.randrange(num_dirs)))
+        assert entries
+    return latencies
+
+
+class Writer(threading.Thread):
+    """Keeps creating files through the master's mutation path"""
+
+    def __init__(self, target_dir, persist_seconds):
+        super().__init__(daemon=True)
+        self.target_dir = target_dir
+        self.persist_seconds = persist_seconds
+        self.running = True
+        self.created = 0
+
+    def run(self):
+        while self.running:
+            filename = f"{self.target_dir}/new-{self.created:07d}.log"
+            with master_node.metadata_lock:
+                master_node.commit_mutation({
+                    "op": "register_chunk", "filename": filename, "chunk_id": f"{filename}_chunk_0",
+                    "servers": ["chunk_server_1"], "upload_time": "2026-01-01T00:00:00"})
+                # Stand-in for _write_metadata, which does I/O with the lock held
+                time.sleep(self.persist_seconds)
+            self.created += 1
+            time.sleep(0.001)
+
+
+def read_under_metadata_lock(path, dir_size):
+    """A directory read the old way, through metadata_lock like /status"""
+    with master_node.metadata_lock:
+        return [master_node.metadata["files"].get(f"{path}/part-{j:03d}.log") for j in range(dir_size)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=5_000_000)
+    parser.add_argument("--dir-size", type=int, default=100)
+    parser.add_argument("--samples", type=int, default=2000)
+    parser.add_argument("--flat-scan-samples", type=int, default=3)
+    parser.add_argument("--persist-ms", type=float, default=5.0,
+                        help="time a create holds metadata_lock, standing in for writing chunks.json")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    num_dirs = args.files // args.dir_size
+    shared_info = {"chunks": ["chunk"], "upload_time": "2026-01-01T00:00:00"}
+
+    rss_start = rss_mb()
+    start = time.perf_counter()
+    files = master_node.metadata["files"]
+    for d in range(num_dirs):
+        prefix = directory(d)
+        for j in range(args.dir_size):
+            files[f"{prefix}/part-{j:03d}.log"] = shared_info
+    build_table_seconds = time.perf_counter() - start
+    rss_table = rss_mb()
+
+    start = time.perf_counter()
+    master_node.rebuild_namespace()
+    rebuild_seconds = time.perf_counter() - start
+    rss_namespace = rss_mb()
+
+    results = {
+        "config": vars(args),
+        "files": len(files),
+        "directories": master_node.namespace.directories,
+        "file_table_build_seconds": round(build_table_seconds, 2),
+        "namespace_rebuild_seconds": round(rebuild_seconds, 2),
+        "file_table_rss_mb": round(rss_table - rss_start, 1),
+        "namespace_rss_mb": round(rss_namespace - rss_table, 1),
+        "namespace_bytes_per_file": round((rss_namespace - rss_table) * 1024 * 1024 / len(files), 1),
+    }
+
+    results["list_page_100"] = latency_summary(measure_listing(num_dirs, rng, args.samples))
+
+    paged = []
+    for _ in range(args.samples // 10):
+        path, after, pages = directory(rng.randrange(num_dirs)), "", 0
+        start = time.perf_counter()
+        while True:
+            _, after = master_node.list_directory(path, after=after or "", limit=10)
+            pages += 1
+            if after is None:
+                break
+        paged.append(time.perf_counter() - start)
+    results["list_walk_pages_of_10"] = latency_summary(paged)
+
+    prefixed = []
+    for _ in range(args.samples):
+        timed(prefixed, master_node.list_directory, directory(rng.randrange(num_dirs)), prefix="part-05")
+    results["list_prefix_10_of_100"] = latency_summary(prefixed)
+
+    stats = []
+    for _ in range(args.samples):
+        timed(stats, master_node.stat_path, f"{directory(rng.randrange(num_dirs))}/part-042.log")
+    results["stat_file"] = latency_summary(stats)
+
+    flat = []
+    for _ in range(args.flat_scan_samples):
+        prefix = directory(rng.randrange(num_dirs)) + "/"
+        matches = timed(flat, lambda: sorted(name for name in files if name.startswith(prefix)))
+        assert len(matches) == args.dir_size
+    results["flat_scan_before"] = latency_summary(flat)
+
+    contention = [
+        ("list_with_writer_in_other_directory", "data/writes", master_node.list_directory),
+        ("list_with_writer_in_same_directory", directory(0), master_node.list_directory),
+        ("metadata_lock_read_with_writer", "data/writes",
+         lambda path: read_under_metadata_lock(path, args.dir_size)),
+    ]
+    for label, target, read in contention:
+        writer = Writer(target, args.persist_ms / 1000)
+        writer.start()
+        latencies = []
+        for _ in range(args.samples // 4):
+            path = target if target == directory(0) else directory(rng.randrange(num_dirs))
+            timed(latencies, read, path)
+            time.sleep(0.0005)
+        writer.running = False
+        writer.join()
+        results[label] = {**latency_summary(latencies), "writer_creates": writer.created}
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""Rebalancing after empty chunk servers join a full cluster.
+
+Fills a cluster of --chunk-servers to --fill of the capacity each server
+reports (CAPACITY_BYTES), then adds --add-servers empty ones and times how
+long the master's rebalancer takes to bring the utilisation spread (fullest
+minus emptiest server, from heartbeat stats) within the threshold. A
+foreground thread keeps reading whole files and uploading small ones the
+whole time; its latency before the new servers joined is compared with its
+latency while chunks were moving. Runs once per --bandwidth-mb cap and
+checks every file afterwards.
+
+    python3 benchmarks/bench_rebalance.py --files 150 --file-mb 4 --bandwidth-mb 10 40
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "backend"))
+
+from cluster import LocalCluster  # noqa: E402
+from run_benchmarks import latency_summary  # noqa: E402
+
+import client_script  # noqa: E402
+
+MB = 1024 * 1024
+
+
+class ForegroundLoad(threading.Thread):
+    """Reads random files and uploads small ones back to back, recording (phase, kind, latency)"""
+
+    def __init__(self, files, seed):
+        super().__init__(daemon=True)
+        self.files = files
+        self.rng = random.Random(seed)
+        self.phase = "baseline"
+        self.samples = []
+        self.errors = 0
+        self.running = True
+
+    def run(self):
+        written = 0
+        while self.running:
+            filename = self.rng.choice(list(self.files))
+            start = time.perf_counter()
+            try:
+                if client_script.download_file(filename, decrypt=False) != self.files[filename]:
+                    raise RuntimeError(f"{filename} read back wrong")
+                self.samples.append((self.phase, "read", time.perf_counter() - start))
+
+                start = time.perf_counter()
+                client_script.upload_file(f"bench/foreground/{written}.bin", os.urandom(256 * 1024), encrypt=False)
+                self.samples.append((self.phase, "write", time.perf_counter() - start))
+                written += 1
+            except Exception:
+                self.errors += 1
+
+    def summary(self, phase, kind):
+        return latency_summary([latency for p, k, latency in self.samples if p == phase and k == kind])
+
+
+def spread(cluster):
+    fills = [info["utilization"] for info in cluster.status()["servers"].values()
+             if info["status"] == "active" and info.get("utilization") is not None]
+    return (max(fills) - min(fills) if fills else 0.0), len(fills)
+
+
+def rebalanced_bytes(cluster):
+    with urllib.request.urlopen(f"{cluster.master_url}/metrics", timeout=10) as response:
+        for line in response.read().decode().splitlines():
+            if line.startswith("gfs_master_rebalance_bytes_total"):
+                return float(line.split()[-1])
+    return 0.0
+
+
+def run(args, bandwidth_mb, rng):
+    stored = args.files * args.file_mb * MB * 2  # two replicas
+    capacity = int(stored / args.chunk_servers / args.fill)
+    env = {
+        "CAPACITY_BYTES": str(capacity),
+        "REBALANCE_BANDWIDTH": str(bandwidth_mb * MB),
+        "REBALANCE_THRESHOLD": str(args.threshold),
+        "REBALANCE_INTERVAL": "1",
+    }
+    with LocalCluster(args.chunk_servers, heartbeat_interval=1.0, heartbeat_timeout=30.0, extra_env=env) as cluster:
+        client_script.MASTER_URL = cluster.master_url
+        client_script.connection_pool = client_script.ConnectionPool()
+        files = {f"bench/data/{i:05d}.bin": os.urandom(args.file_mb * MB) for i in range(args.files)}
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(lambda item: client_script.upload_file(item[0], item[1], encrypt=False), files.items()))
+        time.sleep(3)  # let every server report its usage
+        initial_spread, _ = spread(cluster)
+
+        load = ForegroundLoad(files, rng.random())
+        load.start()
+        time.sleep(args.baseline_seconds)
+
+        load.phase = "rebalancing"
+        joined = time.perf_counter()
+        for _ in range(args.add_servers):
+            cluster.add_chunk_server(wait=False)
+        cluster.wait_for_servers()
+
+        converged = None
+        total = args.chunk_servers + args.add_servers
+        while time.perf_counter() - joined < args.timeout:
+            current, reporting = spread(cluster)
+            if reporting == total and current <= args.threshold + args.tolerance:
+                converged = time.perf_counter() - joined
+                break
+            time.sleep(0.5)
+        load.running = False
+        load.join()
+
+        final_spread, _ = spread(cluster)
+        for filename, data in files.items():
+            if client_script.download_file(filename, decrypt=False) != data:
+                raise RuntimeError(f"{filename} does not match after rebalancing")
+
+        moved = rebalanced_bytes(cluster)
+        return {
+            "bandwidth_cap_mb_s": bandwidth_mb,
+            "capacity_mb_per_server": round(capacity / MB, 1),
+            "initial_spread": round(initial_spread, 4),
+            "final_spread": round(final_spread, 4),
+            "convergence_seconds": round(converged, 1) if converged is not None else None,
+            "moved_mb": round(moved / MB, 1),
+            "moved_mb_s": round(moved / MB / converged, 1) if converged else None,
+            "read_latency": {phase: load.summary(phase, "read") for phase in ("baseline", "rebalancing")},
+            "write_latency": {phase: load.summary(phase, "write") for phase in ("baseline", "rebalancing")},
+            "foreground_errors": load.errors,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunk-servers", type=int, default=3)
+    parser.add_argument("--add-servers", type=int, default=3)
+    parser.add_argument("--files", type=int, default=150)
+    parser.add_argument("--file-mb", type=int, default=4)
+    parser.add_argument("--fill", type=float, default=0.8, help="utilisation of the initial servers")
+    parser.add_argument("--bandwidth-mb", type=float, nargs="+", default=[10, 40], help="REBALANCE_BANDWIDTH in MB/s")
+    parser.add_argument("--threshold", type=float, default=0.05, help="REBALANCE_THRESHOLD")
+    parser.add_argument("--tolerance", type=float, default=0.01, help="spread above threshold still counted as converged")
+    parser.add_argument("--baseline-seconds", type=float, default=20)
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    results = {"config": vars(args), "runs": []}
+    # Silence per-upload progress prints
+    stdout, sys.stdout = sys.stdout, open(os.devnull, "w")
+    try:
+        for bandwidth_mb in args.bandwidth_mb:
+            result = run(args, bandwidth_mb, rng)
+            print(f"[BENCH] {json.dumps(result)}", file=sys.stderr)
+            results["runs"].append(result)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""Bytes re-sent when uploads are interrupted at random points and resumed.
+
+Uploads a file through client_script.upload_stream against a local cluster
+and interrupts it at random byte offsets, then resumes with the same upload
+id until it commits. Two faults are injected:
+
+  drop   the source stream fails mid-upload, the client acknowledges what it
+         stored and gives up (a dropped browser connection)
+  crash  the uploading process is killed, nothing is flushed
+
+Bytes written by the chunk servers are read from their /metrics, so the
+numbers include partially sent chunks. Restarting from scratch, the previous
+behaviour, would re-send everything written before each fault; that is
+reported alongside. Every committed file is downloaded and compared.
+
+    python3 benchmarks/bench_resumable_upload.py --file-mb 64 --trials 20 --faults 1 3
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "backend"))
+
+from cluster import LocalCluster, http_json  # noqa: E402
+
+import client_script  # noqa: E402
+
+MB = 1024 * 1024
+
+
+class InterruptedSource:
+    """Reads from data and fails once fail_at bytes have been read, crash=True kills the process instead"""
+
+    def __init__(self, data, fail_at=None, crash=False):
+        self.data = data
+        self.position = 0
+        self.fail_at = fail_at
+        self.crash = crash
+
+    def seekable(self):
+        return False  # like a request body, skipped chunks are read and dropped
+
+    def read(self, n):
+        if self.fail_at is not None and self.position + n > self.fail_at:
+            if self.crash:
+                os._exit(1)
+            raise ConnectionResetError("source interrupted")
+        piece = self.data[self.position:self.position + n]
+        self.position += len(piece)
+        return piece
+
+
+def bytes_written(cluster):
+    """Chunk bytes written to disk across all chunk servers"""
+    total = 0
+    for server_id in cluster.chunk_servers:
+        with urllib.request.urlopen(f"{cluster.chunk_server_url(server_id)}/metrics", timeout=10) as response:
+            for line in response.read().decode().splitlines():
+                if line.startswith("gfs_chunk_server_bytes_written_total"):
+                    total += float(line.split()[-1])
+    return total
+
+
+def crashing_upload(master_url, filename, data, upload_id, fail_at):
+    client_script.MASTER_URL = master_url
+    client_script.connection_pool = client_script.ConnectionPool()
+    client_script.upload_stream(filename, InterruptedSource(data, fail_at, crash=True), len(data),
+                                encrypt=False, upload_id=upload_id)
+
+
+def run_trial(cluster, mode, faults, trial, rng, data, replicas):
+    filename = f"bench/{mode}_{faults}_{trial}.bin"
+    fail_points = sorted(rng.randrange(1, len(data)) for _ in range(faults))
+    before = bytes_written(cluster)
+    wasted_restarting = 0
+    upload_id = None
+
+    if mode == "crash":
+        upload_id = http_json(f"{cluster.master_url}/upload_session",
+                              {"filename": filename, "filesize": len(data)})["upload_id"]
+
+    for fail_at in fail_points:
+        start = bytes_written(cluster)
+        if mode == "drop":
+            try:
+                result = client_script.upload_stream(filename, InterruptedSource(data, fail_at), len(data),
+                                                     encrypt=False, upload_id=upload_id)
+                upload_id = result["upload_id"]
+                break  # the remaining chunks were already stored, nothing left to interrupt
+            except client_script.UploadInterrupted as e:
+                upload_id = e.upload_id
+        else:
+            child = multiprocessing.get_context("fork").Process(
+                target=crashing_upload, args=(cluster.master_url, filename, data, upload_id, fail_at))
+            child.start()
+            child.join()
+        # Starting over would have thrown away everything this attempt wrote
+        wasted_restarting += bytes_written(cluster) - start
+
+    client_script.upload_stream(filename, InterruptedSource(data), len(data), encrypt=False, upload_id=upload_id)
+    if client_script.download_file(filename, decrypt=False) != data:
+        raise RuntimeError(f"{filename} does not match what was uploaded")
+
+    ideal = len(data) * replicas
+    written = bytes_written(cluster) - before
+    return {
+        "resent_bytes": written - ideal,
+        "restart_resent_bytes": wasted_restarting,
+        "ideal_bytes": ideal,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--file-mb", type=int, default=64)
+    parser.add_argument("--trials", type=int, default=20)
+    parser.add_argument("--faults", type=int, nargs="+", default=[1, 3], help="interruptions per upload")
+    parser.add_argument("--modes", nargs="+", choices=["drop", "crash"], default=["drop", "crash"])
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    data = os.urandom(args.file_mb * MB)
+    results = {"config": vars(args), "runs": []}
+
+    # Silence per-upload progress prints
+    stdout, sys.stdout = sys.stdout, open(os.devnull, "w")
+    try:
+        with LocalCluster(3, heartbeat_interval=1.0, heartbeat_timeout=30.0) as cluster:
+            client_script.MASTER_URL = cluster.master_url
+            replicas = min(2, len(cluster.chunk_servers))
+            for mode in args.modes:
+                for faults in args.faults:
+                    trials = [run_trial(cluster, mode, faults, trial, rng, data, replicas)
+                              for trial in range(args.trials)]
+                    resent = sum(t["resent_bytes"] for t in trials)
+                    restart = sum(t["restart_resent_bytes"] for t in trials)
+                    ideal = sum(t["ideal_bytes"] for t in trials)
+                    result = {
+                        "mode": mode,
+                        "faults_per_upload": faults,
+                        "uploads": len(trials),
+                        "resent_mb_per_upload": round(resent / len(trials) / MB, 2),
+                        "resent_fraction": round(resent / ideal, 4),
+                        "restart_resent_mb_per_upload": round(restart / len(trials) / MB, 2),
+                        "restart_resent_fraction": round(restart / ideal, 4),
+                    }
+                    print(f"[BENCH] {json.dumps(result)}", file=sys.stderr)
+                    results["runs"].append(result)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""Aggregate metadata read throughput with 0, 1, 2 and 4 shadow masters.
+
+Starts a local cluster, fills the namespace with files, then for each shadow
+count drives a read mix (mostly /lookup, some /users, /logs and /status)
+from several client processes against the shadows (or the primary alone for
+0) while a writer keeps registering chunks on the primary. Reports read
+throughput and latency, write latency on the primary, how long a write takes
+to become visible on a shadow, and the CPU each master process spent per
+read, which is what throughput scales with when each shadow has its own core.
+
+    python3 benchmarks/bench_shadow_masters.py --shadows 0 1 2 4 --seconds 10
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from cluster import LocalCluster, http_json  # noqa: E402
+from run_benchmarks import latency_summary  # noqa: E402
+
+READ_MIX = [("/lookup", 90), ("/users", 4), ("/logs", 4), ("/status", 2)]
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+
+def cpu_seconds(pid):
+    """User plus system CPU time of a process"""
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+
+def read_worker(targets, num_files, threads, seconds, seed):
+    """One client process: threads issuing the read mix over keep-alive connections"""
+    paths, weights = zip(*READ_MIX)
+    deadline = time.perf_counter() + seconds
+    results = []
+    lock = threading.Lock()
+
+    def loop(index):
+        rng = random.Random(seed * 1000 + index)
+        connections = {}
+        latencies, errors = [], 0
+        while time.perf_counter() < deadline:
+            target = targets[rng.randrange(len(targets))]
+            path = rng.choices(paths, weights)[0]
+            if path == "/lookup":
+                path += "?" + urlencode({"filename": f"file_{rng.randrange(num_files)}"})
+            start = time.perf_counter()
+            try:
+                conn = connections.get(target)
+                if conn is None:
+                    parts = urlsplit(target)
+                    conn = connections[target] = http.client.HTTPConnection(parts.hostname, parts.port, timeout=10)
+                conn.request("GET", path)
+                response = conn.getresponse()
+                response.read()
+                if response.status != 200:
+                    raise RuntimeError(response.status)
+                latencies.append(time.perf_counter() - start)
+            except Exception:
+                errors += 1
+                conn = connections.pop(target, None)
+                if conn is not None:
+                    conn.close()
+        with lock:
+            results.append((latencies, errors))
+
+    workers = [threading.Thread(target=loop, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return [value for latencies, _ in results for value in latencies], sum(errors for _, errors in results)
+
+
+def write_load(cluster, stop, seconds_between, results):
+    """Register chunks on the primary and time how long shadows take to see them"""
+    write_latencies, visibility = [], []
+    n = 0
+    while not stop.is_set():
+        filename = f"written_{n}_{time.time()}"
+        n += 1
+        start = time.perf_counter()
+        http_json(f"{cluster.master_url}/register_chunk", {
+            "filename": filename, "chunk_id": f"{filename}_chunk_0", "servers": ["chunk_server_1"]})
+        write_latencies.append(time.perf_counter() - start)
+
+        shadows = cluster.shadow_urls
+        if shadows:
+            url = f"{random.choice(shadows)}/lookup?{urlencode({'filename': filename})}"
+            while not stop.is_set():
+                try:
+                    http_json(url, timeout=5)
+                    visibility.append(time.perf_counter() - start)
+                    break
+                except Exception:
+                    time.sleep(0.002)
+        time.sleep(seconds_between)
+    results["write_latency"] = latency_summary(write_latencies)
+    if visibility:
+        results["write_visible_on_shadow"] = latency_summary(visibility)
+
+
+def populate(cluster, num_files):
+    def register(indexes):
+        for i in indexes:
+            http_json(f"{cluster.master_url}/register_chunk", {
+                "filename": f"file_{i}", "chunk_id": f"file_{i}_chunk_0",
+                "servers": ["chunk_server_1", "chunk_server_2"]})
+
+    threads = [threading.Thread(target=register, args=(range(t, num_files, 8),)) for t in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def wait_caught_up(cluster, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        seq = cluster.status()["replication"]["seq"]
+        if all(http_json(f"{url}/status")["replication"]["applied_seq"] >= seq for url in cluster.shadow_urls):
+            return
+        time.sleep(0.1)
+    raise RuntimeError("shadows did not catch up")
+
+
+def run_round(cluster, args, pool):
+    targets = cluster.shadow_urls or [cluster.master_url]
+    processes = {"primary": cluster.master.proc.pid}
+    processes.update({sid: proc.proc.pid for sid, proc in cluster.shadow_masters.items()})
+    cpu_before = {name: cpu_seconds(pid) for name, pid in processes.items()}
+
+    stop = threading.Event()
+    writes = {}
+    writer = threading.Thread(target=write_load, args=(cluster, stop, 1 / args.write_rate, writes))
+    writer.start()
+
+    start = time.perf_counter()
+    outcomes = pool.starmap(read_worker, [
+        (targets, args.files, args.threads, args.seconds, seed) for seed in range(args.clients)])
+    elapsed = time.perf_counter() - start
+    stop.set()
+    writer.join()
+
+    latencies = [value for worker_latencies, _ in outcomes for value in worker_latencies]
+    errors = sum(worker_errors for _, worker_errors in outcomes)
+    cpu = {name: round(cpu_seconds(pid) - cpu_before[name], 3) for name, pid in processes.items()}
+    read_cpu = sum(seconds for name, seconds in cpu.items() if name != "primary") if cluster.shadow_urls else cpu["primary"]
+
+    return {
+        "shadows": len(cluster.shadow_urls),
+        "reads_per_sec": round(len(latencies) / elapsed, 1),
+        "read_errors": errors,
+        "read_latency": latency_summary(latencies),
+        **writes,
+        "cpu_seconds": cpu,
+        "read_cpu_ms_per_request": round(read_cpu / max(1, len(latencies)) * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shadows", type=int, nargs="+", default=[0, 1, 2, 4])
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--clients", type=int, default=4, help="client processes")
+    parser.add_argument("--threads", type=int, default=4, help="threads per client process")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--write-rate", type=float, default=50, help="chunk registrations per second on the primary")
+    args = parser.parse_args()
+
+    results = {"config": vars(args), "cpus": os.cpu_count(), "rounds": []}
+    with LocalCluster(3, heartbeat_interval=1.0, heartbeat_timeout=15.0) as cluster:
+        populate(cluster, args.files)
+        with multiprocessing.get_context("fork").Pool(args.clients) as pool:
+            for count in sorted(args.shadows):
+                while len(cluster.shadow_masters) < count:
+                    cluster.add_shadow_master()
+                wait_caught_up(cluster)
+                result = run_round(cluster, args, pool)
+                print(f"[BENCH] {json.dumps(result)}", file=sys.stderr)
+                results["rounds"].append(result)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
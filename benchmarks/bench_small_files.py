@@ -0,0 +1,197 @@
+"""Small files packed into shared chunks versus one upload session per file.
+
+Uploads N few-KB files twice against a local cluster: one client_script
+upload_file per file (a session, a chunk per file and three chunks.json
+writes), then through upload_small_files, which packs them into 1MB chunks
+and commits up to 64 packs per master call. Reports files/sec uploaded and
+read back (lookup plus a chunk download or range read), and the files and
+disk blocks added on the chunk servers.
+
+Master memory per file is measured in-process: --memory-files entries are
+built through master_node.apply_mutation the way each path records them,
+under tracemalloc, along with the bytes each file adds to chunks.json.
+
+    python3 benchmarks/bench_small_files.py --files 5000 --memory-files 100000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "backend"))
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="gfs-bench-master-"))
+
+from cluster import LocalCluster  # noqa: E402
+
+import client_script  # noqa: E402
+import master_node  # noqa: E402
+from namespace import Namespace  # noqa: E402
+
+KB = 1024
+FILES_PER_PACK = 256  # in the memory model, 4KB files fill a 1MB pack
+
+
+def make_files(prefix, count, min_kb, max_kb, rng):
+    return [(f"{prefix}/app{i // 100:04d}/file-{i:06d}.conf", os.urandom(rng.randint(min_kb * KB, max_kb * KB)))
+            for i in range(count)]
+
+
+def disk_usage(cluster):
+    """(files, allocated bytes) stored across all chunk servers"""
+    files = 0
+    allocated = 0
+    for server_id in cluster.chunk_servers:
+        for category in os.scandir(os.path.join(cluster.base_dir, server_id)):
+            for entry in os.scandir(category.path):
+                files += 1
+                allocated += entry.stat().st_blocks * 512
+    return files, allocated
+
+
+def metadata_size(cluster):
+    path = os.path.join(cluster.base_dir, "master", "chunks.json")
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def upload_per_file(files, threads):
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(lambda f: client_script.upload_file(f[0], f[1], encrypt=False), files))
+
+
+def upload_packed(files, batch):
+    for start in range(0, len(files), batch):
+        result = client_script.upload_small_files(files[start:start + batch], encrypt=False)
+        if result["failed"]:
+            raise RuntimeError(f"{len(result['failed'])} files failed")
+
+
+def read_back(files, threads):
+    def check(entry):
+        filename, data = entry
+        if client_script.download_file(filename, decrypt=False) != data:
+            raise RuntimeError(f"{filename} does not match what was uploaded")
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(check, files))
+
+
+def measure_cluster(args, rng):
+    results = {}
+    # Silence per-upload progress prints
+    stdout, sys.stdout = sys.stdout, open(os.devnull, "w")
+    try:
+        with LocalCluster(3, heartbeat_interval=1.0, heartbeat_timeout=30.0) as cluster:
+            client_script.MASTER_URL = cluster.master_url
+            modes = [
+                ("per_file", lambda files: upload_per_file(files, args.threads)),
+                ("packed", lambda files: upload_packed(files, args.batch)),
+            ]
+            for mode, upload in modes:
+                files = make_files(f"bench/{mode}", args.files, args.min_kb, args.max_kb, rng)
+                disk_before = disk_usage(cluster)
+                metadata_before = metadata_size(cluster)
+
+                start = time.perf_counter()
+                upload(files)
+                upload_seconds = time.perf_counter() - start
+
+                start = time.perf_counter()
+                read_back(files, args.threads)
+                read_seconds = time.perf_counter() - start
+
+                disk_after = disk_usage(cluster)
+                metadata_after = metadata_size(cluster)
+                payload = sum(len(data) for _, data in files)
+                results[mode] = {
+                    "files": len(files),
+                    "payload_mb": round(payload / KB / KB, 1),
+                    "upload_files_per_sec": round(len(files) / upload_seconds, 1),
+                    "read_files_per_sec": round(len(files) / read_seconds, 1),
+                    "chunk_server_files_added": disk_after[0] - disk_before[0],
+                    "disk_allocated_mb": round((disk_after[1] - disk_before[1]) / KB / KB, 1),
+                    "chunks_json_bytes_per_file": round((metadata_after - metadata_before) / len(files), 1),
+                }
+                print(f"[BENCH] {mode} {json.dumps(results[mode])}", file=sys.stderr)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    return results
+
+
+def record_per_file(names):
+    """Metadata an upload session leaves per file: a file, a chunk and the committed session"""
+    for filename in names:
+        upload_id = os.urandom(8).hex()
+        now = time.time()
+        master_node.apply_mutation({"op": "begin_upload", "upload_id": upload_id, "filename": filename,
+                                    "num_chunks": 1, "encryption": None, "time": now})
+        master_node.apply_mutation({"op": "ack_chunks", "upload_id": upload_id, "time": now, "chunks": [
+            [0, master_node.chunk_handle(filename, 0, upload_id), ["chunk_server_1", "chunk_server_2"]]]})
+        master_node.apply_mutation({"op": "commit_upload", "upload_id": upload_id, "tombstone": None,
+                                    "upload_time": datetime.now().isoformat(), "time": now})
+
+
+def record_packed(names, files_per_pack):
+    """Metadata upload_small_files leaves per file: a byte range of a shared pack"""
+    for start in range(0, len(names), files_per_pack * client_script.PACKS_PER_COMMIT):
+        group = names[start:start + files_per_pack * client_script.PACKS_PER_COMMIT]
+        packs = [{
+            "chunk_id": f"{master_node.PACK_PREFIX}{os.urandom(8).hex()}",
+            "servers": ["chunk_server_1", "chunk_server_2"],
+            "files": [[filename, j * 4 * KB, 4 * KB] for j, filename in enumerate(group[i:i + files_per_pack])]
+        } for i in range(0, len(group), files_per_pack)]
+        master_node.apply_mutation({"op": "commit_packs", "packs": packs, "encryption": None, "tombstones": {},
+                                    "upload_time": datetime.now().isoformat(), "time": time.time()})
+
+
+def measure_memory(args):
+    names = [f"bench/app{i // 100:05d}/file-{i:07d}.conf" for i in range(args.memory_files)]
+    results = {}
+    for mode, record in [("per_file", record_per_file),
+                         ("packed", lambda names: record_packed(names, FILES_PER_PACK))]:
+        master_node.metadata = {"files": {}, "chunks": {}, "directories": {}, "uploads": {}}
+        master_node.namespace = Namespace()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        with master_node.metadata_lock:
+            record(names)
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        results[mode] = {
+            "files": len(names),
+            "metadata_entries": {key: len(value) for key, value in master_node.metadata.items()},
+            "master_bytes_per_file": round((after - before) / len(names), 1),
+            "chunks_json_bytes_per_file": round(len(json.dumps(master_node.metadata, indent=2)) / len(names), 1),
+        }
+        print(f"[BENCH] memory {mode} {json.dumps(results[mode])}", file=sys.stderr)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=5000)
+    parser.add_argument("--min-kb", type=int, default=1)
+    parser.add_argument("--max-kb", type=int, default=8)
+    parser.add_argument("--threads", type=int, default=4, help="concurrent uploads and reads")
+    parser.add_argument("--batch", type=int, default=1000, help="files per upload_small_files call")
+    parser.add_argument("--memory-files", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    results = {"config": vars(args)}
+    results["cluster"] = measure_cluster(args, rng)
+    results["master_memory"] = measure_memory(args)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Peak memory and throughput of uploads through the client service.
+
+Starts a local cluster with the client service and uploads files of each size
+to /upload_stream, the body generated on the fly so the benchmark itself holds
+no file. The client service is restarted before every upload so its peak RSS
+(VmHWM) belongs to that upload alone. Sizes listed in --legacy-mb also go
+through the JSON /upload endpoint for comparison; keep them small, that path
+holds several copies of the file.
+
+    python3 benchmarks/bench_streaming_upload.py --sizes-mb 100 1024 10240
+"""
+import argparse
+import base64
+import http.client
+import json
+import os
+import shutil
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from cluster import LocalCluster, http_json  # noqa: E402
+
+MB = 1024 * 1024
+
+
+class GeneratedBody:
+    """File-like body of `size` bytes cycling through a random block"""
+
+    def __init__(self, size, block_size=4 * MB):
+        self.size = size
+        self.sent = 0
+        self.block = os.urandom(block_size)
+
+    def read(self, n=-1):
+        remaining = self.size - self.sent
+        if n < 0 or n > remaining:
+            n = remaining
+        pieces = []
+        while n > 0:
+            start = self.sent % len(self.block)
+            piece = self.block[start:start + n]
+            pieces.append(piece)
+            self.sent += len(piece)
+            n -= len(piece)
+        return b"".join(pieces)
+
+
+def peak_rss_mb(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return round(int(line.split()[1]) / 1024, 1)
+    return None
+
+
+def upload_streaming(cluster, filename, size, encrypt):
+    conn = http.client.HTTPConnection("127.0.0.1", cluster.client_port, timeout=600, blocksize=MB)
+    conn.request("POST", f"/upload_stream?filename={filename}&encrypt={int(encrypt)}", body=GeneratedBody(size),
+                 headers={"Content-Type": "application/octet-stream", "Content-Length": str(size)})
+    response = conn.getresponse()
+    result = json.loads(response.read().decode())
+    conn.close()
+    if response.status != 200 or not result.get("success"):
+        raise RuntimeError(f"Upload of {filename} failed: {result}")
+    return result
+
+
+def upload_legacy(cluster, filename, size, encrypt):
+    body = GeneratedBody(size)
+    result = http_json(f"{cluster.client_url}/upload", {
+        "filename": filename,
+        "content_base64": base64.b64encode(body.read()).decode(),
+        "encrypt": encrypt,
+    }, timeout=600)
+    if not result.get("success"):
+        raise RuntimeError(f"Upload of {filename} failed: {result}")
+    return result
+
+
+def measure(cluster, endpoint, size_mb, encrypt):
+    cluster.client.stop()
+    cluster.start_client()
+    baseline = peak_rss_mb(cluster.client.proc.pid)
+
+    filename = f"bench/{endpoint}_{size_mb}mb_{'enc' if encrypt else 'plain'}.bin"
+    upload = upload_streaming if endpoint == "upload_stream" else upload_legacy
+    start = time.perf_counter()
+    upload(cluster, filename, size_mb * MB, encrypt)
+    elapsed = time.perf_counter() - start
+    peak = peak_rss_mb(cluster.client.proc.pid)
+
+    chunks = len(http_json(f"{cluster.master_url}/lookup?filename={filename}")["chunks"])
+    http_json(f"{cluster.master_url}/delete_file", {"filename": filename})
+    # Garbage collection takes minutes, free the disk for the next size now
+    for server_id in cluster.chunk_servers:
+        for category in os.scandir(os.path.join(cluster.base_dir, server_id)):
+            shutil.rmtree(category.path)
+            os.makedirs(category.path)
+    return {
+        "endpoint": endpoint,
+        "size_mb": size_mb,
+        "encrypt": encrypt,
+        "chunks": chunks,
+        "seconds": round(elapsed, 2),
+        "throughput_mb_s": round(size_mb / elapsed, 1),
+        "client_idle_rss_mb": baseline,
+        "client_peak_rss_mb": peak,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes-mb", type=int, nargs="+", default=[100, 1024, 10240])
+    parser.add_argument("--legacy-mb", type=int, nargs="*", default=[100])
+    parser.add_argument("--encrypt", choices=["off", "on", "both"], default="both")
+    parser.add_argument("--chunk-servers", type=int, default=3)
+    args = parser.parse_args()
+
+    modes = {"off": [False], "on": [True], "both": [False, True]}[args.encrypt]
+    results = {"config": vars(args), "runs": []}
+    with LocalCluster(args.chunk_servers, heartbeat_interval=1.0, heartbeat_timeout=30.0, client=True) as cluster:
+        plan = [("upload", size) for size in args.legacy_mb] + [("upload_stream", size) for size in args.sizes_mb]
+        for endpoint, size_mb in plan:
+            for encrypt in modes:
+                result = measure(cluster, endpoint, size_mb, encrypt)
+                print(f"[BENCH] {json.dumps(result)}", file=sys.stderr)
+                results["runs"].append(result)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
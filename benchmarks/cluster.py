@@ -0,0 +1,286 @@
+"""Local multi-process GFS cluster for benchmarks and manual testing.
+
+Launches a master, N chunk servers and optionally shadow masters and the client service as plain
+processes on ephemeral localhost ports with temporary data directories, no Docker required:
+
+    with LocalCluster(num_chunk_servers=3) as cluster:
+        print(cluster.master_url)
+
+Run directly to keep a cluster up until Ctrl+C:
+
+    python3 benchmarks/cluster.py --chunk-servers 5 --shadow-masters 2 --client
+"""
+import argparse
+import json
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+
+def free_port():
+    """Ask the kernel for an unused localhost port"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def http_json(url, payload=None, timeout=10):
+    """GET (or POST when payload is given) a JSON endpoint"""
+    data = json.dumps(payload).encode() if payload is not None else None
+    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=timeout) as response:
+        return json.loads(response.read().decode())
+
+
+class ManagedProcess:
+    """A service process with its own environment and log file"""
+
+    def __init__(self, name, script, env, log_dir):
+        self.name = name
+        self.script = script
+        self.env = env
+        self.log_path = os.path.join(log_dir, f"{name}.log")
+        self.proc = None
+
+    def start(self):
+        log = open(self.log_path, "ab")
+        self.proc = subprocess.Popen(
+            [sys.executable, "-u", os.path.join(BACKEND_DIR, self.script)],
+            env=self.env, stdout=log, stderr=subprocess.STDOUT, cwd=BACKEND_DIR,
+        )
+        log.close()
+
+    def alive(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def stop(self, sig=signal.SIGTERM, timeout=5):
+        if not self.alive():
+            return
+        self.proc.send_signal(sig)
+        try:
+            self.proc.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            self.proc.wait()
+
+    def kill(self):
+        self.stop(signal.SIGKILL)
+
+
+class LocalCluster:
+    """Master plus N chunk servers, shadow masters and a client service running as local processes"""
+
+    def __init__(self, num_chunk_servers=3, heartbeat_interval=1.0, heartbeat_timeout=3.0,
+                 base_dir=None, keep_data=False, extra_env=None, num_shadow_masters=0, client=False):
+        self.num_chunk_servers = num_chunk_servers
+        self.num_shadow_masters = num_shadow_masters
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.base_dir = base_dir
+        self.keep_data = keep_data
+        self.extra_env = dict(extra_env or {})
+        self.master = None
+        self.master_port = None
+        self.chunk_servers = {}  # server_id -> ManagedProcess
+        self.chunk_server_ports = {}
+        self.shadow_masters = {}  # shadow_id -> ManagedProcess
+        self.shadow_master_ports = {}
+        self.with_client = client
+        self.client = None
+        self.client_port = None
+        self._owns_base_dir = base_dir is None
+
+    @property
+    def master_url(self):
+        return f"http://127.0.0.1:{self.master_port}"
+
+    def chunk_server_url(self, server_id):
+        return f"http://127.0.0.1:{self.chunk_server_ports[server_id]}"
+
+    def shadow_master_url(self, shadow_id):
+        return f"http://127.0.0.1:{self.shadow_master_ports[shadow_id]}"
+
+    @property
+    def client_url(self):
+        return f"http://127.0.0.1:{self.client_port}"
+
+    @property
+    def shadow_urls(self):
+        return [self.shadow_master_url(shadow_id) for shadow_id in self.shadow_masters]
+
+    def _env(self, **overrides):
+        env = dict(os.environ)
+        env.update(self.extra_env)
+        env["PYTHONUNBUFFERED"] = "1"
+        env.update({key: str(value) for key, value in overrides.items()})
+        return env
+
+    def start(self, timeout=30):
+        if self.base_dir is None:
+            self.base_dir = tempfile.mkdtemp(prefix="gfs_cluster_")
+        os.makedirs(os.path.join(self.base_dir, "logs"), exist_ok=True)
+
+        self.master_port = free_port()
+        self.master = ManagedProcess("master", "master_node.py", self._env(
+            DATA_DIR=os.path.join(self.base_dir, "master"),
+            MASTER_PORT=self.master_port,
+            HEARTBEAT_INTERVAL=self.heartbeat_interval,
+            HEARTBEAT_TIMEOUT=self.heartbeat_timeout,
+            HEARTBEAT_CHECK_INTERVAL=min(self.heartbeat_interval, 5),
+        ), os.path.join(self.base_dir, "logs"))
+        self.master.start()
+        self._wait_for(lambda: http_json(f"{self.master_url}/status", timeout=1), timeout, "master")
+
+        for _ in range(self.num_chunk_servers):
+            self.add_chunk_server(wait=False)
+        self.wait_for_servers(timeout)
+
+        for _ in range(self.num_shadow_masters):
+            self.add_shadow_master(timeout=timeout)
+        if self.with_client:
+            self.start_client(timeout)
+        return self
+
+    def start_client(self, timeout=30):
+        """Launch the client service (uploads through /upload and /upload_stream)"""
+        self.client_port = free_port()
+        self.client = ManagedProcess("client", "client_script.py", self._env(
+            MASTER_URL=self.master_url,
+            CLIENT_PORT=self.client_port,
+        ), os.path.join(self.base_dir, "logs"))
+        self.client.start()
+        self._wait_for(lambda: urllib.request.urlopen(f"{self.client_url}/metrics", timeout=1), timeout, "client")
+
+    def add_chunk_server(self, wait=True, timeout=30):
+        """Launch one more chunk server and return its id"""
+        server_id = f"chunk_server_{len(self.chunk_servers) + 1}"
+        port = free_port()
+        proc = ManagedProcess(server_id, "chunk_server.py", self._env(
+            SERVER_ID=server_id,
+            SERVER_PORT=port,
+            SERVER_HOST="127.0.0.1",
+            MASTER_URL=self.master_url,
+            DATA_DIR=os.path.join(self.base_dir, server_id),
+            HEARTBEAT_INTERVAL=self.heartbeat_interval,
+        ), os.path.join(self.base_dir, "logs"))
+        proc.start()
+        self.chunk_servers[server_id] = proc
+        self.chunk_server_ports[server_id] = port
+        if wait:
+            self.wait_for_servers(timeout)
+        return server_id
+
+    def add_shadow_master(self, wait=True, timeout=30):
+        """Launch a read-only shadow of the master and return its id"""
+        shadow_id = f"shadow_{len(self.shadow_masters) + 1}"
+        port = free_port()
+        proc = ManagedProcess(shadow_id, "shadow_master.py", self._env(
+            SHADOW_ID=shadow_id,
+            SHADOW_PORT=port,
+            PRIMARY_URL=self.master_url,
+            DATA_DIR=os.path.join(self.base_dir, shadow_id),
+        ), os.path.join(self.base_dir, "logs"))
+        proc.start()
+        self.shadow_masters[shadow_id] = proc
+        self.shadow_master_ports[shadow_id] = port
+        if wait:
+            # /status answers 503 until the shadow has caught up with the primary
+            url = self.shadow_master_url(shadow_id)
+            self._wait_for(lambda: http_json(f"{url}/status", timeout=1), timeout, shadow_id)
+        return shadow_id
+
+    def stop_shadow_master(self, shadow_id):
+        self.shadow_masters.pop(shadow_id).stop()
+        self.shadow_master_ports.pop(shadow_id)
+
+    def kill_chunk_server(self, server_id):
+        """SIGKILL a chunk server, simulating a crash"""
+        self.chunk_servers[server_id].kill()
+
+    def restart_chunk_server(self, server_id):
+        self.chunk_servers[server_id].stop()
+        self.chunk_servers[server_id].start()
+
+    def status(self):
+        return http_json(f"{self.master_url}/status")
+
+    def wait_for_servers(self, timeout=30):
+        """Block until every running chunk server is active on the master"""
+        expected = {sid for sid, proc in self.chunk_servers.items() if proc.alive()}
+
+        def all_active():
+            servers = self.status()["servers"]
+            return all(servers.get(sid, {}).get("status") == "active" for sid in expected)
+
+        self._wait_for(all_active, timeout, "chunk servers")
+
+    def _wait_for(self, condition, timeout, what):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            try:
+                if condition():
+                    return
+            except Exception:
+                pass
+            time.sleep(0.1)
+        raise RuntimeError(f"Timed out waiting for {what}, logs in {self.base_dir}/logs")
+
+    def stop(self):
+        if self.client:
+            self.client.stop()
+        for proc in self.shadow_masters.values():
+            proc.stop()
+        for proc in self.chunk_servers.values():
+            proc.stop()
+        if self.master:
+            self.master.stop()
+        if self._owns_base_dir and not self.keep_data and self.base_dir:
+            shutil.rmtree(self.base_dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local GFS cluster until interrupted")
+    parser.add_argument("--chunk-servers", type=int, default=3)
+    parser.add_argument("--heartbeat-interval", type=float, default=1.0)
+    parser.add_argument("--heartbeat-timeout", type=float, default=3.0)
+    parser.add_argument("--shadow-masters", type=int, default=0)
+    parser.add_argument("--client", action="store_true", help="also run the client service")
+    args = parser.parse_args()
+
+    cluster = LocalCluster(args.chunk_servers, args.heartbeat_interval, args.heartbeat_timeout, keep_data=True,
+                           num_shadow_masters=args.shadow_masters, client=args.client)
+    cluster.start()
+    print(f"Master: {cluster.master_url}")
+    for server_id in cluster.chunk_servers:
+        print(f"{server_id}: {cluster.chunk_server_url(server_id)}")
+    for shadow_id in cluster.shadow_masters:
+        print(f"{shadow_id}: {cluster.shadow_master_url(shadow_id)}")
+    if cluster.client:
+        print(f"Client: {cluster.client_url}")
+    print(f"Data and logs: {cluster.base_dir}")
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        cluster.stop()
+
+
+if __name__ == "__main__":
+    main()
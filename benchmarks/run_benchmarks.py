@@ -0,0 +1,291 @@
+"""End-to-end benchmark suite against a local multi-process cluster.
+
+Starts a LocalCluster, runs each benchmark in turn and writes one JSON
+document with the results so runs can be diffed for regressions:
+
+    python3 benchmarks/run_benchmarks.py --output bench_results.json
+    python3 benchmarks/run_benchmarks.py --only upload download --file-size-mb 16
+
+Benchmarks: upload, download, metadata, dashboard, recovery (recovery kills a
+chunk server, so it always runs last).
+"""
+import argparse
+import base64
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from urllib.parse import urlencode
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from cluster import LocalCluster, http_json  # noqa: E402
+
+BENCHMARKS = ["upload", "download", "metadata", "dashboard", "recovery"]
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def latency_summary(samples):
+    return {
+        "count": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p90_ms": round(percentile(samples, 90) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+    }
+
+
+def run_threads(num_threads, seconds, work):
+    """Call work() from num_threads threads for seconds, return per-call latencies and errors"""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def loop():
+        local, failed = [], 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                work()
+                local.append(time.perf_counter() - start)
+            except Exception:
+                failed += 1
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=loop) for _ in range(num_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0]
+
+
+class Driver:
+    """Minimal GFS client speaking the master and chunk server protocol directly"""
+
+    def __init__(self, master_url):
+        self.master_url = master_url
+
+    def _server_url(self, addresses, server_id):
+        info = addresses[server_id]
+        return f"http://{info['host']}:{info['port']}"
+
+    def upload(self, filename, content):
+        allocation = http_json(f"{self.master_url}/allocate_chunks",
+                               {"filename": filename, "filesize": len(content)})
+        chunk_size = allocation["chunk_size"]
+        addresses = allocation["server_addresses"]
+
+        for alloc in allocation["allocations"]:
+            start = alloc["index"] * chunk_size
+            payload = {
+                "chunk_id": alloc["chunk_id"],
+                "data": base64.b64encode(content[start:start + chunk_size]).decode(),
+                "is_binary": True,
+                "filename": filename,
+            }
+            for server_id in alloc["servers"]:
+                http_json(f"{self._server_url(addresses, server_id)}/upload", payload)
+            http_json(f"{self.master_url}/register_chunk", {
+                "filename": filename, "chunk_id": alloc["chunk_id"], "servers": alloc["servers"]})
+
+    def download(self, filename):
+        lookup = http_json(f"{self.master_url}/lookup?{urlencode({'filename': filename})}")
+        addresses = lookup["server_addresses"]
+        parts = []
+        for chunk in lookup["chunks"]:
+            last_error = None
+            for server_id in chunk["servers"]:
+                try:
+                    result = http_json(f"{self._server_url(addresses, server_id)}/download/{chunk['chunk_id']}")
+                    data = result["data"]
+                    parts.append(base64.b64decode(data) if result["is_binary"] else data.encode())
+                    break
+                except Exception as e:
+                    last_error = e
+            else:
+                raise RuntimeError(f"No replica served {chunk['chunk_id']}: {last_error}")
+        return b"".join(parts)
+
+
+def bench_upload(cluster, args, state):
+    driver = Driver(cluster.master_url)
+    size = int(args.file_size_mb * 1024 * 1024)
+    files = {f"bench_{i}.bin": os.urandom(size) for i in range(args.files)}
+
+    start = time.perf_counter()
+    for filename, content in files.items():
+        driver.upload(filename, content)
+    elapsed = time.perf_counter() - start
+
+    state["files"] = files
+    total = size * len(files)
+    return {
+        "files": len(files),
+        "bytes": total,
+        "seconds": round(elapsed, 3),
+        "mb_per_sec": round(total / elapsed / 1e6, 2),
+    }
+
+
+def bench_download(cluster, args, state):
+    driver = Driver(cluster.master_url)
+    files = state.get("files") or {}
+    if not files:
+        bench_upload(cluster, args, state)
+        files = state["files"]
+
+    start = time.perf_counter()
+    mismatches = sum(driver.download(name) != content for name, content in files.items())
+    elapsed = time.perf_counter() - start
+
+    total = sum(len(content) for content in files.values())
+    return {
+        "files": len(files),
+        "bytes": total,
+        "seconds": round(elapsed, 3),
+        "mb_per_sec": round(total / elapsed / 1e6, 2),
+        "mismatches": mismatches,
+    }
+
+
+def bench_metadata(cluster, args, state):
+    counter = iter(range(10 ** 9))
+    lock = threading.Lock()
+
+    def allocate_and_register():
+        with lock:
+            n = next(counter)
+        filename = f"meta_{n}.txt"
+        allocation = http_json(f"{cluster.master_url}/allocate_chunks", {"filename": filename, "filesize": 1})
+        alloc = allocation["allocations"][0]
+        http_json(f"{cluster.master_url}/register_chunk", {
+            "filename": filename, "chunk_id": alloc["chunk_id"], "servers": alloc["servers"]})
+
+    latencies, errors = run_threads(args.threads, args.seconds, allocate_and_register)
+    return {
+        "threads": args.threads,
+        "ops_per_sec": round(2 * len(latencies) / args.seconds, 1),
+        "errors": errors,
+        "allocate_register_latency": latency_summary(latencies),
+    }
+
+
+def bench_dashboard(cluster, args, state):
+    def refresh():
+        # What an admin dashboard does every REFRESH_INTERVAL
+        for path in ("/status", "/users"):
+            with urllib.request.urlopen(f"{cluster.master_url}{path}", timeout=10) as response:
+                response.read()
+
+    latencies, errors = run_threads(args.threads, args.seconds, refresh)
+    return {
+        "threads": args.threads,
+        "refreshes_per_sec": round(len(latencies) / args.seconds, 1),
+        "errors": errors,
+        "refresh_latency": latency_summary(latencies),
+    }
+
+
+def bench_recovery(cluster, args, state):
+    if "files" not in state:
+        bench_upload(cluster, args, state)
+
+    status = cluster.status()
+    holdings = {sid: 0 for sid in status["servers"]}
+    for chunk_info in status["chunks"].values():
+        for server_id in chunk_info["servers"]:
+            holdings[server_id] = holdings.get(server_id, 0) + 1
+    victim = max(holdings, key=holdings.get)
+
+    killed_at = time.time()
+    cluster.kill_chunk_server(victim)
+
+    detected_at = None
+    recovered_at = None
+    deadline = killed_at + args.recovery_timeout
+    while time.time() < deadline and recovered_at is None:
+        status = cluster.status()
+        if detected_at is None and status["servers"][victim]["status"] != "active":
+            detected_at = time.time()
+        if detected_at is not None and not any(victim in c["servers"] for c in status["chunks"].values()):
+            recovered_at = time.time()
+        time.sleep(0.05)
+
+    return {
+        "victim": victim,
+        "chunks_on_victim": holdings[victim],
+        "heartbeat_interval_s": cluster.heartbeat_interval,
+        "heartbeat_timeout_s": cluster.heartbeat_timeout,
+        "detection_seconds": round(detected_at - killed_at, 3) if detected_at else None,
+        "recovery_seconds": round(recovered_at - killed_at, 3) if recovered_at else None,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GFS end-to-end benchmark suite")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=BENCHMARKS)
+    parser.add_argument("--chunk-servers", type=int, default=3)
+    parser.add_argument("--files", type=int, default=8)
+    parser.add_argument("--file-size-mb", type=float, default=4)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--heartbeat-interval", type=float, default=1.0)
+    parser.add_argument("--heartbeat-timeout", type=float, default=3.0)
+    parser.add_argument("--recovery-timeout", type=float, default=60)
+    parser.add_argument("--output", help="also write the JSON results to this file")
+    args = parser.parse_args()
+
+    selected = [name for name in BENCHMARKS if name in args.only]
+    results = {}
+    state = {}
+
+    with LocalCluster(args.chunk_servers, args.heartbeat_interval, args.heartbeat_timeout) as cluster:
+        for name in selected:
+            start = time.perf_counter()
+            try:
+                results[name] = globals()[f"bench_{name}"](cluster, args, state)
+            except Exception as e:
+                results[name] = {"error": str(e)}
+            results[name]["wall_seconds"] = round(time.perf_counter() - start, 3)
+            print(f"[BENCH] {name}: {json.dumps(results[name])}", file=sys.stderr)
+
+    report = {
+        "suite": "gfs-e2e",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "results": results,
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Chunk store engines in a temporary directory.
+
+    python3 -m unittest discover tests
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, "..", "backend"))
+
+import chunk_store  # noqa: E402
+
+KB = 1024
+
+
+class ExtentCompactionTest(unittest.TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp(prefix="gfs-test-extents-")
+        self.store = chunk_store.ExtentStore(self.data_dir, extent_size=4 * KB)
+        self.store.load()
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def put(self, chunk_id, data):
+        with self.store.writer(chunk_id, "other", len(data)) as writer:
+            writer.write(data)
+            writer.commit()
+
+    def test_copies_are_synced_before_they_are_indexed(self):
+        chunks = {f"c{i}": bytes([i]) * KB for i in range(9)}  # extents 1 and 2 full, 3 active
+        for chunk_id, data in chunks.items():
+            self.put(chunk_id, data)
+        for chunk_id in ("c0", "c1", "c2"):
+            self.store.delete(chunk_id)
+            del chunks[chunk_id]
+        deadline = time.time() + 5
+        while not self.store._extents[1].sealed and time.time() < deadline:
+            time.sleep(0.01)
+
+        events = []
+        real_fsync, real_log, real_remove = chunk_store.fsync, self.store._log, self.store._remove_extent
+
+        def record_fsync(fd, sync=os.fdatasync):
+            events.append(("fsync", fd))
+            real_fsync(fd, sync)
+
+        def record_log(record):
+            events.append(("log", record.get("put")))
+            real_log(record)
+
+        def record_remove(extent):
+            events.append(("remove", extent.number))
+            real_remove(extent)
+
+        with mock.patch.object(chunk_store, "fsync", side_effect=record_fsync), \
+                mock.patch.object(self.store, "_log", side_effect=record_log), \
+                mock.patch.object(self.store, "_remove_extent", side_effect=record_remove):
+            self.assertEqual(self.store.compact(), KB)
+
+        destination = self.store._extents[self.store._index["c3"][1]]
+        self.assertNotEqual(destination.number, 1)
+        put = events.index(("log", "c3"))
+        remove = events.index(("remove", 1))
+        self.assertIn(("fsync", destination.fd), events[:put])
+        self.assertTrue(any(kind == "fsync" for kind, _ in events[put:remove]), events)
+        for chunk_id, data in chunks.items():
+            self.assertEqual(bytes(self.store.read(chunk_id)), data)
+
+
+if __name__ == "__main__":
+    unittest.main()
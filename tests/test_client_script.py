@@ -0,0 +1,98 @@
+"""Client connection pool against a local HTTP server.
+
+    python3 -m unittest discover tests
+"""
+import http.client
+import os
+import sys
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, "..", "backend"))
+
+import client_script  # noqa: E402
+
+
+class DroppingHandler(BaseHTTPRequestHandler):
+    """Answers /ok, reads /drop and closes the connection the first time without answering"""
+    protocol_version = "HTTP/1.1"
+    received = []
+    dropped = set()
+
+    def _handle(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        self.received.append((self.command, self.path))
+        if self.path == "/drop" and self.command not in self.dropped:
+            self.dropped.add(self.command)
+            self.close_connection = True
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    do_GET = do_POST = _handle
+
+    def log_message(self, *args):
+        pass
+
+
+class ConnectionPoolRetryTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), DroppingHandler)
+        cls.port = cls.server.server_address[1]
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        DroppingHandler.received.clear()
+        DroppingHandler.dropped.clear()
+        self.pool = client_script.ConnectionPool()
+        # Leave an idle keep-alive connection in the pool
+        self.assertEqual(self.pool.request("127.0.0.1", self.port, "GET", "/ok"), (200, b"ok"))
+
+    def test_post_lost_on_reused_connection_is_not_resent(self):
+        with self.assertRaises(http.client.RemoteDisconnected):
+            self.pool.request("127.0.0.1", self.port, "POST", "/drop", body=b"{}")
+        self.assertEqual(DroppingHandler.received.count(("POST", "/drop")), 1)
+
+    def test_get_lost_on_reused_connection_is_resent(self):
+        self.assertEqual(self.pool.request("127.0.0.1", self.port, "GET", "/drop"), (200, b"ok"))
+        self.assertEqual(DroppingHandler.received.count(("GET", "/drop")), 2)
+
+
+class DownloadDecryptionTest(unittest.TestCase):
+    """download_file decrypts by the mode the master recorded, not by its decrypt argument"""
+
+    cipher = client_script.generate_encryption_key()
+
+    def download(self, lookup, parts, decrypt=True):
+        lookup = dict(lookup, server_addresses={}, chunks=[{"chunk_id": f"c{i}"} for i in range(len(parts))])
+        with mock.patch.object(client_script, "lookup_file", return_value=lookup), \
+                mock.patch.object(client_script, "fetch_chunk", side_effect=parts):
+            return client_script.download_file("f", decrypt=decrypt, hedge=False)
+
+    def test_unencrypted_upload_is_returned_as_stored(self):
+        self.assertEqual(self.download({"encryption": None}, [b"plain ", b"text"]), b"plain text")
+
+    def test_chunk_encrypted_upload_is_decrypted_per_chunk(self):
+        parts = [self.cipher.encrypt(b"plain "), self.cipher.encrypt(b"text")]
+        self.assertEqual(self.download({"encryption": "chunk"}, parts, decrypt=False), b"plain text")
+
+    def test_unrecorded_mode_follows_decrypt(self):
+        encrypted = self.cipher.encrypt(b"plain text")
+        self.assertEqual(self.download({}, [encrypted[:10], encrypted[10:]]), b"plain text")
+        self.assertEqual(self.download({}, [b"plain text"], decrypt=False), b"plain text")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,241 @@
+"""Master node handlers, run in this process against a temporary DATA_DIR.
+
+    python3 -m unittest discover tests
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, "..", "backend"))
+os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="gfs-test-master-")
+
+import master_node  # noqa: E402
+from namespace import NamespaceError, normalize_path  # noqa: E402
+
+
+class MasterTestCase(unittest.TestCase):
+    """Serves MasterHandler on an ephemeral port with empty metadata"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = master_node.ThreadedHTTPServer(("127.0.0.1", 0), master_node.MasterHandler)
+        cls.url = f"http://127.0.0.1:{cls.server.server_address[1]}"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        with master_node.metadata_lock:
+            master_node.metadata.update(files={}, chunks={}, directories={}, uploads={})
+            master_node.namespace.rebuild([], [])
+            master_node.lost_replicas.clear()
+        with master_node.gc_lock:
+            master_node.gc_queue.clear()
+            master_node.orphan_candidates.clear()
+            master_node.incoming_moves.clear()
+            master_node.chunk_reports.clear()
+        with master_node.heartbeat_lock:
+            master_node.chunk_servers.clear()
+
+    def get(self, path, **query):
+        """(status, decoded body) of a GET"""
+        try:
+            with urlopen(f"{self.url}{path}?{urlencode(query)}", timeout=10) as response:
+                return response.status, json.loads(response.read())
+        except HTTPError as e:
+            return e.code, json.loads(e.read())
+
+    def post(self, path, payload):
+        """(status, decoded body) of a JSON POST"""
+        request = Request(self.url + path, data=json.dumps(payload).encode(),
+                          headers={"Content-Type": "application/json"})
+        try:
+            with urlopen(request, timeout=10) as response:
+                return response.status, json.loads(response.read())
+        except HTTPError as e:
+            return e.code, json.loads(e.read())
+
+    def heartbeat_deletions(self, server_id, **report):
+        """Chunks the master tells a server to delete in its heartbeat reply"""
+        status, body = self.post("/heartbeat", dict(report, server_id=server_id, host="127.0.0.1", port=1))
+        self.assertEqual(status, 200, body)
+        return body["delete_chunks"]
+
+
+class TombstonePrefixTest(MasterTestCase):
+    def test_normalize_rejects_reserved_directory(self):
+        for path in (".deleted", ".deleted/x", "/.deleted/0/x", "./.deleted//x"):
+            with self.assertRaises(NamespaceError):
+                normalize_path(path)
+        self.assertEqual(normalize_path("a/.deleted/x"), "a/.deleted/x")
+
+    def test_upload_under_tombstone_prefix_is_refused(self):
+        status, body = self.post("/register_chunk", {"filename": ".deleted/x", "chunk_id": "c1",
+                                                     "servers": ["chunk1"]})
+        self.assertEqual(status, 400, body)
+        status, body = self.post("/upload_session", {"filename": ".deleted/x", "filesize": 10})
+        self.assertEqual(status, 400, body)
+        status, body = self.post("/commit_packs", {"packs": [{
+            "chunk_id": "pack_1", "servers": ["chunk1"],
+            "files": [{"filename": ".deleted/x", "offset": 0, "length": 10}]}]})
+        self.assertEqual(status, 400, body)
+
+        self.assertNotIn(".deleted/x", master_node.metadata["files"])
+        self.assertEqual(master_node.collect_deleted_files(float("inf")), (0, 0))
+
+
+class MoveChunkGcTest(MasterTestCase):
+    """A chunk moved onto a server must survive deletions queued there for an older copy"""
+
+    def setUp(self):
+        super().setUp()
+        with master_node.metadata_lock:
+            master_node.metadata["chunks"]["c1"] = {"servers": ["A", "C"], "filename": "f"}
+        with master_node.gc_lock:
+            master_node.gc_queue["B"] = {"c1": None, "c2": None}
+            master_node.orphan_candidates["B"] = {"c1": 0}
+
+    def move(self, during_copy=lambda: None):
+        def request(address, path, payload=None):
+            if path == "/copy_chunk":
+                during_copy()
+            return {"sha256": "abc", "bytes": 10}
+
+        addresses = {"A": "http://a", "B": "http://b"}
+        with mock.patch.object(master_node, "server_addresses", return_value=addresses), \
+                mock.patch.object(master_node, "chunk_server_request", side_effect=request):
+            return master_node.move_chunk("c1", "A", "B", 0)
+
+    def test_heartbeat_after_move_keeps_chunk(self):
+        self.assertEqual(self.move(), 10)
+        self.assertEqual(master_node.metadata["chunks"]["c1"]["servers"], ["B", "C"])
+        self.assertNotIn("c1", master_node.orphan_candidates["B"])
+        self.assertEqual(self.heartbeat_deletions("B"), ["c2"])
+
+    def test_chunk_queued_during_copy_is_not_deleted(self):
+        handed_out = []
+
+        def requeue():
+            with master_node.gc_lock:
+                master_node.gc_queue["B"]["c1"] = None
+            handed_out.extend(master_node.next_gc_batch("B"))
+            with master_node.gc_lock:
+                master_node.gc_queue["B"]["c1"] = None
+
+        self.move(requeue)
+        self.assertEqual(handed_out, ["c2"])
+        self.assertEqual(self.heartbeat_deletions("B"), [])
+
+    def test_deletion_skips_chunks_placed_on_server(self):
+        with master_node.gc_lock:
+            master_node.gc_queue["C"] = {"c1": None}
+        self.assertEqual(self.heartbeat_deletions("C"), [])
+
+
+class FailureRecoveryTest(MasterTestCase):
+    """fail -> re-replicate -> recover -> GC must never delete a replica the metadata still needs"""
+
+    def setUp(self):
+        super().setUp()
+        for server_id in ("A", "B", "C"):
+            self.heartbeat_deletions(server_id)
+
+    def fail_and_re_replicate(self, server_id, request):
+        with master_node.heartbeat_lock:
+            master_node.chunk_servers[server_id]["status"] = "failed"
+        with mock.patch.object(master_node, "chunk_server_request", side_effect=request):
+            master_node.re_replicate_chunks(server_id)
+
+    def recover_and_collect(self, server_id, chunks):
+        """The server comes back and reports chunks across two GC passes an orphan grace period apart"""
+        now = master_node.time.time()
+        for offset in (0, master_node.ORPHAN_GRACE_PERIOD):
+            self.heartbeat_deletions(server_id, chunks=chunks)
+            master_node.run_gc_pass(now + offset)
+        return self.heartbeat_deletions(server_id)
+
+    def servers(self, chunk_id):
+        return master_node.metadata["chunks"][chunk_id]["servers"]
+
+    def test_failed_copy_lists_no_empty_server_and_recovered_replica_is_adopted(self):
+        master_node.metadata["chunks"]["c1"] = {"servers": ["A", "B"], "filename": "f"}
+
+        def unreachable(address, path, payload=None):
+            raise ConnectionError("copy failed")
+
+        self.fail_and_re_replicate("A", unreachable)
+        self.assertEqual(self.servers("c1"), ["B"])
+        self.assertEqual(self.recover_and_collect("A", ["c1"]), [])
+        self.assertEqual(self.servers("c1"), ["B", "A"])
+
+    def test_only_replica_is_adopted_back(self):
+        master_node.metadata["chunks"]["c1"] = {"servers": ["A"], "filename": "f"}
+        self.fail_and_re_replicate("A", lambda *args: self.fail("nothing to copy from"))
+        self.assertEqual(self.servers("c1"), [])
+        self.assertEqual(self.recover_and_collect("A", ["c1"]), [])
+        self.assertEqual(self.servers("c1"), ["A"])
+
+    def test_verified_copy_is_listed_and_replaced_replica_collected(self):
+        master_node.metadata["chunks"]["c1"] = {"servers": ["A", "B"], "filename": "f"}
+        requests = []
+
+        def request(address, path, payload=None):
+            requests.append(path.split("?")[0])
+            return {"sha256": "abc", "bytes": 10}
+
+        self.fail_and_re_replicate("A", request)
+        self.assertEqual(requests, ["/copy_chunk", "/checksum"])
+        self.assertEqual(self.servers("c1"), ["B", "C"])
+        self.assertEqual(self.recover_and_collect("A", ["c1"]), ["c1"])
+        self.assertEqual(self.servers("c1"), ["B", "C"])
+
+    def test_mismatched_copy_is_not_listed(self):
+        master_node.metadata["chunks"]["c1"] = {"servers": ["A", "B"], "filename": "f"}
+
+        def request(address, path, payload=None):
+            return {"sha256": "copy" if path == "/copy_chunk" else "original", "bytes": 10}
+
+        self.fail_and_re_replicate("A", request)
+        self.assertEqual(self.servers("c1"), ["B"])
+        self.assertEqual(self.heartbeat_deletions("C"), ["c1"])
+
+
+class EncryptionModeTest(MasterTestCase):
+    def test_lookup_reports_mode_recorded_at_commit(self):
+        for filename, encryption in (("plain.bin", None), ("secret.bin", "chunk")):
+            upload_id = master_node.begin_upload(filename, 0, encryption)
+            self.assertEqual(master_node.commit_upload(upload_id), (filename, []))
+            status, body = self.get("/lookup", filename=filename)
+            self.assertEqual(status, 200, body)
+            self.assertIn("encryption", body)
+            self.assertEqual(body["encryption"], encryption)
+
+    def test_lookup_of_packed_file_reports_mode(self):
+        master_node.commit_packs([{"chunk_id": "pack_1", "servers": ["chunk1"],
+                                   "files": [{"filename": "small.txt", "offset": 0, "length": 10}]}])
+        status, body = self.get("/lookup", filename="small.txt")
+        self.assertEqual(status, 200, body)
+        self.assertIn("encryption", body)
+        self.assertIsNone(body["encryption"])
+
+    def test_lookup_of_registered_file_has_no_mode(self):
+        status, body = self.post("/register_chunk", {"filename": "old.bin", "chunk_id": "c1", "servers": []})
+        self.assertEqual(status, 200, body)
+        status, body = self.get("/lookup", filename="old.bin")
+        self.assertEqual(status, 200, body)
+        self.assertNotIn("encryption", body)
+
+
+if __name__ == "__main__":
+    unittest.main()
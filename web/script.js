@@ -11,6 +11,18 @@ document.addEventListener('DOMContentLoaded', () => {
     initializeApp();
 });
 
+// Uploads and writes carry the session token, the master rate limits per user
+function authHeaders(headers) {
+    return currentToken ? { ...headers, 'Authorization': `Bearer ${currentToken}` } : headers;
+}
+
+// File names and chunk ids are user input, escape them before they go into innerHTML
+function escapeHtml(text) {
+    return String(text).replace(/[&<>"']/g, (c) => ({
+        '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'
+    })[c]);
+}
+
 function initializeApp() {
     const savedToken = sessionStorage.getItem('gfs_token');
     const savedUser = sessionStorage.getItem('gfs_user');
@@ -395,7 +407,7 @@ function updateServersList(servers, containerId, showActions) {
     let html = '';
     
     Object.entries(servers).forEach(([id, info]) => {
-        const statusClass = info.status === 'active' ? 'active' : 'failed';
+        const statusClass = ['active', 'suspected'].includes(info.status) ? info.status : 'failed';
         const lastHeartbeat = new Date(info.last_heartbeat * 1000).toLocaleTimeString();
         
         html += `
@@ -459,17 +471,51 @@ function updateFilesList(files, containerId) {
     Object.entries(files).forEach(([filename, info]) => {
         html += `
             <div class="file-card">
-                <div style="font-weight: 600; margin-bottom: 10px;">📄 ${filename}</div>
+                <div style="font-weight: 600; margin-bottom: 10px;">📄 ${escapeHtml(filename)}</div>
                 <div style="color: #666; font-size: 14px;">Uploaded: ${new Date(info.upload_time).toLocaleString()}</div>
                 <div style="color: #666; font-size: 14px; margin-bottom: 10px;">Chunks: ${info.chunks.length}</div>
                 <div style="display: flex; flex-wrap: wrap; gap: 10px;">
-                    ${info.chunks.map(chunk => `<span style="background: #667eea; color: white; padding: 5px 10px; border-radius: 4px; font-size: 12px;">${chunk}</span>`).join('')}
+                    ${info.chunks.map(chunk => `<span style="background: #667eea; color: white; padding: 5px 10px; border-radius: 4px; font-size: 12px;">${escapeHtml(chunk)}</span>`).join('')}
                 </div>
+                ${currentRole === 'admin' || currentRole === 'manager' ? `
+                    <div style="margin-top: 15px;">
+                        <button class="btn-danger delete-file-btn" data-filename="${escapeHtml(filename)}">Delete</button>
+                    </div>
+                ` : ''}
             </div>
         `;
     });
     
     container.innerHTML = html;
+    container.querySelectorAll('.delete-file-btn').forEach(button => {
+        button.addEventListener('click', () => deleteFile(button.dataset.filename));
+    });
+}
+
+async function deleteFile(filename) {
+    if (!confirm(`Are you sure you want to delete ${filename}?`)) {
+        return;
+    }
+    
+    try {
+        const response = await fetch(`${MASTER_URL}/delete_file`, {
+            method: 'POST',
+            headers: authHeaders({ 'Content-Type': 'application/json' }),
+            body: JSON.stringify({ filename: filename }),
+            mode: 'cors'
+        });
+        
+        const data = await response.json();
+        if (data.success) {
+            alert(`${filename} deleted. Storage will be reclaimed by garbage collection.`);
+            refreshDashboard();
+        } else {
+            alert(data.error || 'Failed to delete file');
+        }
+    } catch (error) {
+        console.error('Error deleting file:', error);
+        alert('Error deleting file');
+    }
 }
 
 // ============ File Upload ============
@@ -531,30 +577,26 @@ async function uploadFile(filename, content, isFile, encrypt) {
     progressContainer.innerHTML = `<div class="progress-label loading">Uploading ${filename}...</div>`;
     
     try {
-        let payload = {
-            filename: filename,
-            encrypt: encrypt
-        };
+        let response;
         
         if (isFile) {
-            const reader = new FileReader();
-            const fileContent = await new Promise((resolve, reject) => {
-                reader.onload = () => resolve(reader.result.split(',')[1]);
-                reader.onerror = reject;
-                reader.readAsDataURL(content);
+            // Send the file as is, the client service streams it to chunk servers chunk by chunk
+            const query = new URLSearchParams({ filename: filename, encrypt: encrypt ? '1' : '0' });
+            response = await fetch(`${CLIENT_URL}/upload_stream?${query}`, {
+                method: 'POST',
+                headers: authHeaders({ 'Content-Type': 'application/octet-stream' }),
+                body: content,
+                mode: 'cors'
             });
-            payload.content_base64 = fileContent;
         } else {
-            payload.content = content;
+            response = await fetch(`${CLIENT_URL}/upload`, {
+                method: 'POST',
+                headers: authHeaders({ 'Content-Type': 'application/json' }),
+                body: JSON.stringify({ filename: filename, content: content, encrypt: encrypt }),
+                mode: 'cors'
+            });
         }
         
-        const response = await fetch(`${CLIENT_URL}/upload`, {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify(payload),
-            mode: 'cors'
-        });
-        
         const data = await response.json();
         
         if (data.success) {